@@ -1,15 +1,27 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session, jsonify
 import os
 import uuid
+import numpy as np
 import pandas as pd
 import json
+import gzip
+import hmac
+import random
+import hashlib
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 
-from src.data_processing import load_and_explore_data, preprocess_playlist_data, analyze_genres
-from src.modeling import train_and_evaluate_models, predict_and_rank_artists, analyze_artist_overlap
-from src.visualization import get_graph_as_base64
-from src.utils import create_html_result
+from src.data_processing import preprocess_playlist_data, analyze_genres
+from src.modeling import reduce_training_data, train_and_evaluate_models, predict_and_rank_artists, analyze_artist_overlap, rerank_artists
+from src.scheduling import load_timetable, load_walking_times, optimize_festival_schedule
+from src.planner import plan_execution
+from src.genre_features import make_genre_featurizer
+from src.genre_similarity import load_lineup_genre_similarity
+from src.lineup_refresh import save_model_bundle, load_model_bundle
+from src.lineups import LineupRegistry, rank_across_lineups
+from src.janitor import Janitor, mark_used
+from src.profiling import PROFILE_MODES, profile_request, list_profiles
+from src.utils import create_html_result, get_training_summary, save_score_cache, load_score_cache, load_results, get_chart_data, write_results, thread_output
 
 # Load environment variables
 load_dotenv()
@@ -22,6 +34,14 @@ UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
 RESULT_FOLDER = os.path.join(os.getcwd(), 'results')
 ALLOWED_EXTENSIONS = {'csv'}
 
+# Recommendations API settings
+API_DEFAULT_LIMIT = 50
+API_MAX_LIMIT = 500
+GZIP_MIN_SIZE = 1024  # Don't compress responses smaller than this many bytes
+PIPELINE_LOG_FILENAME = 'pipeline.log'
+RESULT_FORMAT = 'compact-json'  # Stored results are read back whole, so skip the indentation
+CHART_TOP_N = 30
+
 # Create folders if they don't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULT_FOLDER, exist_ok=True)
@@ -29,17 +49,129 @@ os.makedirs(RESULT_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['RESULT_FOLDER'] = RESULT_FOLDER
 
-# Check if primavera.csv exists in data folder
-PRIMAVERA_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'primavera_25.csv')
-if not os.path.exists(PRIMAVERA_CSV):
-    print(f"Warning: Primavera CSV file not found at {PRIMAVERA_CSV}. Please place it there.")
+# Festival lineups: every lineup CSV in the data folder, selected per request by id
+# (file name without .csv). At most LINEUP_CACHE_SIZE lineups stay loaded at once.
+LINEUP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DEFAULT_LINEUP = os.environ.get('DEFAULT_LINEUP', 'primavera_25')
+LINEUP_CACHE_SIZE = int(os.environ.get('LINEUP_CACHE_SIZE', 4))
+lineup_registry = LineupRegistry(LINEUP_DIR, max_resident=LINEUP_CACHE_SIZE, default_id=DEFAULT_LINEUP)
+if not lineup_registry.ids():
+    print(f"Warning: No lineup CSV files found in {LINEUP_DIR}. Please place them there.")
+
+# Optional set times (<lineup>_timetable.csv) and stage walking times
+# (<lineup>_walking_times.csv) next to a lineup, for the schedule optimizer
+MAX_SCHEDULE_ALTERNATIVES = 10
+
+# Genre features: 'top' shared genres, 'hash' of all genres or 'svd' lineup projection
+GENRE_FEATURES = os.environ.get('GENRE_FEATURES', 'top')
+GENRE_FEATURE_WIDTH = None  # None = default width for the mode
+
+# Genre similarity ('cosine' or 'pmi', unset = exact genre matches only), built per lineup
+# and optionally from a larger reference playlist with more genre co-occurrences
+GENRE_SIMILARITY = os.environ.get('GENRE_SIMILARITY') or None
+GENRE_REFERENCE_CSV = os.environ.get('GENRE_REFERENCE_CSV') or None
+
+# Maximum number of artists to train on; larger libraries are sampled
+TRAINING_ROW_BUDGET = 2000
+
+# LEAN_MEMORY=1 computes features and trains in float32, lowering peak memory per request
+FEATURE_DTYPE = np.float32 if os.environ.get('LEAN_MEMORY', '0') == '1' else None
+
+# Session cleanup: delete uploads and results unused for JANITOR_TTL_HOURS, then the
+# least recently used ones while they exceed JANITOR_MAX_MB (unset = no size quota)
+JANITOR_TTL_HOURS = float(os.environ.get('JANITOR_TTL_HOURS', 24))
+JANITOR_MAX_MB = os.environ.get('JANITOR_MAX_MB')
+JANITOR_INTERVAL_MINUTES = float(os.environ.get('JANITOR_INTERVAL_MINUTES', 15))  # 0 = disabled
+
+# Profiling of /process: on demand by admins (X-Profile header or ?profile= with the
+# ADMIN_TOKEN in the X-Admin-Token header), or for a sampled share of requests
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_FOLDER_NAME = 'profiles'
+
+janitor = Janitor(
+    [UPLOAD_FOLDER, RESULT_FOLDER],
+    ttl_seconds=JANITOR_TTL_HOURS * 3600,
+    max_bytes=float(JANITOR_MAX_MB) * 1024 * 1024 if JANITOR_MAX_MB else None,
+    interval_seconds=JANITOR_INTERVAL_MINUTES * 60
+)
+
+
+def start_janitor():
+    """
+    Start the session janitor thread (unless JANITOR_INTERVAL_MINUTES is 0).
     
+    Importing the app does not start it, so scripts, tests and every server
+    worker don't each run their own; call this from the one process that
+    should clean up (app.run below, or a gunicorn when_ready hook).
+    """
+    if JANITOR_INTERVAL_MINUTES > 0:
+        janitor.start()
+    return janitor
+
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def get_result_folder(session_id):
+    """Return the result folder for a session ID, or None if the ID is not a valid UUID"""
+    try:
+        session_id = str(uuid.UUID(str(session_id)))
+    except ValueError:
+        return None
+    return os.path.join(app.config['RESULT_FOLDER'], session_id)
+
+
+def is_admin_request():
+    """
+    Whether the request carries the admin token (always False when no token is configured).
+    
+    Only the X-Admin-Token header is accepted, so the token never ends up in
+    access logs or browser history as part of a URL.
+    """
+    token = request.headers.get('X-Admin-Token')
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def requested_profile_mode():
+    """Profile mode requested by an admin for this request, or None"""
+    mode = request.headers.get('X-Profile') or request.args.get('profile')
+    if mode is None or not is_admin_request():
+        return None
+    # Any other value (e.g. 1) asks for the default low-overhead profiler
+    return mode if mode in PROFILE_MODES else 'sampling'
+
+
+def conditional_json_response(representation, build_payload):
+    """
+    Return a JSON response with a strong ETag, or a 304 if the client already has it.
+    
+    Args:
+        representation: String that uniquely identifies the response content
+        build_payload: Callable returning the payload, only called when a body is needed
+    """
+    use_gzip = 'gzip' in request.accept_encodings
+    
+    # Each encoding is a different representation, so it gets its own ETag
+    representation = f"{representation}:{'gzip' if use_gzip else 'identity'}"
+    etag = hashlib.sha256(representation.encode('utf-8')).hexdigest()[:32]
+    
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        body = json.dumps(build_payload(), separators=(',', ':')).encode('utf-8')
+        response = app.response_class(body, mimetype='application/json')
+        if use_gzip and len(body) >= GZIP_MIN_SIZE:
+            response.set_data(gzip.compress(body, compresslevel=6))
+            response.headers['Content-Encoding'] = 'gzip'
+    
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -47,9 +179,10 @@ def index():
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    # Check if primavera file exists
-    if not os.path.exists(PRIMAVERA_CSV):
-        flash('Primavera Sound lineup data not found. Please contact the administrator.', 'error')
+    # Check that the requested lineup (or the default one) exists
+    lineup_id = request.values.get('lineup') or lineup_registry.default_id
+    if lineup_id not in lineup_registry.ids():
+        flash('Festival lineup data not found. Please contact the administrator.', 'error')
         return redirect(url_for('index'))
     
     # Check if the post request has the file part
@@ -86,6 +219,13 @@ def upload_file():
         # Store file path in session
         session['my_playlist_path'] = file_path
         session['result_folder'] = result_folder
+        session['lineup_id'] = lineup_id
+        
+        # Carry an admin's profiling request over to /process
+        session.pop('profile_mode', None)
+        profile_mode = requested_profile_mode()
+        if profile_mode:
+            session['profile_mode'] = profile_mode
         
         return redirect(url_for('process'))
     
@@ -93,6 +233,129 @@ def upload_file():
     return redirect(url_for('index'))
 
 
+def run_recommendation_pipeline(my_playlist_path, result_folder, input_stats=None, lineup_id=None):
+    """
+    Run the recommendation pipeline for an uploaded playlist and save the results.
+    
+    Safe to call from several threads at once. Progress goes to pipeline.log
+    in the result folder rather than stdout, so concurrent runs do not interleave.
+    
+    Args:
+        my_playlist_path: Uploaded playlist CSV
+        result_folder: Folder to save the results to
+        input_stats: Dict filled in with input and intermediate sizes (for profiles)
+        lineup_id: Lineup to recommend artists from (None = default lineup)
+    
+    Returns:
+        Tuple of (JSON results path, HTML report path)
+    """
+    if input_stats is None:
+        input_stats = {}
+    
+    os.makedirs(result_folder, exist_ok=True)
+    with open(os.path.join(result_folder, PIPELINE_LOG_FILENAME), 'w') as log, thread_output(log):
+        return _run_pipeline_steps(my_playlist_path, result_folder, input_stats, lineup_id)
+
+
+def _run_pipeline_steps(my_playlist_path, result_folder, input_stats, lineup_id):
+    # The lineup's tracks, vocabulary and artist table are loaded once and shared between requests
+    lineup = lineup_registry.get(lineup_id)
+    primavera_playlist = lineup.playlist
+    
+    print(f"Loading personal playlist from: {my_playlist_path}")
+    my_playlist = pd.read_csv(my_playlist_path)
+    input_stats.update({
+        'lineup': lineup.lineup_id,
+        'playlist_bytes': os.path.getsize(my_playlist_path),
+        'playlist_tracks': len(my_playlist),
+        'lineup_tracks': len(primavera_playlist)
+    })
+    
+    # Artist and genre codes shared by all pipeline steps (a private copy of the lineup's)
+    vocabulary = lineup.vocabulary.copy()
+    
+    # Analyze genres, find shared ones and set up the genre features
+    genre_similarity = None
+    if GENRE_SIMILARITY:
+        genre_similarity = load_lineup_genre_similarity(
+            lineup.path, lineup_df=primavera_playlist, reference_path=GENRE_REFERENCE_CSV, measure=GENRE_SIMILARITY
+        )
+    top_shared_genres = analyze_genres(
+        my_playlist, primavera_playlist, vocabulary=vocabulary, genre_similarity=genre_similarity
+    )
+    genre_featurizer = make_genre_featurizer(
+        GENRE_FEATURES,
+        GENRE_FEATURE_WIDTH,
+        shared_genres=top_shared_genres,
+        lineup_path=lineup.path,
+        lineup_df=primavera_playlist,
+        vocabulary=vocabulary,
+        genre_similarity=genre_similarity
+    )
+    
+    # Process both datasets
+    train_data = preprocess_playlist_data(
+        my_playlist, 
+        is_training=True, 
+        vocabulary=vocabulary,
+        genre_featurizer=genre_featurizer,
+        feature_dtype=FEATURE_DTYPE
+    )
+    
+    test_data = lineup.artist_features(
+        genre_featurizer,
+        vocabulary=vocabulary,
+        min_artist_frequency=5,
+        feature_dtype=FEATURE_DTYPE
+    )
+    input_stats.update({
+        'training_artists': len(train_data),
+        'lineup_artists': len(test_data),
+        'features': train_data.shape[1] - 2
+    })
+    
+    # Cap the training set size, pick a training tier, then train and evaluate models
+    train_data, reduction = reduce_training_data(train_data, row_budget=TRAINING_ROW_BUDGET)
+    plan = plan_execution(train_data, reduction=reduction)
+    input_stats.update({'tier': plan['tier'], 'training_rows': len(train_data)})
+    model_results = train_and_evaluate_models(train_data, plan=plan, feature_dtype=FEATURE_DTYPE)
+    
+    # Predict and rank artists
+    ranked_artists, predicted_test_data = predict_and_rank_artists(test_data, model_results, feature_dtype=FEATURE_DTYPE)
+    
+    # Analyze artist overlap
+    ranked_artists = analyze_artist_overlap(
+        ranked_artists, my_playlist, primavera_playlist, vocabulary=vocabulary
+    )
+    
+    # Cache score vectors so the results can be re-ranked without rerunning the pipeline
+    save_score_cache(ranked_artists, output_dir=result_folder)
+    
+    # Keep the model so lineup updates can re-score this result without retraining
+    save_model_bundle(
+        result_folder,
+        model_results,
+        train_data.drop(['Artist', 'Track_Count'], axis=1).columns,
+        genre_featurizer,
+        my_playlist,
+        primavera_playlist,
+        feature_dtype=FEATURE_DTYPE
+    )
+    
+    # Save results to JSON for the results page, atomically so polling readers never see a partial file
+    json_result_path = write_results(
+        ranked_artists,
+        result_folder,
+        output_format=RESULT_FORMAT,
+        metadata={'lineup': lineup.lineup_id, 'training': get_training_summary(plan)}
+    )
+    
+    # Create HTML report
+    html_path = create_html_result(ranked_artists, output_path=os.path.join(result_folder, "recommendations.html"))
+    
+    return json_result_path, html_path
+
+
 @app.route('/process')
 def process():
     # Check if we have the necessary data in the session
@@ -103,57 +366,23 @@ def process():
     my_playlist_path = session['my_playlist_path']
     result_folder = session['result_folder']
     
+    # Profile on an admin's request, or for a random sample of requests
+    profile_mode = session.pop('profile_mode', None)
+    profile_mode = requested_profile_mode() or profile_mode
+    profile_trigger = 'admin'
+    if profile_mode is None and PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        profile_mode, profile_trigger = 'sampling', 'sampled'
+    input_stats = {'session_id': session.get('session_id'), 'trigger': profile_trigger}
+    lineup_id = session.get('lineup_id')
+    
     try:
-        # Run the recommendation pipeline
-        my_playlist, primavera_playlist = load_and_explore_data(
-            my_playlist_path=my_playlist_path,
-            primavera_playlist_path=PRIMAVERA_CSV
-        )
-
-        # Analyze genres and find shared ones
-        top_shared_genres = analyze_genres(my_playlist, primavera_playlist)
-
-        # Process both datasets
-        train_data = preprocess_playlist_data(
-            my_playlist, 
-            is_training=True, 
-            shared_genres=top_shared_genres
-        )
-
-        test_data = preprocess_playlist_data(
-            primavera_playlist, 
-            is_training=False, 
-            shared_genres=top_shared_genres,
-            min_artist_frequency=5
-        )
-
-        # Train and evaluate models
-        model_results = train_and_evaluate_models(train_data)
-
-        # Predict and rank artists
-        ranked_artists, predicted_test_data = predict_and_rank_artists(test_data, model_results)
-
-        # Analyze artist overlap
-        ranked_artists = analyze_artist_overlap(
-            ranked_artists, my_playlist, primavera_playlist
-        )
-        
-        # Generate chart
-        chart_data = get_graph_as_base64(ranked_artists, top_n=30)
-        
-        # Save results to JSON for the results page
-        json_result_path = os.path.join(result_folder, 'ranked_artists.json')
-        with open(json_result_path, 'w') as f:
-            json.dump({
-                'artists': ranked_artists.to_dict(orient="records"),
-                'timestamp': pd.Timestamp.now().isoformat()
-            }, f, indent=2)
+        with profile_request(profile_mode, os.path.join(result_folder, PROFILE_FOLDER_NAME), metadata=input_stats):
+            json_result_path, html_path = run_recommendation_pipeline(
+                my_playlist_path, result_folder, input_stats, lineup_id=lineup_id
+            )
+        print(f"Processed session {input_stats['session_id']} (log: {os.path.join(result_folder, PIPELINE_LOG_FILENAME)})")
         
-        # Create HTML report
-        html_path = create_html_result(ranked_artists, output_path=os.path.join(result_folder, "recommendations.html"))
-        
-        # Store chart data and results path in session
-        session['chart_data'] = chart_data
+        # Store results paths in session (the chart is rendered client-side from /api/sessions/<id>/chart)
         session['json_result_path'] = json_result_path
         session['html_result_path'] = html_path
         
@@ -167,28 +396,311 @@ def process():
 @app.route('/results')
 def results():
     # Check if we have the necessary data in the session
-    if 'chart_data' not in session or 'json_result_path' not in session:
+    if 'json_result_path' not in session or 'session_id' not in session:
         flash('Processing results not found. Please upload your file again.', 'error')
         return redirect(url_for('index'))
     
-    chart_data = session['chart_data']
     json_result_path = session['json_result_path']
     
-    # Load the results from JSON
-    with open(json_result_path, 'r') as f:
-        data = json.load(f)
+    # Load the results from JSON (the janitor may have deleted an unused session)
+    try:
+        data, _ = load_results(json_result_path)
+    except FileNotFoundError:
+        flash('Your results have expired. Please upload your file again.', 'error')
+        return redirect(url_for('index'))
+    mark_used(os.path.dirname(json_result_path))
     
     # Get top 50 artists
     top_artists = data['artists'][:50]
     
     return render_template(
         'results.html', 
-        chart_data=chart_data, 
+        chart_url=url_for('api_chart', session_id=session['session_id'], top_n=CHART_TOP_N), 
         artists=top_artists, 
         timestamp=data['timestamp']
     )
 
 
+@app.route('/api/rerank', methods=['GET', 'POST'])
+def api_rerank():
+    """Re-rank a session's cached scores with a caller-supplied overlap weight"""
+    params = request.get_json(silent=True) or request.values
+    
+    session_id = params.get('session_id') or session.get('session_id')
+    result_folder = get_result_folder(session_id) if session_id else None
+    if result_folder is None:
+        return jsonify({'error': 'A valid session_id is required'}), 400
+    
+    score_cache = load_score_cache(result_folder)
+    if score_cache is None:
+        return jsonify({'error': 'No cached results found for this session'}), 404
+    mark_used(result_folder)
+    
+    try:
+        overlap_weight = float(params.get('weight', 0.3))
+        top_k = int(params.get('top_k', 50))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'weight must be a number and top_k an integer'}), 400
+    
+    if not 0 <= overlap_weight <= 1:
+        return jsonify({'error': 'weight must be between 0 and 1'}), 400
+    if not 1 <= top_k <= API_MAX_LIMIT:
+        return jsonify({'error': f'top_k must be between 1 and {API_MAX_LIMIT}'}), 400
+    
+    exclude_known = str(params.get('exclude_known', '')).lower() in ('1', 'true', 'yes')
+    
+    ranked_artists = rerank_artists(
+        score_cache,
+        overlap_weight=overlap_weight,
+        top_k=top_k,
+        exclude_known=exclude_known
+    )
+    
+    return jsonify({
+        'overlap_weight': overlap_weight,
+        'exclude_known': exclude_known,
+        'artists': ranked_artists.to_dict(orient="records")
+    })
+
+
+@app.route('/api/sessions/<session_id>/recommendations')
+def api_recommendations(session_id):
+    """Paginated recommendations for a session, with ETag/If-None-Match support"""
+    result_folder = get_result_folder(session_id)
+    if result_folder is None:
+        return jsonify({'error': 'Invalid session ID'}), 400
+    
+    json_result_path = os.path.join(result_folder, 'ranked_artists.json')
+    if not os.path.exists(json_result_path):
+        return jsonify({'error': 'No results found for this session'}), 404
+    mark_used(result_folder)
+    
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', API_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'offset and limit must be integers'}), 400
+    
+    if offset < 0 or limit < 1:
+        return jsonify({'error': 'offset must be >= 0 and limit >= 1'}), 400
+    limit = min(limit, API_MAX_LIMIT)
+    
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+    
+    data, result_hash = load_results(json_result_path)
+    artists = data['artists']
+    
+    if fields and artists:
+        unknown_fields = [f for f in fields if f not in artists[0]]
+        if unknown_fields:
+            return jsonify({'error': f'Unknown fields: {", ".join(unknown_fields)}'}), 400
+    
+    def build_payload():
+        page = artists[offset:offset + limit]
+        if fields:
+            page = [{f: artist[f] for f in fields} for artist in page]
+        
+        return {
+            'session_id': session_id,
+            'timestamp': data['timestamp'],
+            'total': len(artists),
+            'offset': offset,
+            'limit': limit,
+            'next_offset': offset + limit if offset + limit < len(artists) else None,
+            'artists': page
+        }
+    
+    return conditional_json_response(
+        f"{result_hash}:{offset}:{limit}:{','.join(fields or [])}", build_payload
+    )
+
+
+@app.route('/api/sessions/<session_id>/chart')
+def api_chart(session_id):
+    """Compact top-N chart data for client-side rendering"""
+    result_folder = get_result_folder(session_id)
+    if result_folder is None:
+        return jsonify({'error': 'Invalid session ID'}), 400
+    
+    json_result_path = os.path.join(result_folder, 'ranked_artists.json')
+    if not os.path.exists(json_result_path):
+        return jsonify({'error': 'No results found for this session'}), 404
+    mark_used(result_folder)
+    
+    try:
+        top_n = int(request.args.get('top_n', CHART_TOP_N))
+    except ValueError:
+        return jsonify({'error': 'top_n must be an integer'}), 400
+    
+    if not 1 <= top_n <= API_MAX_LIMIT:
+        return jsonify({'error': f'top_n must be between 1 and {API_MAX_LIMIT}'}), 400
+    
+    data, result_hash = load_results(json_result_path)
+    
+    return conditional_json_response(
+        f"chart:{result_hash}:{top_n}",
+        lambda: {'top_n': top_n, 'lineup': data.get('lineup'), **get_chart_data(data['artists'], top_n)}
+    )
+
+
+@app.route('/api/sessions/<session_id>/schedule', methods=['GET', 'POST'])
+def api_schedule(session_id):
+    """Clash-free festival schedule for a session's recommendations"""
+    result_folder = get_result_folder(session_id)
+    if result_folder is None:
+        return jsonify({'error': 'Invalid session ID'}), 400
+    
+    json_result_path = os.path.join(result_folder, 'ranked_artists.json')
+    if not os.path.exists(json_result_path):
+        return jsonify({'error': 'No results found for this session'}), 404
+    mark_used(result_folder)
+    
+    try:
+        k = int(request.values.get('k', 1))
+        transfer_minutes = float(request.values.get('transfer_minutes', 0))
+    except ValueError:
+        return jsonify({'error': 'k must be an integer and transfer_minutes a number'}), 400
+    
+    if not 1 <= k <= MAX_SCHEDULE_ALTERNATIVES:
+        return jsonify({'error': f'k must be between 1 and {MAX_SCHEDULE_ALTERNATIVES}'}), 400
+    
+    data, _ = load_results(json_result_path)
+    
+    # Use uploaded set times if given, otherwise the published timetable of the session's lineup
+    lineup_id = data.get('lineup') or lineup_registry.default_id
+    timetable_source = request.files.get('timetable') or lineup_registry.companion_path(lineup_id, 'timetable')
+    if timetable_source is None:
+        return jsonify({'error': 'No timetable available. Upload one as "timetable".'}), 404
+    
+    walking_times_source = request.files.get('walking_times') or lineup_registry.companion_path(
+        lineup_id, 'walking_times'
+    )
+    
+    try:
+        timetable = load_timetable(timetable_source)
+        walking_times = load_walking_times(walking_times_source) if walking_times_source else None
+    except (ValueError, KeyError, pd.errors.ParserError) as e:
+        return jsonify({'error': f'Could not read timetable: {str(e)}'}), 400
+    
+    schedule = optimize_festival_schedule(
+        timetable,
+        pd.DataFrame(data['artists']),
+        walking_times=walking_times,
+        k=k,
+        default_transfer=transfer_minutes
+    )
+    
+    return jsonify({'k': k, 'schedule': schedule.to_dict(orient="records")})
+
+
+@app.route('/api/lineups')
+def api_lineups():
+    """Registered festival lineups and which of them are loaded"""
+    return jsonify({
+        'default': lineup_registry.default_id,
+        'lineups': lineup_registry.ids(),
+        'resident': lineup_registry.resident_ids(),
+        'max_resident': lineup_registry.max_resident
+    })
+
+
+@app.route('/api/sessions/<session_id>/lineups')
+def api_cross_lineup(session_id):
+    """A session's model scored against every registered lineup (or ?lineups=a,b) in one pass"""
+    result_folder = get_result_folder(session_id)
+    if result_folder is None:
+        return jsonify({'error': 'Invalid session ID'}), 400
+    
+    bundle = load_model_bundle(result_folder)
+    if bundle is None:
+        return jsonify({'error': 'No results found for this session'}), 404
+    mark_used(result_folder)
+    
+    try:
+        limit = min(max(int(request.args.get('limit', API_DEFAULT_LIMIT)), 1), API_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    
+    lineup_ids = request.args.get('lineups')
+    lineup_ids = [l.strip() for l in lineup_ids.split(',') if l.strip()] if lineup_ids else lineup_registry.ids()
+    unknown_lineups = [l for l in lineup_ids if l not in lineup_registry.ids()]
+    if unknown_lineups:
+        return jsonify({'error': f'Unknown lineups: {", ".join(unknown_lineups)}'}), 400
+    
+    ranked_artists = rank_across_lineups(bundle, lineup_registry, lineup_ids)
+    if request.args.get('exclude_known', '').lower() in ('1', 'true', 'yes'):
+        ranked_artists = ranked_artists[ranked_artists['In_My_Playlist'] == 0]
+    
+    return jsonify({
+        'session_id': session_id,
+        'lineups': lineup_ids,
+        'total': len(ranked_artists),
+        'artists': ranked_artists.head(limit).to_dict(orient="records")
+    })
+
+
+@app.route('/api/janitor')
+def api_janitor():
+    """Session cleanup metrics: sessions and bytes in use, deleted and reclaimed"""
+    if not is_admin_request():
+        return jsonify({'error': 'Admin token required'}), 403
+    
+    return jsonify({
+        'ttl_hours': JANITOR_TTL_HOURS,
+        'max_mb': float(JANITOR_MAX_MB) if JANITOR_MAX_MB else None,
+        'enabled': janitor.is_running,
+        **janitor.metrics
+    })
+
+
+@app.route('/admin/profiles')
+def admin_profiles():
+    """List saved /process profiles, newest first (optionally for one session_id)"""
+    if not is_admin_request():
+        return jsonify({'error': 'Admin token required'}), 403
+    
+    session_id = request.args.get('session_id')
+    limit = request.args.get('limit', default=100, type=int)
+    
+    if session_id is not None:
+        result_folder = get_result_folder(session_id)
+        if result_folder is None:
+            return jsonify({'error': 'Invalid session ID'}), 400
+        session_folders = [result_folder]
+    else:
+        with os.scandir(app.config['RESULT_FOLDER']) as entries:
+            session_folders = [entry.path for entry in entries if entry.is_dir()]
+    
+    profiles = []
+    for folder in session_folders:
+        for profile in list_profiles(os.path.join(folder, PROFILE_FOLDER_NAME)):
+            profile['url'] = url_for(
+                'admin_profile_download', session_id=os.path.basename(folder), filename=profile['file']
+            )
+            profiles.append(profile)
+    
+    profiles.sort(key=lambda p: p.get('started_at', 0), reverse=True)
+    return jsonify({'profiles': profiles[:limit]})
+
+
+@app.route('/admin/profiles/<session_id>/<filename>')
+def admin_profile_download(session_id, filename):
+    """Download a saved profile (.collapsed, .prof) or its metadata (.json)"""
+    if not is_admin_request():
+        return jsonify({'error': 'Admin token required'}), 403
+    
+    result_folder = get_result_folder(session_id)
+    if result_folder is None or secure_filename(filename) != filename:
+        return jsonify({'error': 'Invalid profile'}), 400
+    
+    profile_path = os.path.join(result_folder, PROFILE_FOLDER_NAME, filename)
+    if not os.path.isfile(profile_path):
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    return send_file(profile_path, as_attachment=True, download_name=f"{session_id}-{filename}")
+
+
 @app.route('/download')
 def download():
     if 'html_result_path' not in session:
@@ -196,7 +708,11 @@ def download():
         return redirect(url_for('index'))
     
     html_result_path = session['html_result_path']
-    return send_file(html_result_path, as_attachment=True, download_name='primavera_recommendations.html')
+    try:
+        return send_file(html_result_path, as_attachment=True, download_name='primavera_recommendations.html')
+    except FileNotFoundError:
+        flash('Your results have expired. Please upload your file again.', 'error')
+        return redirect(url_for('index'))
 
 
 @app.route('/about')
@@ -205,5 +721,6 @@ def about():
 
 
 if __name__ == '__main__':
+    start_janitor()
     port = int(os.environ.get("PORT", 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
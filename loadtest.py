@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import os
+import argparse
+import json
+import sys
+
+# Add the current directory to sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.loadtest import InProcessClient, HttpClient, make_playlists, run_load_test
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the upload -> process -> results flow of the web app')
+    parser.add_argument('--url', type=str,
+                        help='Base URL of a running server (default: drive the app in-process with the Flask test client)')
+    parser.add_argument('--flows', type=int, default=20, help='Number of upload -> process -> results flows')
+    parser.add_argument('--concurrency', type=int, default=4, help='Maximum number of flows in progress at once')
+    parser.add_argument('--arrival-rate', type=float, default=None,
+                        help='Flows started per second (Poisson arrivals); default starts all flows at once')
+    parser.add_argument('--tracks', type=int, default=200, help='Tracks per synthetic playlist')
+    parser.add_argument('--artists', type=int, default=None,
+                        help='Distinct synthetic artists per playlist (default: one per five tracks)')
+    parser.add_argument('--template', type=str,
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'primavera_25.csv'),
+                        help='Exportify CSV to sample synthetic tracks from')
+    parser.add_argument('--server-pid', type=int, action='append',
+                        help='PID of the server (e.g. the gunicorn master) to report worker peak RSS for')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for playlists and arrivals')
+    parser.add_argument('--output', type=str, help='Also write the JSON report to this file')
+    args = parser.parse_args()
+    
+    playlists = make_playlists(args.template, args.flows, args.tracks, n_artists=args.artists, seed=args.seed)
+    
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        from app import app
+        make_client = lambda: InProcessClient(app)
+    
+    report = run_load_test(
+        make_client,
+        playlists,
+        concurrency=args.concurrency,
+        arrival_rate=args.arrival_rate,
+        server_pids=args.server_pid,
+        seed=args.seed
+    )
+    report.update({
+        'target': args.url or 'in-process',
+        'tracks_per_playlist': args.tracks
+    })
+    
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report_json)
+    
+    # The pipeline logs to stdout, so the report goes last
+    print(report_json)
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,252 @@
 #!/usr/bin/env python3
 import os
 import argparse
+import json
 import sys
+import numpy as np
+import pandas as pd
 
 # Add the current directory to sys.path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from src.data_processing import load_and_explore_data, preprocess_playlist_data, analyze_genres
-from src.modeling import train_and_evaluate_models, predict_and_rank_artists, analyze_artist_overlap
+from src.modeling import reduce_training_data, find_stable_sample_size, train_and_evaluate_models, predict_and_rank_artists, analyze_artist_overlap, rerank_artists
 from src.visualization import plot_artist_distribution, plot_feature_importance
-from src.utils import save_results, create_html_result
+from src.scheduling import load_timetable, load_walking_times, optimize_festival_schedule
+from src.discovery import SpotifyClient, FixtureClient, TopTracksCache, get_all_artist_top_tracks, DEFAULT_CACHE_PATH
+from src.genre_features import DEFAULT_GENRE_WIDTHS, make_genre_featurizer
+from src.lineup_refresh import save_model_bundle, load_model_bundle, refresh_lineup
+from src.genre_similarity import SIMILARITY_MEASURES, DEFAULT_GENRE_NEIGHBOURS, load_lineup_genre_similarity
+from src.lineups import LineupRegistry, rank_across_lineups, DEFAULT_DATA_DIR
+from src.janitor import Janitor
+from src.vocabulary import load_lineup_vocabulary
+from src.planner import plan_execution, EXECUTION_TIERS, DEFAULT_TIME_BUDGET
+from src.utils import RESULT_FORMATS, check_result_format, save_results, create_html_result, get_training_summary, save_score_cache, load_score_cache
 
 def main():
     parser = argparse.ArgumentParser(description='Primavera Sound Festival Artist Recommendation')
     parser.add_argument('--my-playlist', type=str, help='Path to your personal playlist CSV file')
     parser.add_argument('--primavera-playlist', type=str, help='Path to Primavera lineup playlist CSV file')
+    parser.add_argument('--lineup', type=str,
+                        help='Id of a lineup in --lineup-dir (its file name without .csv), instead of --primavera-playlist')
+    parser.add_argument('--lineup-dir', type=str, default=DEFAULT_DATA_DIR, help='Folder holding the lineup CSV files')
+    parser.add_argument('--list-lineups', action='store_true', help='List the lineups in --lineup-dir')
+    parser.add_argument('--match-lineups', type=str, nargs='*', metavar='LINEUP_ID',
+                        help='Score the model cached in --output-dir against these lineups (default: all) in one pass')
     parser.add_argument('--output-dir', type=str, default='./results', help='Directory to save results')
     parser.add_argument('--min-artist-frequency', type=int, default=5, 
                         help='Minimum number of tracks an artist must have to be included (for Primavera data)')
-    parser.add_argument('--top-n', type=int, default=30, help='Number of top artists to chart')
+    parser.add_argument('--format', choices=list(RESULT_FORMATS), default='json',
+                        help='Results file format: indented or compact JSON, NDJSON (one artist per line) or Parquet')
+    parser.add_argument('--top-n', type=int, default=30, help='Number of top artists to chart (or list with --rerank)')
+    parser.add_argument('--overlap-weight', type=float, default=0.3,
+                        help='Share of the score that comes from artists already in your playlist (0-1)')
+    parser.add_argument('--rerank', action='store_true',
+                        help='Re-rank cached scores in --output-dir instead of rerunning the pipeline')
+    parser.add_argument('--exclude-known', action='store_true',
+                        help='With --rerank, leave out artists already in your playlist')
+    parser.add_argument('--timetable', type=str,
+                        help='Timetable CSV (Artist, Stage, Day, Start, End) to build a clash-free schedule')
+    parser.add_argument('--walking-times', type=str, help='Stage-to-stage walking time matrix CSV (minutes)')
+    parser.add_argument('--transfer-minutes', type=float, default=0,
+                        help='Walking time between stages missing from --walking-times')
+    parser.add_argument('--schedule-alternatives', type=int, default=1,
+                        help='Number of alternative schedules to compute per day')
+    parser.add_argument('--discovery-artists', type=int, default=0,
+                        help='Collect Spotify top tracks for this many top-ranked artists not in your playlist')
+    parser.add_argument('--spotify-fixture', type=str,
+                        help='Serve Spotify lookups from a recorded JSON fixture instead of the API')
+    parser.add_argument('--spotify-cache', type=str, default=DEFAULT_CACHE_PATH,
+                        help='On-disk cache of Spotify top tracks')
+    parser.add_argument('--tier', type=str, choices=list(EXECUTION_TIERS),
+                        help='Force a training tier instead of choosing one from the input size')
+    parser.add_argument('--time-budget', type=float, default=DEFAULT_TIME_BUDGET,
+                        help='Target model training time in seconds, used to pick the training tier')
+    parser.add_argument('--genre-features', choices=sorted(DEFAULT_GENRE_WIDTHS), default='top',
+                        help='Genre features: top shared genres, hashing of all genres, or a lineup SVD projection')
+    parser.add_argument('--genre-width', type=int, default=None,
+                        help='Number of genre feature columns (default: 20 for top, 64 for hash, 16 for svd)')
+    parser.add_argument('--genre-similarity', choices=SIMILARITY_MEASURES, default=None,
+                        help='Credit lineup genres similar to yours, by genre co-occurrence (cosine or normalized PMI)')
+    parser.add_argument('--genre-neighbours', type=int, default=DEFAULT_GENRE_NEIGHBOURS,
+                        help='Similar genres kept per genre for --genre-similarity')
+    parser.add_argument('--genre-reference', type=str,
+                        help='Larger playlist CSV adding genre co-occurrence evidence for --genre-similarity')
+    parser.add_argument('--row-budget', type=int, default=2000,
+                        help='Maximum number of artists to train on; larger libraries are sampled (0 = no limit)')
+    parser.add_argument('--lean-memory', action='store_true',
+                        help='Compute features and train models in float32 to lower peak memory use')
+    parser.add_argument('--progressive-sampling', action='store_true',
+                        help='Grow the training sample until the CV RMSE stabilises, up to --row-budget')
+    parser.add_argument('--update-lineup', type=str, metavar='NEW_LINEUP_CSV',
+                        help='Replace the lineup and re-score cached results in --output-dir and its subfolders')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes for --update-lineup (default: one per CPU)')
+    parser.add_argument('--clean-sessions', action='store_true',
+                        help='Delete old web app sessions from --session-dirs instead of running the pipeline')
+    parser.add_argument('--session-dirs', type=str, nargs='+', default=['uploads', 'results'],
+                        help='Folders holding per-session subfolders, for --clean-sessions')
+    parser.add_argument('--ttl-hours', type=float, default=24,
+                        help='With --clean-sessions, delete sessions unused for this many hours')
+    parser.add_argument('--max-disk-mb', type=float, default=None,
+                        help='With --clean-sessions, then delete least recently used sessions until they fit this size')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='With --clean-sessions, only report what would be deleted')
     args = parser.parse_args()
 
     print("===== Primavera Sound Artist Recommendation System =====")
 
+    lineup_registry = LineupRegistry(args.lineup_dir)
+
+    if args.list_lineups:
+        for lineup_id in lineup_registry.ids():
+            default = ' (default)' if lineup_id == lineup_registry.default_id else ''
+            print(f"{lineup_id}{default}: {lineup_registry.path(lineup_id)}")
+        return
+
+    if args.match_lineups is not None:
+        bundle = load_model_bundle(args.output_dir)
+        if bundle is None:
+            print(f"No cached model found in {args.output_dir}. Run the full pipeline first.")
+            sys.exit(1)
+        
+        ranked_artists = rank_across_lineups(bundle, lineup_registry, args.match_lineups or None)
+        if args.exclude_known:
+            ranked_artists = ranked_artists[ranked_artists['In_My_Playlist'] == 0]
+        
+        matches_path = os.path.join(args.output_dir, "lineup_matches.csv")
+        ranked_artists.assign(Lineups=ranked_artists['Lineups'].str.join(', ')).to_csv(matches_path, index=False)
+        print(f"\nTop {args.top_n} matches across {len(args.match_lineups or lineup_registry.ids())} lineups:")
+        print(ranked_artists.head(args.top_n).to_string(index=False))
+        print(f"\nAll matches saved to {matches_path}")
+        return
+
+    if args.rerank:
+        score_cache = load_score_cache(args.output_dir)
+        if score_cache is None:
+            print(f"No cached scores found in {args.output_dir}. Run the full pipeline first.")
+            sys.exit(1)
+        
+        ranked_artists = rerank_artists(
+            score_cache,
+            overlap_weight=args.overlap_weight,
+            top_k=args.top_n,
+            exclude_known=args.exclude_known
+        )
+        print(f"\nTop {len(ranked_artists)} artists with overlap weight of {args.overlap_weight:.2f}:")
+        print(ranked_artists.to_string(index=False))
+        return
+
+    if args.clean_sessions:
+        janitor = Janitor(
+            args.session_dirs,
+            ttl_seconds=args.ttl_hours * 3600,
+            max_bytes=args.max_disk_mb * 1024 * 1024 if args.max_disk_mb is not None else None
+        )
+        print(json.dumps(janitor.run_once(dry_run=args.dry_run), indent=2))
+        return
+
+    # Lineup CSV to recommend from: an explicit path, or a registered lineup by id
+    lineup_path = args.primavera_playlist or lineup_registry.path(args.lineup)
+
+    if args.update_lineup:
+        refresh_lineup(lineup_path, args.update_lineup, results_root=args.output_dir, max_workers=args.workers)
+        return
+
+    # Fail before the pipeline runs if the results cannot be written
+    check_result_format(args.format)
+
     # Step 1: Load and explore data
     my_playlist, primavera_playlist = load_and_explore_data(
         my_playlist_path=args.my_playlist,
-        primavera_playlist_path=args.primavera_playlist
+        primavera_playlist_path=lineup_path
     )
 
-    # Step 2: Analyze genres and find shared ones
-    top_shared_genres = analyze_genres(my_playlist, primavera_playlist)
+    # Artist and genre codes shared by all pipeline steps (persisted next to the lineup CSV)
+    vocabulary = load_lineup_vocabulary(lineup_path, primavera_playlist)
+
+    # Step 2: Analyze genres, find shared ones and set up the genre features
+    genre_width = args.genre_width or DEFAULT_GENRE_WIDTHS[args.genre_features]
+    genre_similarity = None
+    if args.genre_similarity:
+        genre_similarity = load_lineup_genre_similarity(
+            lineup_path,
+            lineup_df=primavera_playlist,
+            reference_path=args.genre_reference,
+            measure=args.genre_similarity,
+            top_k=args.genre_neighbours
+        )
+    # genre_width is the number of top shared genres only in 'top' mode; hash and svd
+    # features don't use them, so the analysis keeps its default width there
+    top_n = genre_width if args.genre_features == 'top' else DEFAULT_GENRE_WIDTHS['top']
+    top_shared_genres = analyze_genres(
+        my_playlist, primavera_playlist, vocabulary=vocabulary, top_n=top_n, genre_similarity=genre_similarity
+    )
+    genre_featurizer = make_genre_featurizer(
+        args.genre_features,
+        genre_width,
+        shared_genres=top_shared_genres,
+        lineup_path=lineup_path,
+        lineup_df=primavera_playlist,
+        vocabulary=vocabulary,
+        genre_similarity=genre_similarity
+    )
 
     # Step 3: Process both datasets
+    feature_dtype = np.float32 if args.lean_memory else None
     train_data = preprocess_playlist_data(
         my_playlist, 
         is_training=True, 
-        shared_genres=top_shared_genres
+        vocabulary=vocabulary,
+        genre_featurizer=genre_featurizer,
+        feature_dtype=feature_dtype
     )
 
     test_data = preprocess_playlist_data(
         primavera_playlist, 
         is_training=False, 
-        shared_genres=top_shared_genres,
-        min_artist_frequency=args.min_artist_frequency
+        min_artist_frequency=args.min_artist_frequency,
+        vocabulary=vocabulary,
+        genre_featurizer=genre_featurizer,
+        feature_dtype=feature_dtype
     )
 
-    # Step 4: Train and evaluate models
-    model_results = train_and_evaluate_models(train_data)
+    # Step 4: Cap the training set size, pick a training tier, then train and evaluate models
+    row_budget = args.row_budget
+    if args.progressive_sampling and row_budget and len(train_data) > row_budget:
+        row_budget = find_stable_sample_size(train_data, row_budget=row_budget, feature_dtype=feature_dtype)
+    train_data, reduction = reduce_training_data(train_data, row_budget=row_budget)
+    
+    plan = plan_execution(train_data, time_budget=args.time_budget, tier=args.tier, reduction=reduction)
+    model_results = train_and_evaluate_models(train_data, plan=plan, feature_dtype=feature_dtype)
 
     # Step 5: Predict and rank artists
-    ranked_artists, predicted_test_data = predict_and_rank_artists(test_data, model_results)
+    ranked_artists, predicted_test_data = predict_and_rank_artists(test_data, model_results, feature_dtype=feature_dtype)
 
     # Step 6: Analyze artist overlap
     ranked_artists = analyze_artist_overlap(
-        ranked_artists, my_playlist, primavera_playlist
+        ranked_artists, my_playlist, primavera_playlist, overlap_weight=args.overlap_weight, vocabulary=vocabulary
     )
 
     # Step 7: Save results
-    csv_path, json_path = save_results(ranked_artists, output_dir=args.output_dir)
+    csv_path, results_path = save_results(
+        ranked_artists,
+        output_dir=args.output_dir,
+        metadata={'training': get_training_summary(plan)},
+        output_format=args.format
+    )
+    save_score_cache(ranked_artists, output_dir=args.output_dir)
+    save_model_bundle(
+        args.output_dir,
+        model_results,
+        train_data.drop(['Artist', 'Track_Count'], axis=1).columns,
+        genre_featurizer,
+        my_playlist,
+        primavera_playlist,
+        overlap_weight=args.overlap_weight,
+        min_artist_frequency=args.min_artist_frequency,
+        feature_dtype=feature_dtype
+    )
 
     # Step 8: Create visualizations
     chart_path = plot_artist_distribution(ranked_artists, top_n=args.top_n, output_dir=args.output_dir)
@@ -69,11 +257,46 @@ def main():
     # Step 9: Create HTML result
     html_path = create_html_result(ranked_artists, output_path=os.path.join(args.output_dir, "recommendations.html"))
 
+    # Step 10: Build a clash-free schedule if set times are available
+    schedule_path = None
+    if args.timetable:
+        timetable = load_timetable(args.timetable)
+        walking_times = load_walking_times(args.walking_times) if args.walking_times else None
+        schedule = optimize_festival_schedule(
+            timetable,
+            ranked_artists,
+            walking_times=walking_times,
+            k=args.schedule_alternatives,
+            default_transfer=args.transfer_minutes
+        )
+        schedule_path = os.path.join(args.output_dir, "schedule.csv")
+        schedule.to_csv(schedule_path, index=False)
+
+    # Step 11: Collect top tracks for a discovery playlist
+    discovery_path = None
+    if args.discovery_artists > 0:
+        client = FixtureClient(args.spotify_fixture) if args.spotify_fixture else SpotifyClient()
+        new_artists = ranked_artists
+        if 'In_My_Playlist' in ranked_artists.columns:
+            new_artists = ranked_artists[ranked_artists['In_My_Playlist'] == 0]
+        
+        discovery_tracks = get_all_artist_top_tracks(
+            client,
+            [new_artists['Artist'].head(args.discovery_artists).tolist()],
+            cache=TopTracksCache(args.spotify_cache)
+        )
+        discovery_path = os.path.join(args.output_dir, "discovery_tracks.csv")
+        pd.DataFrame(discovery_tracks, columns=['artist', 'track_name', 'spotify_link']).to_csv(discovery_path, index=False)
+
     print("\n===== Recommendation Process Complete =====")
     print(f"Results saved to: {args.output_dir}")
     print(f"Full recommendation list: {csv_path}")
     print(f"Visualization: {chart_path}")
     print(f"HTML Report: {html_path}")
+    if schedule_path:
+        print(f"Festival schedule: {schedule_path}")
+    if discovery_path:
+        print(f"Discovery tracks: {discovery_path}")
     print("\nEnjoy your personalized Primavera Sound schedule!")
 
 if __name__ == "__main__":
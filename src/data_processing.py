@@ -1,6 +1,10 @@
 import os
 import pandas as pd
 import numpy as np
+from scipy import sparse
+
+from src.vocabulary import Vocabulary
+from src.genre_features import TopGenreFeaturizer, artist_genre_matrix
 
 
 def load_and_explore_data(my_playlist_path=None, primavera_playlist_path=None):
@@ -53,293 +57,352 @@ def load_and_explore_data(my_playlist_path=None, primavera_playlist_path=None):
     return my_playlist, primavera_playlist
 
 
-def preprocess_playlist_data(playlist_df, is_training=True, shared_genres=None, return_genres=False, min_artist_frequency=None):
+def _group_reduce(group_ids, values, n_groups):
     """
-    Preprocess playlist data for artist-level aggregation.
-    - Explode artist collaborations into separate rows
-    - Extract and encode genres
-    - Aggregate numerical features by artist
-    - Filter out infrequent artists (for Primavera data)
+    Per-group min, max, mean and sample variance of a 2D value matrix.
+    
+    group_ids must cover every group in 0..n_groups-1 at least once.
+    """
+    order = np.argsort(group_ids, kind='stable')
+    sorted_groups = group_ids[order]
+    sorted_values = values[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    
+    # Counts in the value dtype, so float32 values are not promoted to float64
+    counts = np.bincount(group_ids, minlength=n_groups).astype(values.dtype)[:, None]
+    group_min = np.minimum.reduceat(sorted_values, starts, axis=0)
+    group_max = np.maximum.reduceat(sorted_values, starts, axis=0)
+    group_mean = np.add.reduceat(sorted_values, starts, axis=0) / counts
+    
+    # Two-pass sample variance (ddof=1), undefined for single-track artists
+    squared_dev = (sorted_values - group_mean[sorted_groups]) ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        group_var = np.add.reduceat(squared_dev, starts, axis=0) / (counts - 1)
+    group_var[np.broadcast_to(counts == 1, group_var.shape)] = np.nan
+    
+    return group_min, group_max, group_mean, group_var
+
+
+def _group_mode(group_ids, values, n_groups):
+    """Most frequent integer value per group (the smallest one on ties)"""
+    offset = values.min()
+    width = values.max() - offset + 1
+    table = np.bincount(group_ids * width + (values - offset), minlength=n_groups * width)
+    return table.reshape(n_groups, width).argmax(axis=1) + offset
+
+
+def _genre_counts(genre_row_ids, genre_codes, artists_per_row, vocabulary):
+    """
+    Count genres the way they appear after exploding artists: a track's genres
+    count once for every artist on the track.
+    """
+    weights = artists_per_row[genre_row_ids]
+    counts = np.bincount(genre_codes, weights=weights, minlength=len(vocabulary.genres))
+    present = np.flatnonzero(counts > 0)
+    
+    # Most frequent first, ties in order of first appearance
+    present = present[np.argsort(-counts[present], kind='stable')]
+    return pd.Series(
+        counts[present].astype(int), index=vocabulary.genres.decode(present), name='count'
+    )
+
+
+def compile_artist_table(playlist_df, vocabulary, min_artist_frequency=None, feature_dtype=None, count_genres=False):
+    """
+    Aggregate a playlist's tracks by artist.
+    
+    This is the part of preprocessing that does not depend on the genre
+    features, so a lineup's table can be compiled once and featurized for
+    every request with artist_feature_frame.
     
     Args:
-        playlist_df: DataFrame containing playlist data
-        is_training: Whether this is training data (True) or test data (False)
-        shared_genres: List of shared genres to use (for test data)
-        return_genres: Whether to return genre frequency info (True for initial training)
+        playlist_df: DataFrame containing playlist data (not modified)
+        vocabulary: Vocabulary the artist and genre codes come from
         min_artist_frequency: Minimum frequency for artists to be included (None = no filtering)
+        feature_dtype: Float dtype of the track values and aggregated features (None = float64)
+        count_genres: Also count genre frequencies (as they appear after exploding artists)
+    
+    Returns:
+        Dict with the 'artists' names in output order, their 'numeric' aggregates and
+        'categorical' modes (column name -> values), the 'artist_genres' matrix over
+        the vocabulary's genre codes, 'track_count' per artist and, with
+        count_genres, 'genre_counts'
     """
-    print(f"\n----- Preprocessing {'training' if is_training else 'test'} data -----")
-    
-    # Make a copy to avoid modifying the original DataFrame
-    df = playlist_df.copy()
+    value_dtype = feature_dtype or np.float64
+    n_rows = len(playlist_df)
     
-    # Check for needed columns and handle missing ones
+    # Check for needed columns and handle missing ones. Only these columns are read,
+    # and the input DataFrame is neither copied nor modified.
     required_columns = [
         'Artist Name(s)', 'Genres', 'Popularity', 'Danceability', 'Energy', 
         'Key', 'Loudness', 'Mode', 'Speechiness', 'Acousticness', 
         'Instrumentalness', 'Liveness', 'Valence', 'Tempo', 'Time Signature'
     ]
     
+    columns = {}
     for col in required_columns:
-        if col not in df.columns:
+        if col in playlist_df.columns:
+            columns[col] = playlist_df[col]
+        else:
             print(f"Warning: Column '{col}' not found. Adding dummy column.")
             if col in ['Key', 'Mode', 'Time Signature']:
-                df[col] = 0  # Default for categorical
+                columns[col] = pd.Series(0, index=playlist_df.index)  # Default for categorical
             else:
-                df[col] = np.nan  # Default for numerical
+                columns[col] = pd.Series(np.nan, index=playlist_df.index)  # Default for numerical
     
-    # Handle missing values in numeric columns
+    # Handle missing values in numeric columns, collecting them into one track x feature matrix
     numeric_cols = [
         'Popularity', 'Danceability', 'Energy', 'Loudness', 
         'Speechiness', 'Acousticness', 'Instrumentalness', 
         'Liveness', 'Valence', 'Tempo'
     ]
     
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-        if df[col].isna().any():
-            median_val = df[col].median()
-            print(f"Filling {df[col].isna().sum()} missing values in '{col}' with median: {median_val:.2f}")
-            df[col].fillna(median_val, inplace=True)
+    track_values = np.empty((n_rows, len(numeric_cols)), dtype=value_dtype)
+    for i, col in enumerate(numeric_cols):
+        values = pd.to_numeric(columns[col], errors='coerce')
+        if values.isna().any():
+            median_val = values.median()
+            print(f"Filling {values.isna().sum()} missing values in '{col}' with median: {median_val:.2f}")
+            values = values.fillna(median_val)
+        track_values[:, i] = values.to_numpy()
     
     # Convert categorical columns to integers to avoid type issues
-    for col in ['Key', 'Mode', 'Time Signature']:
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+    categorical_values = {
+        col: pd.to_numeric(columns[col], errors='coerce').fillna(0).astype(int).to_numpy()
+        for col in ['Key', 'Mode', 'Time Signature']
+    }
     
-    # Explode artists to create one row per artist
+    # Explode artists into (track row, artist code) pairs
     print("Exploding multiple artists in collaborations...")
-    df['Artist Name(s)'] = df['Artist Name(s)'].astype(str)
-    
-    # Handle different separators for artist names (comma or comma+space)
-    artist_lists = []
-    for artists_str in df['Artist Name(s)']:
-        if pd.isna(artists_str) or artists_str == '' or artists_str.lower() == 'nan':
-            artist_lists.append([])
-        else:
-            if ', ' in artists_str:
-                artist_lists.append([a.strip() for a in artists_str.split(', ') if a.strip()])
-            else:
-                artist_lists.append([a.strip() for a in artists_str.split(',') if a.strip()])
-    
-    df['Artist_List'] = artist_lists
-    
-    # Explode the dataframe on the artist list
-    exploded_artists = df.explode('Artist_List')
-    
-    # Rename and clean up
-    exploded_artists.rename(columns={'Artist_List': 'Artist'}, inplace=True)
-    
-    # Handle empty or NaN artist names
-    exploded_artists = exploded_artists[exploded_artists['Artist'].notna() & (exploded_artists['Artist'] != '')]
+    row_ids, artist_codes = vocabulary.artists.encode_lists(columns['Artist Name(s)'])
     
     # Filter out infrequent artists if min_artist_frequency is specified (for Primavera data)
     if min_artist_frequency is not None and min_artist_frequency > 0:
-        artist_counts = exploded_artists['Artist'].value_counts()
-        frequent_artists = artist_counts[artist_counts >= min_artist_frequency].index
-        
-        original_count = exploded_artists['Artist'].nunique()
-        exploded_artists = exploded_artists[exploded_artists['Artist'].isin(frequent_artists)]
+        artist_counts = np.bincount(artist_codes, minlength=len(vocabulary.artists))
+        keep = artist_counts[artist_codes] >= min_artist_frequency
         
-        new_count = exploded_artists['Artist'].nunique()
+        original_count = np.count_nonzero(artist_counts)
+        new_count = np.count_nonzero(artist_counts >= min_artist_frequency)
         print(f"Filtered out {original_count - new_count} infrequent artists")
         print(f"Keeping {new_count} main artists with at least {min_artist_frequency} tracks")
         
         # If we filtered out all artists, that's a problem
-        if len(exploded_artists) == 0:
+        if not keep.any():
             print("WARNING: All artists were filtered out. Reducing min_artist_frequency.")
-            # Try with a lower threshold
-            min_artist_frequency = 1
-            exploded_artists = df.explode('Artist_List')
-            exploded_artists.rename(columns={'Artist_List': 'Artist'}, inplace=True)
-            exploded_artists = exploded_artists[exploded_artists['Artist'].notna() & (exploded_artists['Artist'] != '')]
+        else:
+            row_ids, artist_codes = row_ids[keep], artist_codes[keep]
     
-    # Process genres - improved handling for different formats
+    # Process genres into (track row, genre code) pairs
     print("Processing genres...")
+    genre_row_ids, genre_codes = vocabulary.genres.encode_lists(columns['Genres'])
     
-    # Check if Genres column exists, create it if it doesn't
-    if 'Genres' not in exploded_artists.columns:
-        print("Warning: 'Genres' column not found. Creating empty column.")
-        exploded_artists['Genres'] = ''
-    
-    # Ensure Genres column is string type
-    exploded_artists['Genres'] = exploded_artists['Genres'].astype(str)
-    
-    # Handle different genre separators (comma or comma+space)
-    # Some may use ',', others may use ', '
-    genre_lists = []
-    for genres_str in exploded_artists['Genres']:
-        # Handle NaN, empty strings, and 'nan' string
-        if pd.isna(genres_str) or genres_str == '' or genres_str.lower() == 'nan':
-            genre_lists.append([])
-        else:
-            # Try splitting by comma and space, if that doesn't work, try just comma
-            if ', ' in genres_str:
-                genre_lists.append([g.strip() for g in genres_str.split(', ') if g.strip()])
-            else:
-                genre_lists.append([g.strip() for g in genres_str.split(',') if g.strip()])
+    # Only tracks that still have an artist contribute genres
+    artists_per_row = np.bincount(row_ids, minlength=n_rows)
+    in_use = artists_per_row[genre_row_ids] > 0
+    genre_row_ids, genre_codes = genre_row_ids[in_use], genre_codes[in_use]
     
-    exploded_artists['Genre_List'] = genre_lists
+    genre_counts = None
+    if count_genres:
+        genre_counts = _genre_counts(genre_row_ids, genre_codes, artists_per_row, vocabulary)
     
-    # Calculate genre frequencies for training data
-    if is_training and return_genres:
-        # Flatten all genre lists
-        all_genres_flat = [genre for sublist in genre_lists for genre in sublist if genre]
-        
-        # Count genre frequencies
-        genre_counts = pd.Series(all_genres_flat).value_counts()
-        
-        print(f"Found {len(genre_counts)} unique genres in training data")
-        print(f"Top 5 genres: {genre_counts.head(5).to_dict()}")
+    # Artists in output order (sorted by name, as groupby('Artist') would return them)
+    present_codes = np.unique(artist_codes)
+    artist_names = vocabulary.artists.decode(present_codes)
+    name_order = np.argsort(artist_names, kind='stable')
+    present_codes, artist_names = present_codes[name_order], artist_names[name_order]
     
-    # If shared_genres is provided, use only those genres
-    # Otherwise, use all genres if in training mode
-    if shared_genres is not None:
-        genres_to_use = shared_genres
-        print(f"Using {len(genres_to_use)} shared genres from both datasets")
-    elif is_training:
-        # Extract all unique genres
-        all_genres = set()
-        for genre_list in genre_lists:
-            all_genres.update(genre_list)
-        
-        # Remove any empty strings
-        if '' in all_genres:
-            all_genres.remove('')
-        
-        genres_to_use = all_genres
-        print(f"Using all {len(genres_to_use)} unique genres in training data")
+    artist_rows = np.empty(len(vocabulary.artists), dtype=np.int64)
+    artist_rows[present_codes] = np.arange(len(present_codes))
+    group_ids = artist_rows[artist_codes]
+    n_artists = len(present_codes)
+    
+    artist_genres = artist_genre_matrix(
+        row_ids, group_ids, n_artists, genre_row_ids, genre_codes, n_rows, len(vocabulary.genres)
+    )
+    
+    # Aggregate numerical features by artist
+    print("Aggregating features by artist...")
+    
+    if n_artists > 0:
+        group_min, group_max, group_mean, group_var = _group_reduce(group_ids, track_values[row_ids], n_artists)
     else:
-        # This should not happen if code is used correctly
-        print("WARNING: No shared_genres provided for test data. Using empty set.")
-        genres_to_use = set()
+        group_min = group_max = group_mean = group_var = np.empty((0, len(numeric_cols)), dtype=value_dtype)
     
-    # PERFORMANCE IMPROVEMENT: Create all genre columns at once using list comprehension and concat
-    print("Creating genre feature columns efficiently...")
+    numeric = {}
+    for i, feature in enumerate(numeric_cols):
+        numeric[f'{feature}_min'] = group_min[:, i]
+        numeric[f'{feature}_max'] = group_max[:, i]
+        numeric[f'{feature}_mean'] = group_mean[:, i]
+        numeric[f'{feature}_var'] = group_var[:, i]
     
-    # Create a dictionary for genre encoding
-    genre_dfs = []
+    # Categorical columns use the most frequent value per artist
+    categorical = {}
+    for col in ['Key', 'Mode', 'Time Signature']:
+        if n_artists > 0:
+            categorical[f'{col}_<lambda>'] = _group_mode(group_ids, categorical_values[col][row_ids], n_artists)
+        else:
+            categorical[f'{col}_<lambda>'] = np.empty(0, dtype=np.int64)
+    
+    return {
+        'artists': artist_names,
+        'numeric': numeric,
+        'categorical': categorical,
+        'artist_genres': artist_genres,
+        'track_count': np.bincount(group_ids, minlength=n_artists),
+        'genre_counts': genre_counts
+    }
+
+
+def artist_feature_frame(artist_table, genre_featurizer, vocabulary, include_target=False):
+    """
+    Artist feature table from a compiled artist table: numeric aggregates,
+    genre features and categorical modes, plus Track_Count with include_target.
     
-    # Convert list of genres to use to a set for faster lookups
-    genres_to_use_set = set(genres_to_use)
+    Args:
+        artist_table: Result of compile_artist_table
+        genre_featurizer: Featurizer for the genre columns
+        vocabulary: Vocabulary the table was compiled with, or an extension of it
+        include_target: Add the track count per artist as the Track_Count target
+    """
+    genre_names, genre_matrix = genre_featurizer.transform(artist_table['artist_genres'], vocabulary)
     
-    # For each genre in the set, create a Series that will be a column
-    for genre in genres_to_use_set:
-        genre_col = exploded_artists['Genre_List'].apply(lambda x: 1 if genre in x else 0)
-        genre_col.name = f'Genre_{genre}'
-        genre_dfs.append(genre_col)
+    # Sparse genre blocks stay sparse in the DataFrame so models can consume them as such
+    if sparse.issparse(genre_matrix):
+        genre_frame = pd.DataFrame.sparse.from_spmatrix(genre_matrix, columns=genre_names)
+    else:
+        genre_frame = pd.DataFrame(genre_matrix, columns=genre_names)
     
-    # If we have genre columns, concat them all at once to the main DataFrame
-    if genre_dfs:
-        # Make a copy to defragment the DataFrame
-        # This is faster than repeatedly adding columns to the original DataFrame
-        exploded_artists = exploded_artists.copy()
-        
-        # Concatenate all genre columns at once
-        genre_df = pd.concat(genre_dfs, axis=1)
-        exploded_artists = pd.concat([exploded_artists, genre_df], axis=1)
+    artist_features = pd.concat([
+        pd.DataFrame({'Artist': artist_table['artists'], **artist_table['numeric']}),
+        genre_frame,
+        pd.DataFrame(artist_table['categorical'])
+    ], axis=1)
     
-    # Drop the temporary Genre_List column
-    exploded_artists.drop('Genre_List', axis=1, inplace=True)
+    if include_target:
+        artist_features['Track_Count'] = artist_table['track_count']
+    return artist_features
+
+
+def preprocess_playlist_data(playlist_df, is_training=True, shared_genres=None, return_genres=False,
+                             min_artist_frequency=None, vocabulary=None, genre_featurizer=None, feature_dtype=None):
+    """
+    Preprocess playlist data for artist-level aggregation.
+    - Explode artist collaborations into separate rows
+    - Extract and encode genres
+    - Aggregate numerical features by artist
+    - Filter out infrequent artists (for Primavera data)
     
-    # Count tracks per artist (for training data)
-    if is_training:
-        print("Calculating artist frequency in personal playlist...")
-        artist_frequency = exploded_artists['Artist'].value_counts().reset_index()
-        artist_frequency.columns = ['Artist', 'Track_Count']
+    Artists and genres are handled as integer codes from a shared Vocabulary;
+    names are only materialised for the returned feature table.
     
-    # Aggregate numerical features by artist
-    print("Aggregating features by artist...")
+    Args:
+        playlist_df: DataFrame containing playlist data
+        is_training: Whether this is training data (True) or test data (False)
+        shared_genres: List of shared genres to use (for test data)
+        return_genres: Whether to return genre frequency info (True for initial training)
+        min_artist_frequency: Minimum frequency for artists to be included (None = no filtering)
+        vocabulary: Vocabulary shared with the other pipeline steps (None = private vocabulary)
+        genre_featurizer: Featurizer for the genre columns (None = one column per shared genre).
+            Use the same featurizer for training and test data.
+        feature_dtype: Float dtype of the track values and aggregated features
+            (None = float64; float32 halves the memory of the per-track matrices)
+    """
+    print(f"\n----- Preprocessing {'training' if is_training else 'test'} data -----")
     
-    # List of numerical features to aggregate
-    num_features = [
-        'Popularity', 'Danceability', 'Energy', 'Loudness', 'Speechiness',
-        'Acousticness', 'Instrumentalness', 'Liveness', 'Valence', 'Tempo'
-    ]
+    if vocabulary is None:
+        vocabulary = Vocabulary()
     
-    # Create aggregation dictionary
-    agg_dict = {}
-    for feature in num_features:
-        agg_dict[feature] = ['min', 'max', 'mean', 'var']
+    artist_table = compile_artist_table(
+        playlist_df,
+        vocabulary,
+        min_artist_frequency=min_artist_frequency,
+        feature_dtype=feature_dtype,
+        count_genres=is_training and return_genres
+    )
     
-    # Add genre columns to aggregation (using max because they're 0/1)
-    genre_cols = [col for col in exploded_artists.columns if col.startswith('Genre_')]
-    for col in genre_cols:
-        agg_dict[col] = 'max'  # Just use 'max' without renaming
+    # Calculate genre frequencies for training data
+    if is_training and return_genres:
+        genre_counts = artist_table['genre_counts']
         
-    # Add categorical columns with mode aggregation
-    for col in ['Key', 'Mode', 'Time Signature']:
-        agg_dict[col] = lambda x: x.mode().iloc[0] if not x.empty and len(x.mode()) > 0 else 0
-    
-    # Perform aggregation
-    artist_features = exploded_artists.groupby('Artist').agg(agg_dict)
+        print(f"Found {len(genre_counts)} unique genres in training data")
+        print(f"Top 5 genres: {genre_counts.head(5).to_dict()}")
     
-    # Flatten multi-level column names, but preserve genre column names WITHOUT _max suffix
-    new_columns = []
-    for col in artist_features.columns:
-        if col[0].startswith('Genre_') and col[1] == 'max':
-            # For genre columns, just use the original name without the _max suffix
-            new_columns.append(col[0])
-        else:
-            # For other columns, join the names
-            new_columns.append('_'.join(col).strip())
+    # If shared_genres is provided, use only those genres
+    # Otherwise, use all genres if in training mode
+    if genre_featurizer is not None:
+        print(f"Using {genre_featurizer.width} {genre_featurizer.description} features")
+    elif shared_genres is not None:
+        genre_featurizer = TopGenreFeaturizer(shared_genres)
+        print(f"Using {genre_featurizer.width} shared genres from both datasets")
+    elif is_training:
+        genre_featurizer = TopGenreFeaturizer(vocabulary.genres.decode(np.unique(artist_table['artist_genres'].indices)))
+        print(f"Using all {genre_featurizer.width} unique genres in training data")
+    else:
+        # This should not happen if code is used correctly
+        print("WARNING: No shared_genres provided for test data. Using empty set.")
+        genre_featurizer = TopGenreFeaturizer([])
     
-    artist_features.columns = new_columns
+    print("Creating genre feature columns efficiently...")
     
-    # Reset index to make 'Artist' a column
-    artist_features.reset_index(inplace=True)
+    # For training data, add track count as the target
+    artist_features = artist_feature_frame(artist_table, genre_featurizer, vocabulary, include_target=is_training)
     
-    # For training data, merge with track count
     if is_training:
-        artist_features = artist_features.merge(artist_frequency, on='Artist', how='left')
-        artist_features['Track_Count'].fillna(0, inplace=True)
         print(f"Created features for {len(artist_features)} artists with track count as target variable")
     else:
         print(f"Created features for {len(artist_features)} artists")
     
     # Return the processed data, and genre counts if requested
     if is_training and return_genres:
-        return artist_features, genre_counts
+        return artist_features, artist_table['genre_counts']
     return artist_features
 
 
-def analyze_genres(my_playlist, primavera_playlist):
-    """Analyze and find shared genres between datasets"""
+def analyze_genres(my_playlist, primavera_playlist, vocabulary=None, top_n=20, genre_similarity=None):
+    """
+    Analyze and find the top_n most frequent shared genres between datasets.
+    
+    With a GenreSimilarityIndex, the personal genre profile is first spread to
+    similar genres, so lineup genres close to the listener's (e.g. "modern
+    indie rock" for "indie rock") can be selected too.
+    """
     print("\n----- Analyzing genres in both datasets -----")
     
-    # First pass to get genres from personal playlist
-    _, my_genres = preprocess_playlist_data(my_playlist, is_training=True, return_genres=True)
+    if vocabulary is None:
+        vocabulary = Vocabulary()
     
-    # Do a light processing of Primavera data to get genres
-    primavera_exploded = primavera_playlist.copy()
-    primavera_exploded['Genres'] = primavera_exploded['Genres'].astype(str)
+    # Genre frequencies in the personal playlist, counted per exploded artist row
+    row_ids, _ = vocabulary.artists.encode_lists(my_playlist['Artist Name(s)'])
+    artists_per_row = np.bincount(row_ids, minlength=len(my_playlist))
     
-    # Extract genres from Primavera data
-    primavera_genre_lists = []
-    for genres_str in primavera_exploded['Genres']:
-        if pd.isna(genres_str) or genres_str == '' or genres_str.lower() == 'nan':
-            primavera_genre_lists.append([])
-        else:
-            if ', ' in genres_str:
-                primavera_genre_lists.append([g.strip() for g in genres_str.split(', ') if g.strip()])
-            else:
-                primavera_genre_lists.append([g.strip() for g in genres_str.split(',') if g.strip()])
+    my_genre_column = my_playlist['Genres'] if 'Genres' in my_playlist.columns else pd.Series('', index=my_playlist.index)
+    my_genre_rows, my_genre_codes = vocabulary.genres.encode_lists(my_genre_column)
+    in_use = artists_per_row[my_genre_rows] > 0
+    my_genres = np.bincount(
+        my_genre_codes[in_use], weights=artists_per_row[my_genre_rows[in_use]], minlength=len(vocabulary.genres)
+    )
+    print(f"Found {np.count_nonzero(my_genres)} unique genres in training data")
     
-    # Flatten all genre lists from Primavera
-    primavera_genres_flat = [genre for sublist in primavera_genre_lists for genre in sublist if genre]
+    # Genres present in the Primavera data
+    _, primavera_genre_codes = vocabulary.genres.encode_lists(primavera_playlist['Genres'])
+    my_genres = np.pad(my_genres, (0, len(vocabulary.genres) - len(my_genres)))
+    primavera_genres = np.bincount(primavera_genre_codes, minlength=len(vocabulary.genres))
     
-    # Count genre frequencies in Primavera data
-    primavera_genre_counts = pd.Series(primavera_genres_flat).value_counts()
+    if genre_similarity is not None:
+        exact_genres = my_genres
+        my_genres = genre_similarity.expand(my_genres, vocabulary)
+        new_genres = np.count_nonzero((my_genres > 0) & (exact_genres == 0) & (primavera_genres > 0))
+        print(f"Genre similarity adds {new_genres} similar lineup genres to the personal genre profile")
     
     # Find genres that appear in both datasets
-    my_genre_set = set(my_genres.index)
-    primavera_genre_set = set(primavera_genre_counts.index)
-    shared_genres = my_genre_set.intersection(primavera_genre_set)
+    shared_genres = np.flatnonzero((my_genres > 0) & (primavera_genres > 0))
     
     print(f"Found {len(shared_genres)} genres shared between datasets")
     
-    # Get the top 20 most frequent genres from your playlist that also appear in Primavera data
-    top_shared_genres = my_genres[my_genres.index.isin(shared_genres)].nlargest(20).index.tolist()
+    # Get the most frequent genres from your playlist that also appear in Primavera data
+    top_codes = shared_genres[np.argsort(-my_genres[shared_genres], kind='stable')[:top_n]]
+    top_shared_genres = list(vocabulary.genres.decode(top_codes))
     
-    print(f"Selected top 20 shared genres: {top_shared_genres}")
+    print(f"Selected top {top_n} shared genres: {top_shared_genres}")
     
-    return top_shared_genres
\ No newline at end of file
+    return top_shared_genres
@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils import open_atomic, USER_CACHE_DIR
+
+try:
+    from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout as RequestsTimeout
+    NETWORK_ERRORS = (ConnectionError, TimeoutError, RequestsConnectionError, RequestsTimeout)
+except ImportError:
+    NETWORK_ERRORS = (ConnectionError, TimeoutError)
+
+# Cached lookups live in the user's cache folder, outside the source tree.
+# Set SPOTIFY_CACHE_PATH to use another file.
+DEFAULT_CACHE_PATH = os.environ.get('SPOTIFY_CACHE_PATH') or os.path.join(USER_CACHE_DIR, 'spotify_top_tracks.json')
+
+
+def load_spotify_credentials():
+    """Load Spotify client ID and secret from environment variables or a credentials JSON file"""
+    client_id = os.environ.get('SPOTIFY_CLIENT_ID')
+    client_secret = os.environ.get('SPOTIFY_CLIENT_SECRET')
+    
+    if client_id and client_secret:
+        return client_id, client_secret
+    
+    for json_path in ['secrets/spotify_credentials.json', '../secrets/spotify_credentials.json',
+                      'spotify_credentials.json']:
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, 'r') as f:
+                    creds = json.load(f)
+                return creds.get('client_id'), creds.get('client_secret')
+            except (OSError, ValueError) as e:
+                print(f"Error loading JSON credentials from {json_path}: {e}")
+    
+    return None, None
+
+
+def clean_artist_name(artist_name):
+    """Strip parenthetical notes such as '(2nd of June)' from an artist name"""
+    return artist_name.split('(')[0].strip()
+
+
+class SpotifyClient:
+    """
+    Artist metadata client backed by the Spotify Web API (requires spotipy).
+    
+    Any object with the same search_artist / artist_top_tracks methods can be
+    used in its place, e.g. FixtureClient for offline runs.
+    """
+
+    def __init__(self, client_id=None, client_secret=None):
+        try:
+            import spotipy
+            from spotipy.oauth2 import SpotifyClientCredentials
+        except ImportError:
+            raise ImportError("spotipy is required for SpotifyClient. Install it with 'pip install spotipy'.")
+        
+        if not client_id or not client_secret:
+            client_id, client_secret = load_spotify_credentials()
+        if not client_id or not client_secret:
+            raise ValueError("Spotify API credentials not found. Set SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET.")
+        
+        # Retries are handled by the fetcher so they share its rate limit
+        self.sp = spotipy.Spotify(
+            auth_manager=SpotifyClientCredentials(client_id=client_id, client_secret=client_secret),
+            retries=0
+        )
+
+    def search_artist(self, artist_name):
+        """Return the best matching artist as {'id', 'name'}, or None if not found"""
+        results = self.sp.search(q=f'artist:"{artist_name}"', type='artist', limit=1)
+        items = results['artists']['items']
+        if not items:
+            return None
+        return {'id': items[0]['id'], 'name': items[0]['name']}
+
+    def artist_top_tracks(self, artist_id, country='ES'):
+        """Return the artist's top tracks as a list of {'name', 'spotify_link'}"""
+        tracks = self.sp.artist_top_tracks(artist_id, country=country)['tracks']
+        return [{'name': t['name'], 'spotify_link': t['external_urls']['spotify']} for t in tracks]
+
+
+class FixtureClient:
+    """
+    Offline client that serves recorded responses from a JSON fixture.
+    
+    The fixture has the form:
+        {"artists": {"<artist name>": {"id": "...", "name": "..."}},
+         "top_tracks": {"<artist id>": [{"name": "...", "spotify_link": "..."}]}}
+    """
+
+    def __init__(self, fixture_path):
+        with open(fixture_path, 'r', encoding='utf-8') as f:
+            fixture = json.load(f)
+        self.artists = {name.lower(): artist for name, artist in fixture.get('artists', {}).items()}
+        self.top_tracks = fixture.get('top_tracks', {})
+
+    def search_artist(self, artist_name):
+        return self.artists.get(artist_name.lower())
+
+    def artist_top_tracks(self, artist_id, country='ES'):
+        return self.top_tracks.get(artist_id, [])
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TopTracksCache:
+    """
+    Persistent on-disk cache of artist searches and top tracks with a TTL.
+    
+    Artist names map to Spotify IDs (or None when the artist was not found) and
+    artist IDs map to their top tracks, so repeat runs skip both API calls.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.data = {'artists': {}, 'top_tracks': {}}
+        
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.data.update(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"Warning: Ignoring unreadable cache {path}: {e}")
+
+    def _fresh(self, entry):
+        return entry is not None and time.time() - entry['fetched_at'] < self.ttl_seconds
+
+    def get_artist(self, artist_name):
+        """Return (hit, artist) for a cached search result"""
+        with self.lock:
+            entry = self.data['artists'].get(artist_name.lower())
+        if self._fresh(entry):
+            return True, entry['artist']
+        return False, None
+
+    def set_artist(self, artist_name, artist):
+        with self.lock:
+            self.data['artists'][artist_name.lower()] = {'artist': artist, 'fetched_at': time.time()}
+
+    def get_top_tracks(self, artist_id, country):
+        with self.lock:
+            entry = self.data['top_tracks'].get(f"{artist_id}:{country}")
+        return entry['tracks'] if self._fresh(entry) else None
+
+    def set_top_tracks(self, artist_id, country, tracks):
+        with self.lock:
+            self.data['top_tracks'][f"{artist_id}:{country}"] = {'tracks': tracks, 'fetched_at': time.time()}
+
+    def save(self):
+        """Write the cache atomically so an interrupted run never leaves a corrupt file"""
+        if not self.path:
+            return
+        cache_dir = os.path.dirname(self.path) or '.'
+        os.makedirs(cache_dir, exist_ok=True)
+        
+        with self.lock, open_atomic(self.path, 'w') as f:
+            json.dump(self.data, f, separators=(',', ':'))
+
+
+def _is_retryable(error):
+    """Rate limits (429), server errors (5xx) and network failures are retried; anything else is not"""
+    status = getattr(error, 'http_status', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, NETWORK_ERRORS)
+
+
+def _retry_after_seconds(error):
+    """Seconds from the Retry-After header of a rate limited response, or None"""
+    retry_after = (getattr(error, 'headers', None) or {}).get('Retry-After')
+    try:
+        return max(float(retry_after), 0.0) if retry_after is not None else None
+    except ValueError:
+        return None
+
+
+def _call_with_retries(func, limiter, retries=3, backoff=0.5):
+    """Call func under the rate limit, retrying transient failures with exponential backoff and jitter"""
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        try:
+            return func()
+        except Exception as e:
+            if attempt == retries or not _is_retryable(e):
+                raise
+            
+            # Honour Retry-After on rate limit responses when the client exposes it
+            retry_after = _retry_after_seconds(e)
+            delay = retry_after if retry_after is not None else backoff * (2 ** attempt)
+            time.sleep(delay + random.uniform(0, backoff))
+
+
+def fetch_artist_top_tracks(client, artist_name, limiter, cache=None, country='ES', limit=10, retries=3):
+    """Get an artist's top tracks, using the cache where possible. Default country is Spain (ES)."""
+    clean_name = clean_artist_name(artist_name)
+    
+    try:
+        hit, artist = cache.get_artist(clean_name) if cache else (False, None)
+        if not hit:
+            artist = _call_with_retries(lambda: client.search_artist(clean_name), limiter, retries)
+            if cache:
+                cache.set_artist(clean_name, artist)
+        
+        if not artist:
+            print(f"Could not find artist: {artist_name}")
+            return []
+        
+        tracks = cache.get_top_tracks(artist['id'], country) if cache else None
+        if tracks is None:
+            tracks = _call_with_retries(lambda: client.artist_top_tracks(artist['id'], country), limiter, retries)
+            if cache:
+                cache.set_top_tracks(artist['id'], country, tracks)
+    except Exception as e:
+        print(f"Error getting top tracks for artist {artist_name}: {e}")
+        return []
+    
+    return [
+        {'artist': artist_name, 'track_name': t['name'], 'spotify_link': t['spotify_link']}
+        for t in tracks[:limit]
+    ]
+
+
+def get_all_artist_top_tracks(client, artist_lists, country='ES', limit=10, max_workers=8,
+                              requests_per_second=20, cache=None, retries=3):
+    """
+    Get top tracks for all artists in the provided lists and return their Spotify links.
+    
+    Artists are fetched concurrently under a shared token-bucket rate limit, and
+    results come back in input order with duplicate artists removed.
+    
+    Args:
+        client: SpotifyClient, FixtureClient or any object with the same methods
+        artist_lists: Iterable of artist name lists
+        country: Market for top tracks
+        limit: Maximum number of tracks per artist
+        max_workers: Number of concurrent requests
+        requests_per_second: Rate limit shared by all workers
+        cache: TopTracksCache to read from and update (None = no caching)
+        retries: Number of retries per request
+    """
+    all_artists = list(dict.fromkeys(artist for artist_list in artist_lists for artist in artist_list))
+    print(f"Processing {len(all_artists)} artists...")
+    
+    limiter = TokenBucket(requests_per_second)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda artist_name: fetch_artist_top_tracks(
+                client, artist_name, limiter, cache=cache, country=country, limit=limit, retries=retries
+            ),
+            all_artists
+        )
+        all_tracks = [track for artist_tracks in results for track in artist_tracks]
+    
+    if cache:
+        cache.save()
+    
+    print(f"Found {len(all_tracks)} tracks for {len(all_artists)} artists")
+    
+    return all_tracks
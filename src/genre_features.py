@@ -0,0 +1,260 @@
+import os
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
+from sklearn.utils import murmurhash3_32
+
+from src.utils import open_atomic
+
+
+# Default number of genre feature columns per mode
+DEFAULT_GENRE_WIDTHS = {
+    'top': 20,
+    'hash': 64,
+    'svd': 16
+}
+
+
+def artist_genre_matrix(row_ids, group_ids, n_artists, genre_row_ids, genre_codes, n_rows, n_genres):
+    """
+    Sparse artist x genre presence matrix from exploded (track row, artist) and
+    (track row, genre code) pairs: artist x genre = (artist x track) @ (track x genre).
+    """
+    track_genres = sparse.csr_matrix(
+        (np.ones(len(genre_codes)), (genre_row_ids, genre_codes)),
+        shape=(n_rows, n_genres)
+    )
+    artist_tracks = sparse.csr_matrix(
+        (np.ones(len(group_ids)), (group_ids, row_ids)),
+        shape=(n_artists, n_rows)
+    )
+    artist_genres = (artist_tracks @ track_genres).tocsr()
+    artist_genres.data = np.ones_like(artist_genres.data)
+    return artist_genres
+
+
+class TopGenreFeaturizer:
+    """
+    One dense 0/1 column per selected genre (the top shared genres).
+    
+    With a genre similarity index, artists also get partial credit (up to 1)
+    in the columns of genres similar to their own.
+    """
+    
+    sparse_output = False
+
+    def __init__(self, genres, similarity=None):
+        self.genres = list(dict.fromkeys(genres))
+        self.similarity = similarity
+
+    @property
+    def description(self):
+        return 'shared genre' if self.similarity is None else 'similarity-weighted shared genre'
+
+    @property
+    def width(self):
+        return len(self.genres)
+
+    def transform(self, artist_genres, vocabulary):
+        """Return (column names, n_artists x width matrix) for an artist x genre code matrix"""
+        codes = vocabulary.genres.lookup(self.genres)
+        known = (codes >= 0) & (codes < artist_genres.shape[1])
+        
+        matrix = np.zeros((artist_genres.shape[0], len(self.genres)), dtype=np.int64)
+        if known.any():
+            matrix[:, known] = artist_genres[:, codes[known]].toarray() > 0
+        
+        if self.similarity is not None:
+            block = self.similarity.similarity_block(vocabulary, artist_genres.shape[1], self.genres)
+            matrix = np.minimum(matrix + (artist_genres @ block).toarray(), 1.0)
+        
+        return [f'Genre_{genre}' for genre in self.genres], matrix
+
+
+class HashingGenreFeaturizer:
+    """
+    Every genre hashed into a fixed number of signed buckets.
+    
+    Unlike the top-N selection no genre is discarded, and the width does not
+    grow with the number of genres. The output is sparse, so models that
+    accept sparse input never materialise the block.
+    """
+    
+    description = 'hashed genre'
+    sparse_output = True
+
+    def __init__(self, width=DEFAULT_GENRE_WIDTHS['hash'], seed=0):
+        self.width = width
+        self.seed = seed
+        self._table = (None, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+    
+    def __getstate__(self):
+        # The hash table is tied to one vocabulary's codes, so it is not persisted
+        return {'width': self.width, 'seed': self.seed}
+    
+    def __setstate__(self, state):
+        self.__init__(**state)
+    
+    def _hash_table(self, vocabulary):
+        """Bucket and sign per genre code, extended as the vocabulary grows"""
+        genres, buckets, signs = self._table
+        if genres is not vocabulary.genres:
+            buckets, signs = buckets[:0], signs[:0]
+        
+        if len(buckets) < len(vocabulary.genres):
+            hashes = np.array(
+                [murmurhash3_32(name, seed=self.seed) for name in vocabulary.genres.names[len(buckets):]],
+                dtype=np.int64
+            )
+            buckets = np.concatenate([buckets, np.abs(hashes) % self.width])
+            signs = np.concatenate([signs, np.where(hashes >= 0, 1.0, -1.0)])
+            self._table = (vocabulary.genres, buckets, signs)
+        return buckets, signs
+    
+    def transform(self, artist_genres, vocabulary):
+        buckets, signs = self._hash_table(vocabulary)
+        n_genres = artist_genres.shape[1]
+        
+        # genre -> bucket matrix with the sign of each genre's hash
+        hashing = sparse.csr_matrix(
+            (signs[:n_genres], (np.arange(n_genres), buckets[:n_genres])),
+            shape=(n_genres, self.width)
+        )
+        matrix = (artist_genres @ hashing).tocsr()
+        matrix.eliminate_zeros()
+        
+        return [f'Genre_hash_{i}' for i in range(self.width)], matrix
+
+
+class ProjectedGenreFeaturizer:
+    """
+    Genres projected onto a low-rank basis learned from the lineup's artist x genre matrix.
+    
+    Genres that co-occur across lineup artists share components, so a
+    listener's genres count towards similar lineup genres they never played.
+    Genres unknown to the lineup project to zero.
+    """
+    
+    description = 'projected genre'
+    sparse_output = False
+
+    def __init__(self, genres, components):
+        self.genres = list(genres)
+        self.components = np.asarray(components, dtype=np.float64)
+
+    @property
+    def width(self):
+        return self.components.shape[0]
+
+    def transform(self, artist_genres, vocabulary):
+        codes = vocabulary.genres.lookup(self.genres)
+        known = (codes >= 0) & (codes < artist_genres.shape[1])
+        
+        # genre code x component projection, zero for genres outside the lineup basis
+        projection = np.zeros((artist_genres.shape[1], self.width))
+        projection[codes[known]] = self.components[:, known].T
+        
+        return [f'Genre_svd_{i}' for i in range(self.width)], np.asarray(artist_genres @ projection)
+
+
+def fit_genre_projection(lineup_df, vocabulary, width=DEFAULT_GENRE_WIDTHS['svd'], random_state=42):
+    """
+    Fit a truncated SVD basis on the lineup's artist x genre matrix.
+    
+    Returns:
+        ProjectedGenreFeaturizer, padded with zero components when the lineup has
+        too few genres so the feature width is always `width`
+    """
+    row_ids, artist_codes = vocabulary.artists.encode_lists(lineup_df['Artist Name(s)'])
+    genre_row_ids, genre_codes = vocabulary.genres.encode_lists(lineup_df['Genres'])
+    
+    artist_rows, group_ids = np.unique(artist_codes, return_inverse=True)
+    lineup_codes, genre_columns = np.unique(genre_codes, return_inverse=True)
+    
+    artist_genres = artist_genre_matrix(
+        row_ids, group_ids, len(artist_rows), genre_row_ids, genre_columns, len(lineup_df), len(lineup_codes)
+    )
+    
+    components = np.zeros((width, len(lineup_codes)))
+    n_components = min(width, len(lineup_codes) - 1, len(artist_rows) - 1)
+    if n_components >= 1:
+        svd = TruncatedSVD(n_components=n_components, random_state=random_state)
+        svd.fit(artist_genres)
+        components[:n_components] = svd.components_
+        print(f"Fitted {n_components} genre components on {len(artist_rows)} artists x {len(lineup_codes)} genres "
+              f"({svd.explained_variance_ratio_.sum():.1%} of variance)")
+    
+    return ProjectedGenreFeaturizer(vocabulary.genres.decode(lineup_codes), components)
+
+
+def get_genre_projection_path(lineup_path, width):
+    """Genre projection file stored alongside a lineup CSV"""
+    return os.path.splitext(lineup_path)[0] + f'.genre_svd{width}.npz'
+
+
+@lru_cache(maxsize=16)
+def _load_genre_projection(projection_path, mtime):
+    with np.load(projection_path, allow_pickle=False) as data:
+        return ProjectedGenreFeaturizer(data['genres'].tolist(), data['components'])
+
+
+def load_lineup_genre_projection(lineup_path, vocabulary, width=DEFAULT_GENRE_WIDTHS['svd'], lineup_df=None):
+    """
+    Load the genre projection for a lineup, fitting it if missing or older than the lineup.
+    
+    Args:
+        lineup_path: Path to the lineup CSV (None = fit without caching)
+        vocabulary: Vocabulary shared with the other pipeline steps
+        width: Number of components
+        lineup_df: Already loaded lineup data (avoids reading the CSV again when fitting)
+    """
+    if lineup_path is None:
+        return fit_genre_projection(lineup_df, vocabulary, width)
+    
+    projection_path = get_genre_projection_path(lineup_path, width)
+    
+    if os.path.exists(projection_path) and os.path.getmtime(projection_path) >= os.path.getmtime(lineup_path):
+        return _load_genre_projection(projection_path, os.path.getmtime(projection_path))
+    
+    if lineup_df is None:
+        lineup_df = pd.read_csv(lineup_path)
+    
+    featurizer = fit_genre_projection(lineup_df, vocabulary, width)
+    
+    # Write via a temporary file so concurrent readers never see a partial file
+    try:
+        with open_atomic(projection_path, 'wb') as f:
+            np.savez(f, genres=np.array(featurizer.genres, dtype=str), components=featurizer.components)
+        print(f"Saved genre projection to {projection_path}")
+    except OSError as e:
+        print(f"Warning: Could not save genre projection to {projection_path}: {e}")
+    
+    return featurizer
+
+
+def make_genre_featurizer(mode, width=None, shared_genres=None, lineup_path=None, lineup_df=None, vocabulary=None,
+                          genre_similarity=None):
+    """
+    Build the genre featurizer for a mode.
+    
+    Args:
+        mode: 'top' (top shared genres), 'hash' (feature hashing) or 'svd' (lineup projection)
+        width: Number of genre feature columns (None = mode default)
+        shared_genres: Genres to use in 'top' mode, from analyze_genres
+        lineup_path: Lineup CSV the 'svd' projection is cached for
+        lineup_df: Lineup data to fit the 'svd' projection on
+        vocabulary: Vocabulary shared with the other pipeline steps
+        genre_similarity: GenreSimilarityIndex giving 'top' features partial credit for similar genres
+    """
+    width = width or DEFAULT_GENRE_WIDTHS[mode]
+    
+    if mode == 'top':
+        return TopGenreFeaturizer(list(shared_genres or [])[:width], similarity=genre_similarity)
+    if mode == 'hash':
+        return HashingGenreFeaturizer(width)
+    if mode == 'svd':
+        return load_lineup_genre_projection(lineup_path, vocabulary, width, lineup_df=lineup_df)
+    
+    raise ValueError(f"Unknown genre feature mode: {mode}")
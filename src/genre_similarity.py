@@ -0,0 +1,238 @@
+import os
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.vocabulary import Vocabulary
+from src.genre_features import artist_genre_matrix
+from src.utils import open_atomic
+
+SIMILARITY_MEASURES = ('cosine', 'pmi')
+DEFAULT_GENRE_NEIGHBOURS = 10
+
+
+def genre_incidence(playlists, vocabulary):
+    """
+    Binary artist x genre matrix over several playlists.
+    
+    An artist appearing in several playlists is one row, with the union of
+    the genres of all its tracks.
+    """
+    encoded = []
+    for playlist_df in playlists:
+        row_ids, artist_codes = vocabulary.artists.encode_lists(playlist_df['Artist Name(s)'])
+        genre_row_ids, genre_codes = vocabulary.genres.encode_lists(playlist_df['Genres'])
+        encoded.append((row_ids, artist_codes, genre_row_ids, genre_codes, len(playlist_df)))
+    
+    # Sizes are only final once every playlist is encoded
+    incidence = sparse.csr_matrix((len(vocabulary.artists), len(vocabulary.genres)))
+    for row_ids, artist_codes, genre_row_ids, genre_codes, n_rows in encoded:
+        incidence = incidence + artist_genre_matrix(
+            row_ids, artist_codes, len(vocabulary.artists), genre_row_ids, genre_codes, n_rows, len(vocabulary.genres)
+        )
+    
+    incidence = incidence.tocsr()
+    incidence.data = np.ones_like(incidence.data)
+    return incidence
+
+
+def _top_k_per_row(matrix, top_k):
+    """Keep the top_k largest entries of every row of a CSR matrix (ties in column order)"""
+    matrix = matrix.tocsr()
+    matrix.eliminate_zeros()
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    
+    # Rank entries within their row, largest first
+    order = np.lexsort((-matrix.data, rows))
+    rank = np.arange(len(order)) - matrix.indptr[rows[order]]
+    keep = order[rank < top_k]
+    
+    return sparse.csr_matrix(
+        (matrix.data[keep], (rows[keep], matrix.indices[keep])), shape=matrix.shape
+    )
+
+
+class GenreSimilarityIndex:
+    """
+    Sparse genre x genre similarity from co-occurrence on the same artists.
+    
+    Row g holds the top-k genres most similar to g, with weights in (0, 1].
+    Genres are stored by name, so the index can be used with any vocabulary.
+    """
+
+    def __init__(self, genres, matrix, measure='cosine'):
+        self.genres = list(genres)
+        self.matrix = sparse.csr_matrix(matrix)
+        self.measure = measure
+
+    def _codes(self, vocabulary, n_genres):
+        """Vocabulary codes of the index genres, and which of them are below n_genres"""
+        codes = vocabulary.genres.lookup(self.genres)
+        return codes, (codes >= 0) & (codes < n_genres)
+
+    def neighbours(self, genre, n=None):
+        """Most similar genres to a genre, as (genre, similarity) pairs, most similar first"""
+        try:
+            row = self.genres.index(genre)
+        except ValueError:
+            return []
+        start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        order = np.argsort(-self.matrix.data[start:end], kind='stable')[:n]
+        return [(self.genres[self.matrix.indices[start + i]], float(self.matrix.data[start + i])) for i in order]
+
+    def expand(self, genre_weights, vocabulary):
+        """
+        Spread a genre profile to similar genres in one sparse mat-vec.
+        
+        Args:
+            genre_weights: Weight per vocabulary genre code, e.g. track counts
+            vocabulary: Vocabulary the codes come from
+        
+        Returns:
+            genre_weights plus, for every genre, the similarity-weighted
+            weights of the genres it is a neighbour of
+        """
+        genre_weights = np.asarray(genre_weights, dtype=float)
+        codes, known = self._codes(vocabulary, len(genre_weights))
+        
+        local = np.zeros(len(self.genres))
+        local[known] = genre_weights[codes[known]]
+        spread = self.matrix.T @ local
+        
+        expanded = genre_weights.copy()
+        expanded[codes[known]] += spread[known]
+        return expanded
+
+    def similarity_block(self, vocabulary, n_genres, target_genres):
+        """
+        Sparse n_genres x len(target_genres) matrix with the similarity of every
+        vocabulary genre (code below n_genres) to each target genre.
+        """
+        codes, known = self._codes(vocabulary, n_genres)
+        positions = {genre: i for i, genre in enumerate(self.genres)}
+        targets = np.array([positions.get(genre, -1) for genre in target_genres], dtype=np.int64)
+        
+        # Index genre -> target column mapping, then rows renumbered to vocabulary codes
+        selector = sparse.csr_matrix(
+            (np.ones(np.count_nonzero(targets >= 0)), (targets[targets >= 0], np.flatnonzero(targets >= 0))),
+            shape=(len(self.genres), len(target_genres))
+        )
+        block = (self.matrix @ selector).tocoo()
+        in_vocabulary = known[block.row]
+        return sparse.csr_matrix(
+            (block.data[in_vocabulary], (codes[block.row[in_vocabulary]], block.col[in_vocabulary])),
+            shape=(n_genres, len(target_genres))
+        )
+
+
+def build_genre_similarity(playlists, measure='cosine', top_k=DEFAULT_GENRE_NEIGHBOURS, min_count=1):
+    """
+    Build a genre similarity index from the artists of one or more playlists.
+    
+    Co-occurrence counts come from one sparse product of the artist x genre
+    incidence matrix with itself, and are normalized by the genre frequencies:
+    'cosine' divides by sqrt(n_i * n_j), 'pmi' uses normalized PMI
+    log(p_ij / (p_i p_j)) / -log(p_ij), keeping positive values. Each genre
+    keeps its top_k neighbours.
+    
+    Args:
+        playlists: Lineup (and optional reference corpus) DataFrames
+        measure: 'cosine' or 'pmi'
+        top_k: Neighbours kept per genre
+        min_count: Minimum number of artists two genres must share
+    """
+    if measure not in SIMILARITY_MEASURES:
+        raise ValueError(f"Unknown genre similarity measure: {measure}")
+    
+    vocabulary = Vocabulary()
+    incidence = genre_incidence(playlists, vocabulary)
+    n_artists = max(np.count_nonzero(np.diff(incidence.indptr)), 1)
+    
+    cooccurrence = (incidence.T @ incidence).tocoo()
+    genre_counts = np.asarray(incidence.sum(axis=0)).ravel()
+    
+    # Genres are not their own neighbours
+    pairs = (cooccurrence.row != cooccurrence.col) & (cooccurrence.data >= min_count)
+    row, col, counts = cooccurrence.row[pairs], cooccurrence.col[pairs], cooccurrence.data[pairs]
+    
+    if measure == 'cosine':
+        similarity = counts / np.sqrt(genre_counts[row] * genre_counts[col])
+    else:
+        p_ij = counts / n_artists
+        pmi = np.log(p_ij / (genre_counts[row] / n_artists * genre_counts[col] / n_artists))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            similarity = np.where(p_ij < 1, pmi / -np.log(p_ij), 1.0)
+        similarity = np.clip(similarity, 0, 1)
+    
+    matrix = sparse.csr_matrix((similarity, (row, col)), shape=(len(vocabulary.genres),) * 2)
+    matrix = _top_k_per_row(matrix, top_k)
+    
+    print(f"Built {measure} genre similarity for {len(vocabulary.genres)} genres over {n_artists} artists "
+          f"({matrix.nnz} neighbour pairs, top {top_k} per genre)")
+    return GenreSimilarityIndex(vocabulary.genres.names, matrix, measure)
+
+
+def get_genre_similarity_path(lineup_path, measure, top_k):
+    """Genre similarity file stored alongside a lineup CSV"""
+    return os.path.splitext(lineup_path)[0] + f'.genre_sim_{measure}{top_k}.npz'
+
+
+@lru_cache(maxsize=16)
+def _load_genre_similarity(similarity_path, mtime):
+    with np.load(similarity_path, allow_pickle=False) as data:
+        matrix = sparse.csr_matrix(
+            (data['data'], data['indices'], data['indptr']), shape=(len(data['genres']),) * 2
+        )
+        return GenreSimilarityIndex(data['genres'].tolist(), matrix, str(data['measure'])), str(data['reference'])
+
+
+def load_lineup_genre_similarity(lineup_path, lineup_df=None, reference_path=None, measure='cosine',
+                                 top_k=DEFAULT_GENRE_NEIGHBOURS):
+    """
+    Load the genre similarity index for a lineup, building it if missing or stale.
+    
+    Args:
+        lineup_path: Path to the lineup CSV (None = build from lineup_df without caching)
+        lineup_df: Already loaded lineup data (avoids reading the CSV again when building)
+        reference_path: Optional larger playlist CSV whose artists add co-occurrence evidence
+        measure: 'cosine' or 'pmi'
+        top_k: Neighbours kept per genre
+    """
+    if lineup_path is None:
+        playlists = [lineup_df] + ([pd.read_csv(reference_path)] if reference_path else [])
+        return build_genre_similarity(playlists, measure, top_k)
+    
+    similarity_path = get_genre_similarity_path(lineup_path, measure, top_k)
+    reference = os.path.abspath(reference_path) if reference_path else ''
+    sources = [lineup_path] + ([reference_path] if reference_path else [])
+    
+    if os.path.exists(similarity_path):
+        mtime = os.path.getmtime(similarity_path)
+        if all(mtime >= os.path.getmtime(source) for source in sources):
+            index, built_reference = _load_genre_similarity(similarity_path, mtime)
+            if built_reference == reference:
+                return index
+    
+    if lineup_df is None:
+        lineup_df = pd.read_csv(lineup_path)
+    playlists = [lineup_df] + ([pd.read_csv(reference_path)] if reference_path else [])
+    index = build_genre_similarity(playlists, measure, top_k)
+    
+    # Write via a temporary file so concurrent readers never see a partial file
+    try:
+        with open_atomic(similarity_path, 'wb') as f:
+            np.savez(
+                f,
+                genres=np.array(index.genres, dtype=str),
+                data=index.matrix.data,
+                indices=index.matrix.indices,
+                indptr=index.matrix.indptr,
+                measure=np.array(measure),
+                reference=np.array(reference)
+            )
+        print(f"Saved genre similarity to {similarity_path}")
+    except OSError as e:
+        print(f"Warning: Could not save genre similarity to {similarity_path}: {e}")
+    
+    return index
@@ -0,0 +1,252 @@
+import os
+import time
+import uuid
+import shutil
+import threading
+
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_MIN_AGE_SECONDS = 10 * 60
+DEFAULT_INTERVAL_SECONDS = 15 * 60
+
+
+def mark_used(path):
+    """Record that a session folder was used, so the janitor treats it as recently used"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _is_session_id(name):
+    try:
+        return str(uuid.UUID(name)) == name
+    except ValueError:
+        return False
+
+
+def directory_size(path):
+    """Total size in bytes of the files below path, walked with os.scandir without following symlinks"""
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            total += entry.stat(follow_symlinks=False).st_size
+                    except FileNotFoundError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+    return total
+
+
+class Janitor:
+    """
+    Deletes old session folders from the upload and result directories.
+    
+    A session is the set of <root>/<session id> folders sharing one UUID. A
+    session's last use is the newest modification time of its folders; the
+    web app refreshes it with mark_used whenever results are viewed.
+    
+    Each run first deletes sessions unused for longer than ttl_seconds, then
+    the least recently used sessions until the total size fits max_bytes.
+    Sessions used within min_age_seconds are never deleted, so uploads that
+    are still being processed are safe.
+    
+    Walking every session is the expensive part on very large directories,
+    so folder sizes are only measured on every run when max_bytes is set
+    (they cannot be cached by folder mtime, since files can change in nested
+    folders like profiles/ without touching it). Without a quota only the
+    sessions being deleted are measured, and the bytes in use are not known.
+    """
+
+    def __init__(self, roots, ttl_seconds=DEFAULT_TTL_SECONDS, max_bytes=None,
+                 min_age_seconds=DEFAULT_MIN_AGE_SECONDS, interval_seconds=DEFAULT_INTERVAL_SECONDS):
+        self.roots = list(roots)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.min_age_seconds = min_age_seconds
+        self.interval_seconds = interval_seconds
+        
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._metrics = {
+            'runs': 0,
+            'sessions': 0,
+            'bytes_in_use': None,
+            'sessions_deleted': 0,
+            'bytes_reclaimed': 0,
+            'errors': 0,
+            'last_run': None,
+            'last_run_seconds': None
+        }
+
+    @property
+    def is_running(self):
+        """Whether the background thread started by start() is running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def metrics(self):
+        with self._lock:
+            return dict(self._metrics)
+
+    def scan(self, measure_sizes=True):
+        """
+        List sessions across all roots.
+        
+        Args:
+            measure_sizes: Walk each session's folders to measure its size
+        
+        Returns:
+            Dict mapping session id to {'folders', 'last_used', 'bytes'}, where
+            bytes is None when sizes are not measured
+        """
+        sessions = {}
+        for root in self.roots:
+            try:
+                entries = os.scandir(root)
+            except FileNotFoundError:
+                continue
+            
+            with entries:
+                for entry in entries:
+                    if not _is_session_id(entry.name):
+                        continue
+                    try:
+                        if not entry.is_dir(follow_symlinks=False):
+                            continue
+                        mtime = entry.stat(follow_symlinks=False).st_mtime
+                    except FileNotFoundError:
+                        continue
+                    
+                    session = sessions.setdefault(
+                        entry.name, {'folders': [], 'last_used': 0.0, 'bytes': 0 if measure_sizes else None}
+                    )
+                    session['folders'].append(entry.path)
+                    session['last_used'] = max(session['last_used'], mtime)
+                    if measure_sizes:
+                        session['bytes'] += directory_size(entry.path)
+        
+        return sessions
+
+    def _delete(self, session):
+        """Delete a session's folders, returning the bytes reclaimed (None on failure)"""
+        failed = False
+        for folder in session['folders']:
+            try:
+                shutil.rmtree(folder)
+            except FileNotFoundError:
+                # Already deleted, e.g. by the janitor of another worker process
+                continue
+            except OSError as e:
+                print(f"Warning: Could not delete {folder}: {e}")
+                failed = True
+        if failed:
+            return None
+        return session['bytes']
+
+    def run_once(self, dry_run=False, now=None):
+        """
+        Apply the TTL and size quota once.
+        
+        Args:
+            dry_run: Only report what would be deleted
+            now: Current time (defaults to time.time())
+        
+        Returns:
+            Dict with the sessions scanned, deleted and the bytes reclaimed
+        """
+        start = time.perf_counter()
+        now = time.time() if now is None else now
+        
+        with self._lock:
+            # Sizes only matter for the quota; without one, only deleted sessions are measured
+            measure_sizes = self.max_bytes is not None
+            sessions = self.scan(measure_sizes=measure_sizes)
+            total_bytes = sum(session['bytes'] for session in sessions.values()) if measure_sizes else None
+            
+            # Least recently used first
+            order = sorted(sessions, key=lambda session_id: sessions[session_id]['last_used'])
+            expired = []
+            over_quota = []
+            remaining_bytes = total_bytes
+            for session_id in order:
+                session = sessions[session_id]
+                idle = now - session['last_used']
+                if idle < self.min_age_seconds:
+                    break
+                
+                if self.ttl_seconds is not None and idle > self.ttl_seconds:
+                    expired.append(session_id)
+                elif self.max_bytes is not None and remaining_bytes > self.max_bytes:
+                    over_quota.append(session_id)
+                else:
+                    continue
+                if measure_sizes:
+                    remaining_bytes -= session['bytes']
+            
+            deleted = 0
+            reclaimed = 0
+            errors = 0
+            for session_id in expired + over_quota:
+                if sessions[session_id]['bytes'] is None:
+                    sessions[session_id]['bytes'] = sum(
+                        directory_size(folder) for folder in sessions[session_id]['folders']
+                    )
+                freed = sessions[session_id]['bytes'] if dry_run else self._delete(sessions[session_id])
+                if freed is None:
+                    errors += 1
+                else:
+                    deleted += 1
+                    reclaimed += freed
+            
+            report = {
+                'dry_run': dry_run,
+                'sessions': len(sessions),
+                'expired': len(expired),
+                'over_quota': len(over_quota),
+                'sessions_deleted': deleted,
+                'bytes_reclaimed': reclaimed,
+                'bytes_in_use': total_bytes - reclaimed if measure_sizes else None,
+                'errors': errors,
+                'seconds': time.perf_counter() - start
+            }
+            
+            if not dry_run:
+                self._metrics['runs'] += 1
+                self._metrics['sessions'] = len(sessions) - deleted
+                self._metrics['bytes_in_use'] = report['bytes_in_use']
+                self._metrics['sessions_deleted'] += deleted
+                self._metrics['bytes_reclaimed'] += reclaimed
+                self._metrics['errors'] += errors
+                self._metrics['last_run'] = now
+                self._metrics['last_run_seconds'] = report['seconds']
+        
+        return report
+
+    def _run_forever(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Warning: Janitor run failed: {e}")
+            self._stop.wait(self.interval_seconds)
+
+    def start(self):
+        """Run the janitor every interval_seconds in a daemon thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run_forever, name='janitor', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
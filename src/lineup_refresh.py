@@ -0,0 +1,325 @@
+import os
+import json
+import pickle
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from src.data_processing import preprocess_playlist_data
+from src.modeling import to_model_input, rank_adjusted_scores
+from src.vocabulary import Vocabulary, split_name_lists
+from src.utils import (
+    write_file_atomic, save_score_cache, load_score_cache, create_html_result, write_results, thread_output,
+    RESULT_FORMATS, RESULT_METADATA_FILENAME
+)
+
+MODEL_BUNDLE_FILENAME = "model.pkl"
+
+
+def lineup_signature(lineup_df):
+    """Content hash of a lineup, independent of where the CSV is stored"""
+    row_hashes = pd.util.hash_pandas_object(lineup_df, index=False).to_numpy()
+    return hashlib.sha256(row_hashes.tobytes()).hexdigest()
+
+
+def save_model_bundle(output_dir, model_results, feature_names, genre_featurizer, my_playlist, lineup_df,
+                      overlap_weight=0.3, min_artist_frequency=5, feature_dtype=None):
+    """
+    Store the best model with everything needed to score new lineup artists later.
+    
+    Args:
+        output_dir: Result folder the ranking was saved to
+        model_results: Results from train_and_evaluate_models
+        feature_names: Feature columns the models were trained on, in order
+        genre_featurizer: Genre featurizer used for the training data
+        my_playlist: Personal playlist, to mark new lineup artists the listener already knows
+        lineup_df: Lineup the ranking was computed for
+        overlap_weight: Overlap weight used for the adjusted ranking
+        min_artist_frequency: Minimum lineup tracks per artist used for the ranking
+        feature_dtype: Feature dtype the models were trained with (None = DataFrame input)
+    """
+    best_model_name = min(model_results, key=lambda k: model_results[k]['cv_rmse_mean'])
+    bundle = {
+        'model_name': best_model_name,
+        'model': model_results[best_model_name]['model'],
+        'feature_names': list(feature_names),
+        'genre_featurizer': genre_featurizer,
+        'my_artists': sorted(set(split_name_lists(my_playlist['Artist Name(s)'])[1])),
+        'lineup_signature': lineup_signature(lineup_df),
+        'overlap_weight': overlap_weight,
+        'min_artist_frequency': min_artist_frequency,
+        'feature_dtype': np.dtype(feature_dtype).name if feature_dtype is not None else None
+    }
+    
+    bundle_path = os.path.join(output_dir, MODEL_BUNDLE_FILENAME)
+    write_file_atomic(bundle_path, pickle.dumps(bundle, protocol=pickle.HIGHEST_PROTOCOL))
+    return bundle_path
+
+
+def load_model_bundle(result_folder):
+    """Load the model bundle of a result folder (None if it has none)"""
+    bundle_path = os.path.join(result_folder, MODEL_BUNDLE_FILENAME)
+    if not os.path.exists(bundle_path):
+        return None
+    with open(bundle_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _artist_signatures(lineup_df):
+    """Order-independent hash of every artist's lineup tracks"""
+    row_hashes = pd.util.hash_pandas_object(lineup_df, index=False).to_numpy()
+    row_ids, names = split_name_lists(lineup_df['Artist Name(s)'])
+    codes, artists = pd.factorize(names)
+    
+    # Summing (with uint64 wrap-around) makes the signature independent of track order
+    signatures = np.zeros(len(artists), dtype=np.uint64)
+    np.add.at(signatures, codes, row_hashes[row_ids])
+    return pd.Series(signatures, index=artists)
+
+
+def artist_track_counts(lineup_df):
+    """Number of lineup tracks per artist, counting every artist of a collaboration"""
+    _, names = split_name_lists(lineup_df['Artist Name(s)'])
+    return pd.Series(names, dtype=object).value_counts().to_dict()
+
+
+def diff_lineups(old_lineup, new_lineup):
+    """
+    Compare two lineups artist by artist.
+    
+    Returns:
+        Dict with sorted lists of 'added', 'removed' and 'changed' artists, where
+        changed artists have different tracks or track features in the new lineup
+    """
+    old_signatures = _artist_signatures(old_lineup)
+    new_signatures = _artist_signatures(new_lineup)
+    
+    common = old_signatures.index.intersection(new_signatures.index)
+    changed = common[old_signatures[common].to_numpy() != new_signatures[common].to_numpy()]
+    
+    return {
+        'added': sorted(new_signatures.index.difference(old_signatures.index)),
+        'removed': sorted(old_signatures.index.difference(new_signatures.index)),
+        'changed': sorted(changed)
+    }
+
+
+def _rank_scores(artists, predicted_scores, in_my_playlist, overlap_weight):
+    """Ranked artists table in the same layout as analyze_artist_overlap returns"""
+    order = np.argsort(-predicted_scores, kind='stable')
+    ranked_artists = pd.DataFrame({
+        'Rank': np.arange(1, len(order) + 1),
+        'Artist': artists[order],
+        'Predicted_Score': predicted_scores[order],
+        'In_My_Playlist': in_my_playlist[order].astype(int)
+    })
+    
+    if ranked_artists['In_My_Playlist'].any():
+        adjusted_order, adjusted = rank_adjusted_scores(
+            ranked_artists['Predicted_Score'].to_numpy(),
+            ranked_artists['In_My_Playlist'].to_numpy(),
+            overlap_weight=overlap_weight
+        )
+        ranked_artists = ranked_artists.iloc[adjusted_order].reset_index(drop=True)
+        ranked_artists['Adjusted_Score'] = adjusted
+        ranked_artists['Adjusted_Rank'] = np.arange(1, len(ranked_artists) + 1)
+    
+    return ranked_artists
+
+
+def refresh_result_folder(result_folder, delta_lineup, lineup_diff, old_signature, new_signature,
+                          delta_track_counts=None):
+    """
+    Re-score one cached result against a lineup change and rewrite its files atomically.
+    
+    Only artists in delta_lineup (the new lineup's tracks of added and changed
+    artists) are featurized and scored; every other score comes from the cache.
+    Delta artists with fewer tracks than the result's min_artist_frequency are
+    dropped, as a full rerun would drop them.
+    
+    Args:
+        delta_track_counts: Number of tracks in the full new lineup per added or changed
+            artist (None = count them in delta_lineup, which holds all their tracks)
+    
+    Returns:
+        Dict with the folder, a status ('refreshed', 'current', 'skipped') and details
+    """
+    bundle = load_model_bundle(result_folder)
+    score_cache = load_score_cache(result_folder)
+    
+    if bundle is None or score_cache is None:
+        return {'folder': result_folder, 'status': 'skipped', 'reason': 'no cached model or scores'}
+    if bundle['lineup_signature'] == new_signature:
+        return {'folder': result_folder, 'status': 'current'}
+    if bundle['lineup_signature'] != old_signature:
+        return {'folder': result_folder, 'status': 'skipped', 'reason': 'computed for a different lineup version'}
+    
+    delta_artists = lineup_diff['added'] + lineup_diff['changed']
+    stale_artists = delta_artists + lineup_diff['removed']
+    
+    # Apply the frequency filter to the delta artists' counts in the whole lineup up front.
+    # Preprocessing the delta alone with min_artist_frequency would keep every artist when
+    # all of them fall below it, so it runs without the filter.
+    if delta_track_counts is None:
+        delta_track_counts = artist_track_counts(delta_lineup)
+    min_artist_frequency = bundle['min_artist_frequency'] or 0
+    scored_artists = [
+        artist for artist in delta_artists if delta_track_counts.get(artist, 0) >= min_artist_frequency
+    ]
+    
+    # Featurize only the delta; an artist's features depend only on tracks it appears on
+    new_artists = np.empty(0, dtype=object)
+    new_scores = np.empty(0)
+    if scored_artists:
+        with thread_output():
+            features = preprocess_playlist_data(
+                delta_lineup,
+                is_training=False,
+                vocabulary=Vocabulary(),
+                genre_featurizer=bundle['genre_featurizer'],
+                feature_dtype=bundle.get('feature_dtype')
+            )
+        
+        # Collaborators of delta artists only have some of their tracks here, so leave them out
+        features = features[features['Artist'].isin(scored_artists)]
+        if len(features):
+            X = features.drop(['Artist'], axis=1).reindex(columns=bundle['feature_names']).fillna(0)
+            new_artists = features['Artist'].to_numpy(dtype=object)
+            new_scores = np.clip(bundle['model'].predict(to_model_input(X, dtype=bundle.get('feature_dtype'))), 0, None)
+    
+    keep = ~np.isin(score_cache['Artist'], stale_artists)
+    artists = np.concatenate([score_cache['Artist'][keep].astype(object), new_artists])
+    predicted_scores = np.concatenate([score_cache['Predicted_Score'][keep], new_scores])
+    in_my_playlist = np.isin(artists, bundle['my_artists'])
+    
+    ranked_artists = _rank_scores(artists, predicted_scores, in_my_playlist, bundle['overlap_weight'])
+    
+    # Rewrite every stored representation of the ranking
+    save_score_cache(ranked_artists, output_dir=result_folder)
+    
+    refresh_info = {
+        'refreshed_at': pd.Timestamp.now().isoformat(),
+        'added': len(lineup_diff['added']),
+        'removed': len(lineup_diff['removed']),
+        'changed': len(lineup_diff['changed']),
+        'rescored_artists': len(new_artists)
+    }
+    
+    # Rewrite the results in every format the folder holds, keeping their run metadata
+    json_path = os.path.join(result_folder, 'ranked_artists.json')
+    metadata_path = json_path if os.path.exists(json_path) else os.path.join(result_folder, RESULT_METADATA_FILENAME)
+    raw = b'{}'
+    if os.path.exists(metadata_path):
+        with open(metadata_path, 'rb') as f:
+            raw = f.read()
+    metadata = {k: v for k, v in json.loads(raw).items() if k not in ('artists', 'rows', 'format')}
+    metadata.update({'timestamp': refresh_info['refreshed_at'], 'lineup_refresh': refresh_info})
+    
+    output_formats = [
+        output_format for output_format in ('ndjson', 'parquet')
+        if os.path.exists(os.path.join(result_folder, RESULT_FORMATS[output_format][0]))
+    ]
+    if os.path.exists(json_path) or not output_formats:
+        # Keep the layout the JSON was written in
+        output_formats.append('compact-json' if raw.startswith(b'{"artists"') else 'json')
+    for output_format in output_formats:
+        write_results(ranked_artists, result_folder, output_format=output_format, metadata=metadata)
+    
+    csv_path = os.path.join(result_folder, 'ranked_artists.csv')
+    if os.path.exists(csv_path):
+        write_file_atomic(csv_path, ranked_artists.to_csv(index=False))
+    
+    html_path = os.path.join(result_folder, 'recommendations.html')
+    if os.path.exists(html_path):
+        with thread_output():
+            create_html_result(ranked_artists, output_path=html_path)
+    
+    bundle['lineup_signature'] = new_signature
+    write_file_atomic(
+        os.path.join(result_folder, MODEL_BUNDLE_FILENAME), pickle.dumps(bundle, protocol=pickle.HIGHEST_PROTOCOL)
+    )
+    
+    return {'folder': result_folder, 'status': 'refreshed', **refresh_info}
+
+
+def _refresh_result_folder(task):
+    try:
+        return refresh_result_folder(*task)
+    except Exception as e:
+        return {'folder': task[0], 'status': 'failed', 'reason': str(e)}
+
+
+def find_result_folders(results_root):
+    """Result folders with a cached model: the root itself and its direct subfolders"""
+    candidates = [results_root]
+    if os.path.isdir(results_root):
+        with os.scandir(results_root) as entries:
+            candidates += sorted(entry.path for entry in entries if entry.is_dir())
+    return [folder for folder in candidates if os.path.exists(os.path.join(folder, MODEL_BUNDLE_FILENAME))]
+
+
+def refresh_lineup(lineup_path, new_lineup_path, results_root="./results", max_workers=None):
+    """
+    Update a lineup CSV and re-score every cached result against the change.
+    
+    The lineups are diffed artist by artist, and only added and changed
+    artists are featurized and scored, in a process pool over the cached
+    results. The lineup file is replaced once all results are rewritten.
+    
+    Args:
+        lineup_path: Current lineup CSV (replaced by the new lineup)
+        new_lineup_path: Updated lineup CSV
+        results_root: Folder holding result folders with cached models
+        max_workers: Number of worker processes (None = one per CPU)
+    
+    Returns:
+        Dict with the lineup diff and one status entry per result folder
+    """
+    print("\n----- Refreshing Lineup -----")
+    
+    old_lineup = pd.read_csv(lineup_path)
+    new_lineup = pd.read_csv(new_lineup_path)
+    old_signature, new_signature = lineup_signature(old_lineup), lineup_signature(new_lineup)
+    
+    lineup_diff = diff_lineups(old_lineup, new_lineup)
+    print(f"Lineup change: {len(lineup_diff['added'])} added, {len(lineup_diff['removed'])} removed, "
+          f"{len(lineup_diff['changed'])} changed artists")
+    
+    # New lineup tracks featuring any added or changed artist
+    delta_artists = lineup_diff['added'] + lineup_diff['changed']
+    row_ids, names = split_name_lists(new_lineup['Artist Name(s)'])
+    delta_rows = np.unique(row_ids[np.isin(names, delta_artists)])
+    delta_lineup = new_lineup.iloc[delta_rows].reset_index(drop=True)
+    print(f"Re-scoring {len(delta_artists)} artists from {len(delta_lineup)} of {len(new_lineup)} tracks")
+    
+    # Track counts in the full lineup, for each result's min_artist_frequency filter
+    track_counts = pd.Series(names, dtype=object).value_counts()
+    delta_track_counts = track_counts.reindex(delta_artists, fill_value=0).to_dict()
+    
+    result_folders = find_result_folders(results_root)
+    print(f"Found {len(result_folders)} cached results in {results_root}")
+    
+    tasks = [
+        (folder, delta_lineup, lineup_diff, old_signature, new_signature, delta_track_counts)
+        for folder in result_folders
+    ]
+    if len(tasks) > 1 and max_workers != 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            statuses = list(executor.map(_refresh_result_folder, tasks, chunksize=8))
+    else:
+        statuses = [_refresh_result_folder(task) for task in tasks]
+    
+    for status in statuses:
+        if status['status'] in ('skipped', 'failed'):
+            print(f"  {status['folder']}: {status['status']} ({status['reason']})")
+    
+    counts = pd.Series([status['status'] for status in statuses], dtype=object).value_counts().to_dict()
+    print(f"Result folders: {counts}")
+    
+    if os.path.abspath(new_lineup_path) != os.path.abspath(lineup_path):
+        with open(new_lineup_path, 'rb') as f:
+            write_file_atomic(lineup_path, f.read())
+        print(f"Updated lineup at {lineup_path}")
+    
+    return {'diff': lineup_diff, 'results': statuses}
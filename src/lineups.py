@@ -0,0 +1,254 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+
+from src.data_processing import compile_artist_table, artist_feature_frame
+from src.modeling import to_model_input
+from src.vocabulary import load_lineup_vocabulary
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+DEFAULT_LINEUP_ID = "primavera_25"
+DEFAULT_MAX_RESIDENT = 4
+DEFAULT_MIN_ARTIST_FREQUENCY = 5
+
+# Companion files stored next to a lineup CSV as <lineup id>_<name>.csv
+LINEUP_COMPANIONS = ('timetable', 'walking_times')
+
+
+def discover_lineups(data_dir=DEFAULT_DATA_DIR):
+    """
+    Find lineup playlists in a folder.
+    
+    Every Exportify CSV (one with an 'Artist Name(s)' column) is a lineup, except
+    timetable and walking time companions. The lineup id is the file name
+    without extension, e.g. primavera_25 for primavera_25.csv.
+    
+    Returns:
+        Dict mapping lineup id to CSV path, sorted by id
+    """
+    lineups = {}
+    try:
+        entries = list(os.scandir(data_dir))
+    except FileNotFoundError:
+        return lineups
+    
+    for entry in entries:
+        lineup_id, extension = os.path.splitext(entry.name)
+        if extension.lower() != '.csv' or not entry.is_file():
+            continue
+        if any(lineup_id.endswith(f'_{companion}') for companion in LINEUP_COMPANIONS):
+            continue
+        try:
+            header = pd.read_csv(entry.path, nrows=0).columns
+        except (OSError, ValueError):
+            continue
+        if 'Artist Name(s)' in header:
+            lineups[lineup_id] = entry.path
+    
+    return dict(sorted(lineups.items()))
+
+
+class Lineup:
+    """
+    A loaded lineup: its tracks, its vocabulary and its compiled artist tables.
+    
+    Artist tables do not depend on the listener, so each is compiled once per
+    (minimum artist frequency, dtype) and featurized for every request.
+    """
+
+    def __init__(self, lineup_id, path):
+        self.lineup_id = lineup_id
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self.playlist = pd.read_csv(path)
+        self.vocabulary = load_lineup_vocabulary(path, self.playlist)
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def artist_table(self, min_artist_frequency=DEFAULT_MIN_ARTIST_FREQUENCY, feature_dtype=None):
+        """Compiled artist table of the lineup, built on first use"""
+        key = (min_artist_frequency, np.dtype(feature_dtype or np.float64).name)
+        with self._lock:
+            if key not in self._tables:
+                print(f"Compiling artist table for lineup {self.lineup_id}...")
+                self._tables[key] = compile_artist_table(
+                    self.playlist,
+                    self.vocabulary,
+                    min_artist_frequency=min_artist_frequency,
+                    feature_dtype=feature_dtype
+                )
+            return self._tables[key]
+
+    def artist_features(self, genre_featurizer, vocabulary=None, min_artist_frequency=DEFAULT_MIN_ARTIST_FREQUENCY,
+                        feature_dtype=None):
+        """
+        Lineup artist features, as preprocess_playlist_data returns them for test data.
+        
+        Args:
+            genre_featurizer: Featurizer for the genre columns
+            vocabulary: Request vocabulary extended from this lineup's (None = the lineup's own)
+            min_artist_frequency: Minimum lineup tracks per artist
+            feature_dtype: Float dtype of the aggregated features (None = float64)
+        """
+        artist_table = self.artist_table(min_artist_frequency, feature_dtype)
+        return artist_feature_frame(artist_table, genre_featurizer, vocabulary or self.vocabulary)
+
+
+class LineupRegistry:
+    """
+    Lineups of several festivals and editions, selected by id.
+    
+    Lineups are discovered in data_dir and loaded on first use. At most
+    max_resident lineups stay in memory; the least recently used one is
+    dropped when another is loaded. A lineup whose CSV changed is reloaded.
+    """
+
+    def __init__(self, data_dir=DEFAULT_DATA_DIR, max_resident=DEFAULT_MAX_RESIDENT, default_id=DEFAULT_LINEUP_ID):
+        self.data_dir = data_dir
+        self.max_resident = max(1, max_resident)
+        self._default_id = default_id
+        self._paths = {}
+        self._resident = OrderedDict()
+        # Lineups being loaded, as futures other requests for the same lineup wait on
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Rediscover the lineup CSVs in data_dir"""
+        paths = discover_lineups(self.data_dir)
+        with self._lock:
+            self._paths = paths
+            for lineup_id in [lineup_id for lineup_id in self._resident if lineup_id not in paths]:
+                del self._resident[lineup_id]
+        return self
+
+    def ids(self):
+        return list(self._paths)
+
+    @property
+    def default_id(self):
+        """Configured default lineup if registered, otherwise the first one by id"""
+        if self._default_id in self._paths:
+            return self._default_id
+        return next(iter(self._paths), None)
+
+    def path(self, lineup_id=None):
+        lineup_id = lineup_id or self.default_id
+        if lineup_id not in self._paths:
+            raise ValueError(f"Unknown lineup: {lineup_id}. Registered lineups: {', '.join(self._paths) or 'none'}")
+        return self._paths[lineup_id]
+
+    def companion_path(self, lineup_id, name):
+        """Path of a lineup's companion file such as its timetable (None if there is none)"""
+        if lineup_id not in self._paths:
+            return None
+        path = os.path.splitext(self._paths[lineup_id])[0] + f'_{name}.csv'
+        return path if os.path.exists(path) else None
+
+    def get(self, lineup_id=None):
+        """
+        Load a lineup by id (None = the default lineup).
+        
+        Lineups are loaded outside the registry lock, so a cold load only
+        blocks the requests for that lineup. Those wait for the one load in
+        progress instead of loading the lineup again.
+        """
+        lineup_id = lineup_id or self.default_id
+        path = self.path(lineup_id)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        
+        with self._lock:
+            lineup = self._resident.get(lineup_id)
+            if lineup is not None and lineup.mtime == mtime:
+                self._resident.move_to_end(lineup_id)
+                return lineup
+            
+            loading = self._loading.get(lineup_id)
+            if loading is None:
+                loading = self._loading[lineup_id] = Future()
+                owner = True
+            else:
+                owner = False
+        
+        if not owner:
+            return loading.result()
+        
+        try:
+            lineup = Lineup(lineup_id, path)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[lineup_id]
+            loading.set_exception(e)
+            raise
+        
+        with self._lock:
+            self._resident[lineup_id] = lineup
+            self._resident.move_to_end(lineup_id)
+            while len(self._resident) > self.max_resident:
+                self._resident.popitem(last=False)
+            del self._loading[lineup_id]
+        loading.set_result(lineup)
+        return lineup
+
+    def resident_ids(self):
+        """Ids of the lineups currently in memory, least recently used first"""
+        with self._lock:
+            return list(self._resident)
+
+
+def rank_across_lineups(bundle, registry, lineup_ids=None):
+    """
+    Score a trained model against several lineups in one pass.
+    
+    Every lineup's artists are featurized with the model's genre featurizer,
+    stacked into one matrix and scored with a single predict call.
+    
+    Args:
+        bundle: Model bundle from load_model_bundle
+        registry: LineupRegistry to take the lineups from
+        lineup_ids: Lineups to score (None = every registered lineup)
+    
+    Returns:
+        DataFrame with one row per artist: Rank, Artist, Predicted_Score (best
+        across lineups), Lineups (the lineups the artist plays, best first) and
+        In_My_Playlist
+    """
+    frames = []
+    for lineup_id in lineup_ids or registry.ids():
+        lineup = registry.get(lineup_id)
+        features = lineup.artist_features(
+            bundle['genre_featurizer'],
+            min_artist_frequency=bundle['min_artist_frequency'],
+            feature_dtype=bundle.get('feature_dtype')
+        )
+        frames.append((lineup_id, features))
+    
+    if not frames or not sum(len(features) for _, features in frames):
+        return pd.DataFrame(columns=['Rank', 'Artist', 'Predicted_Score', 'Lineups', 'In_My_Playlist'])
+    
+    # Lineups featurized with different vocabularies share the model's feature columns
+    X = pd.concat(
+        [features.reindex(columns=bundle['feature_names']) for _, features in frames], ignore_index=True
+    ).fillna(0)
+    scores = np.clip(bundle['model'].predict(to_model_input(X, dtype=bundle.get('feature_dtype'))), 0, None)
+    
+    matches = pd.DataFrame({
+        'Artist': np.concatenate([features['Artist'].to_numpy(dtype=object) for _, features in frames]),
+        'Lineup': np.repeat([lineup_id for lineup_id, _ in frames], [len(features) for _, features in frames]),
+        'Predicted_Score': scores
+    }).sort_values(['Predicted_Score', 'Lineup'], ascending=[False, True], kind='stable')
+    
+    ranked_artists = matches.groupby('Artist', sort=False).agg(
+        Predicted_Score=('Predicted_Score', 'first'),
+        Lineups=('Lineup', list)
+    ).reset_index()
+    ranked_artists.insert(0, 'Rank', np.arange(1, len(ranked_artists) + 1))
+    ranked_artists['In_My_Playlist'] = ranked_artists['Artist'].isin(bundle['my_artists']).astype(int)
+    return ranked_artists
@@ -0,0 +1,295 @@
+import io
+import time
+import uuid
+import resource
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import http.cookiejar
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+FLOW_ROUTES = ['/upload', '/process', '/results']
+
+# Audio features jittered per synthetic track, with their valid ranges
+_JITTERED_FEATURES = {
+    'Danceability': (0.0, 1.0),
+    'Energy': (0.0, 1.0),
+    'Valence': (0.0, 1.0),
+    'Acousticness': (0.0, 1.0),
+    'Popularity': (0, 100)
+}
+
+
+def synthetic_playlist(template_df, n_tracks, n_artists=None, lineup_share=0.2, seed=0):
+    """
+    Build a synthetic Exportify-format playlist from a template playlist (e.g. the lineup).
+    
+    Tracks are resampled from the template. Most get one of n_artists synthetic
+    artists with a Zipf-like track count distribution, the rest keep their
+    lineup artist so results have some overlap.
+    
+    Args:
+        template_df: Exportify playlist to sample tracks from
+        n_tracks: Number of tracks
+        n_artists: Number of synthetic artists (None = one per five tracks)
+        lineup_share: Share of tracks that keep their template artist
+        seed: Random seed
+    """
+    rng = np.random.default_rng(seed)
+    playlist = template_df.sample(n_tracks, replace=True, random_state=seed).reset_index(drop=True)
+    
+    n_artists = n_artists or max(1, n_tracks // 5)
+    weights = 1.0 / np.arange(1, n_artists + 1)
+    artist_ids = rng.choice(n_artists, n_tracks, p=weights / weights.sum())
+    
+    keep_artist = rng.random(n_tracks) < lineup_share
+    playlist['Artist Name(s)'] = np.where(
+        keep_artist, playlist['Artist Name(s)'], [f"Synthetic Artist {i}" for i in artist_ids]
+    )
+    
+    # Jitter audio features so synthetic artists do not share identical tracks
+    for col, (low, high) in _JITTERED_FEATURES.items():
+        if col in playlist.columns:
+            noise = rng.normal(0, 0.05 * (high - low), n_tracks)
+            playlist[col] = (pd.to_numeric(playlist[col], errors='coerce') + noise).clip(low, high)
+    
+    return playlist
+
+
+class InProcessClient:
+    """Drives the app through Flask's test client, with its own session cookie"""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def upload(self, filename, csv_bytes):
+        response = self.client.post(
+            '/upload',
+            data={'file': (io.BytesIO(csv_bytes), filename)},
+            content_type='multipart/form-data'
+        )
+        return response.status_code, response.location or '', len(response.data)
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.location or '', len(response.data)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class HttpClient:
+    """Drives a running server over HTTP with its own cookie jar, without following redirects"""
+
+    def __init__(self, base_url, timeout=600):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.headers.get('Location', ''), len(response.read())
+        except urllib.error.HTTPError as e:
+            # Redirects and error statuses arrive as HTTPError once redirects are not followed
+            return e.code, e.headers.get('Location', ''), len(e.read())
+
+    def upload(self, filename, csv_bytes):
+        boundary = uuid.uuid4().hex
+        body = (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: text/csv\r\n\r\n'
+        ).encode('utf-8') + csv_bytes + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+        
+        request = urllib.request.Request(
+            self.base_url + '/upload',
+            data=body,
+            headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+            method='POST'
+        )
+        return self._open(request)
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+
+def _redirects_to(location, path):
+    return urllib.parse.urlparse(location).path == path
+
+
+def run_flow(client, csv_bytes):
+    """
+    Run one upload -> process -> results flow, stopping at the first failed step.
+    
+    Returns:
+        List of (route, seconds, ok) tuples
+    """
+    steps = [
+        ('/upload', lambda: client.upload('playlist.csv', csv_bytes),
+         lambda status, location: status == 302 and _redirects_to(location, '/process')),
+        ('/process', lambda: client.get('/process'),
+         lambda status, location: status == 302 and _redirects_to(location, '/results')),
+        ('/results', lambda: client.get('/results'),
+         lambda status, location: status == 200)
+    ]
+    
+    timings = []
+    for route, request, succeeded in steps:
+        start = time.perf_counter()
+        try:
+            status, location, _ = request()
+            ok = succeeded(status, location)
+        except Exception:
+            ok = False
+        timings.append((route, time.perf_counter() - start, ok))
+        if not ok:
+            break
+    return timings
+
+
+def _latency_summary(seconds):
+    if not seconds:
+        return {'count': 0}
+    ms = np.asarray(seconds) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        'count': len(ms),
+        'mean_ms': round(float(ms.mean()), 2),
+        'p50_ms': round(float(p50), 2),
+        'p95_ms': round(float(p95), 2),
+        'p99_ms': round(float(p99), 2),
+        'max_ms': round(float(ms.max()), 2)
+    }
+
+
+def _peak_rss_bytes(pid):
+    """Peak resident set size of a process from /proc (Linux), or None"""
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def _child_pids(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children', 'r') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def peak_worker_rss(server_pids=None):
+    """
+    Peak RSS in MB of the process serving requests.
+    
+    With server_pids, the largest peak among those processes and their children
+    (e.g. gunicorn workers); otherwise this process, which serves in-process runs.
+    """
+    if not server_pids:
+        # ru_maxrss is in kilobytes on Linux
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    
+    pids = set(server_pids)
+    for pid in server_pids:
+        pids.update(_child_pids(pid))
+    peaks = [peak for peak in (_peak_rss_bytes(pid) for pid in pids) if peak is not None]
+    return round(max(peaks) / (1024 * 1024), 1) if peaks else None
+
+
+def run_load_test(make_client, playlists, concurrency=4, arrival_rate=None, server_pids=None, seed=0):
+    """
+    Run upload -> process -> results flows concurrently and summarise their latencies.
+    
+    Args:
+        make_client: Callable returning a new client (one per flow, so each has its own session)
+        playlists: CSV bytes of the playlist uploaded by each flow
+        concurrency: Maximum number of flows in progress at once
+        arrival_rate: Flows started per second as a Poisson process (None = start all at once)
+        server_pids: PIDs of server processes to report peak RSS for (None = this process)
+        seed: Random seed for the arrival times
+    
+    Returns:
+        Dict with throughput, error rate, per-route and end-to-end latency percentiles and peak RSS
+    """
+    rng = np.random.default_rng(seed)
+    if arrival_rate:
+        arrivals = np.cumsum(rng.exponential(1.0 / arrival_rate, len(playlists)))
+    else:
+        arrivals = np.zeros(len(playlists))
+    
+    lock = threading.Lock()
+    in_flight = [0, 0]  # current, peak
+
+    def timed_flow(csv_bytes, scheduled_at):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        started = time.perf_counter()
+        timings = run_flow(make_client(), csv_bytes)
+        with lock:
+            in_flight[0] -= 1
+        return timings, started - scheduled_at, time.perf_counter() - scheduled_at
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = []
+        for csv_bytes, offset in zip(playlists, arrivals):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(timed_flow, csv_bytes, start + offset))
+        flows = [future.result() for future in futures]
+    duration = time.perf_counter() - start
+    
+    route_seconds = {route: [] for route in FLOW_ROUTES}
+    route_errors = {route: 0 for route in FLOW_ROUTES}
+    flow_seconds = []
+    queue_seconds = []
+    failed_flows = 0
+    for timings, queued, total in flows:
+        queue_seconds.append(queued)
+        for route, seconds, ok in timings:
+            route_seconds[route].append(seconds)
+            route_errors[route] += not ok
+        if all(ok for _, _, ok in timings) and len(timings) == len(FLOW_ROUTES):
+            flow_seconds.append(total)
+        else:
+            failed_flows += 1
+    
+    return {
+        'flows': len(flows),
+        'concurrency': concurrency,
+        'arrival_rate': arrival_rate,
+        'duration_seconds': round(duration, 3),
+        'throughput_flows_per_second': round((len(flows) - failed_flows) / duration, 3) if duration > 0 else None,
+        'error_rate': round(failed_flows / len(flows), 4) if flows else 0.0,
+        'peak_in_flight': in_flight[1],
+        'routes': {
+            route: {**_latency_summary(route_seconds[route]), 'errors': route_errors[route]}
+            for route in FLOW_ROUTES
+        },
+        'flow': _latency_summary(flow_seconds),
+        'queue_wait': _latency_summary(queue_seconds),
+        'peak_worker_rss_mb': peak_worker_rss(server_pids)
+    }
+
+
+def make_playlists(template_path, n_flows, n_tracks, n_artists=None, seed=0):
+    """Synthetic playlist CSVs, one per flow, each with its own seed"""
+    template_df = pd.read_csv(template_path)
+    return [
+        synthetic_playlist(template_df, n_tracks, n_artists=n_artists, seed=seed + i).to_csv(index=False).encode('utf-8')
+        for i in range(n_flows)
+    ]
@@ -1,53 +1,265 @@
+import time
 import numpy as np
 import pandas as pd
+from scipy import sparse
 from sklearn.model_selection import cross_val_score
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.linear_model import Ridge, Lasso
 from sklearn.svm import SVR
 
+from src.vocabulary import Vocabulary
+from src.planner import EXECUTION_TIERS, record_fit_timings
+from src.utils import thread_output
 
-def train_and_evaluate_models(train_data):
-    """Train multiple regression models and evaluate their performance"""
+
+def _dense_float(X):
+    """Dense float array of X, keeping float32 input as float32"""
+    X = X.toarray() if sparse.issparse(X) else np.asarray(X)
+    return X if np.issubdtype(X.dtype, np.floating) else X.astype(float)
+
+
+class TasteSimilarityModel:
+    """
+    Training-free scorer for playlists too small to fit regression models.
+    
+    Scores each artist by its kernel similarity to the playlist's artists,
+    weighted by their track counts and scaled to the track count range.
+    """
+    
+    def fit(self, X, y):
+        X = _dense_float(X)
+        y = np.asarray(y, dtype=X.dtype)
+        
+        self.mean_ = X.mean(axis=0)
+        self.scale_ = X.std(axis=0)
+        self.scale_[self.scale_ == 0] = 1.0
+        
+        self.profiles_ = (X - self.mean_) / self.scale_
+        self.weights_ = y / y.sum() if y.sum() > 0 else np.full(len(y), 1.0 / len(y))
+        self.max_target_ = y.max()
+        return self
+    
+    def predict(self, X):
+        X = _dense_float(X)
+        Z = (X - self.mean_) / self.scale_
+        
+        # Squared distances to every playlist artist
+        sq_dist = (Z ** 2).sum(axis=1)[:, None] - 2 * Z @ self.profiles_.T + (self.profiles_ ** 2).sum(axis=1)
+        sq_dist = np.maximum(sq_dist, 0)
+        
+        # Use the median distance as kernel width so scores stay comparable across playlists
+        bandwidth = np.median(sq_dist) if sq_dist.size and np.median(sq_dist) > 0 else 1.0
+        similarity = np.exp(-sq_dist / bandwidth)
+        
+        return similarity @ self.weights_ * self.max_target_
+
+
+# Constructors for every model an execution tier can use
+MODEL_FACTORIES = {
+    'Taste Similarity': lambda: TasteSimilarityModel(),
+    'Ridge Regression': lambda: Ridge(alpha=1.0),
+    'Lasso Regression': lambda: Lasso(alpha=0.1),
+    'Random Forest': lambda: RandomForestRegressor(n_estimators=100, random_state=42),
+    'Gradient Boosting': lambda: GradientBoostingRegressor(n_estimators=100, random_state=42),
+    'SVR': lambda: SVR(kernel='rbf')
+}
+
+
+def to_model_input(X, dtype=None):
+    """
+    Feature matrix for the models.
+    
+    Frames without sparse columns are passed through, unless a dtype is given:
+    then they become one C-contiguous array of that dtype (e.g. float32, which
+    the tree models use internally, so they do not make their own copy). When
+    the genre block is sparse (hashed genres), the features become one CSR
+    matrix in column order so the models never densify it.
+    """
+    is_sparse = np.array([isinstance(col_dtype, pd.SparseDtype) for col_dtype in X.dtypes])
+    if not is_sparse.any():
+        if dtype is None:
+            return X
+        return np.ascontiguousarray(X.to_numpy(dtype=dtype))
+    
+    dense_block = sparse.csr_matrix(X.loc[:, ~is_sparse].to_numpy(dtype=dtype or float))
+    sparse_block = X.loc[:, is_sparse].sparse.to_coo().tocsr().astype(dtype or float)
+    
+    # Restore the original column order after stacking the two blocks
+    positions = np.r_[np.flatnonzero(~is_sparse), np.flatnonzero(is_sparse)]
+    return sparse.hstack([dense_block, sparse_block], format='csr')[:, np.argsort(positions)]
+
+
+def reduce_training_data(train_data, row_budget=2000, keep_min_track_count=4, min_sample_share=0.25, random_state=42):
+    """
+    Cap the number of training artists with stratified sampling.
+    
+    Artists with at least keep_min_track_count tracks carry most of the taste
+    signal and are always kept. The remaining budget is spread over the
+    lower-count artists in proportion to their Track_Count buckets (1, 2-3, 4-7, ...).
+    
+    Args:
+        train_data: Preprocessed training data with a Track_Count column
+        row_budget: Maximum number of artists to train on (None or 0 = no limit)
+        keep_min_track_count: Artists with at least this many tracks are always kept
+        min_sample_share: Share of the budget reserved for low-count artists even
+            when the high-count artists alone exceed the budget
+        random_state: Seed for the sampling
+    
+    Returns:
+        Tuple of (training data, dict describing the reduction)
+    """
+    original_rows = len(train_data)
+    reduction = {'original_rows': original_rows, 'rows': original_rows, 'reduction_ratio': 1.0}
+    
+    if not row_budget or original_rows <= row_budget:
+        return train_data, reduction
+    
+    print("\n----- Reducing Training Data -----")
+    
+    counts = train_data['Track_Count'].to_numpy()
+    high_rows = np.flatnonzero(counts >= keep_min_track_count)
+    low_rows = np.flatnonzero(counts < keep_min_track_count)
+    
+    low_budget = max(row_budget - len(high_rows), int(row_budget * min_sample_share))
+    if len(high_rows) > row_budget:
+        print(f"Warning: {len(high_rows)} artists with {keep_min_track_count}+ tracks exceed the budget of {row_budget}. Keeping all of them.")
+    
+    sampled_rows = low_rows
+    if len(low_rows) > low_budget:
+        rng = np.random.default_rng(random_state)
+        buckets = np.floor(np.log2(np.maximum(counts[low_rows], 1))).astype(int)
+        
+        # Proportional allocation per Track_Count bucket, at least one artist each
+        samples = []
+        for bucket in np.unique(buckets):
+            bucket_rows = low_rows[buckets == bucket]
+            n_bucket = min(len(bucket_rows), max(1, round(low_budget * len(bucket_rows) / len(low_rows))))
+            samples.append(rng.choice(bucket_rows, n_bucket, replace=False))
+        sampled_rows = np.concatenate(samples)
+    
+    # Keep the original (artist name) order
+    keep = np.sort(np.concatenate([high_rows, sampled_rows]))
+    reduced = train_data.iloc[keep].reset_index(drop=True)
+    
+    reduction.update({
+        'rows': len(reduced),
+        'reduction_ratio': len(reduced) / original_rows,
+        'kept_high_count_artists': len(high_rows),
+        'keep_min_track_count': keep_min_track_count
+    })
+    
+    print(f"Kept all {len(high_rows)} artists with {keep_min_track_count}+ tracks and sampled "
+          f"{len(sampled_rows)} of {len(low_rows)} others")
+    print(f"Training on {len(reduced)} of {original_rows} artists ({reduction['reduction_ratio']:.1%})")
+    
+    return reduced, reduction
+
+
+def find_stable_sample_size(train_data, row_budget=2000, start_rows=250, tolerance=0.02, cv_folds=3, random_state=42,
+                            feature_dtype=None):
+    """
+    Grow the training sample until its cross-validated RMSE stops changing.
+    
+    Uses a Ridge probe model, so the search stays cheap compared to the sweep it sizes.
+    
+    Returns:
+        Smallest tried row budget whose RMSE is within tolerance of the previous size
+    """
+    print("\n----- Searching for a Stable Training Sample Size -----")
+    
+    rows = min(start_rows, row_budget)
+    previous_rmse = None
+    
+    while True:
+        with thread_output():
+            sample, _ = reduce_training_data(train_data, row_budget=rows, random_state=random_state)
+        
+        X = to_model_input(sample.drop(['Artist', 'Track_Count'], axis=1).fillna(0), dtype=feature_dtype)
+        y = sample['Track_Count']
+        folds = min(cv_folds, X.shape[0])
+        if folds < 2:
+            return row_budget
+        
+        probe = Ridge(alpha=1.0, solver='lsqr' if sparse.issparse(X) else 'auto')
+        rmse = np.sqrt(-cross_val_score(probe, X, y, cv=folds, scoring='neg_mean_squared_error')).mean()
+        print(f"  {len(sample)} artists - RMSE: {rmse:.4f}")
+        
+        if previous_rmse is not None and abs(rmse - previous_rmse) <= tolerance * previous_rmse:
+            print(f"RMSE stabilised at {len(sample)} artists")
+            return rows
+        
+        if rows >= row_budget or len(sample) >= len(train_data):
+            return row_budget
+        
+        previous_rmse = rmse
+        rows = min(rows * 2, row_budget)
+
+
+def train_and_evaluate_models(train_data, plan=None, feature_dtype=None):
+    """
+    Train multiple regression models and evaluate their performance
+    
+    Args:
+        train_data: Preprocessed training data with Artist and Track_Count columns
+        plan: Execution plan from plan_execution (None = full sweep of all models)
+        feature_dtype: Train on a contiguous array of this dtype, e.g. np.float32
+            (None = the DataFrame as is). Predict with the same dtype.
+    """
     print("\n----- Training and Evaluating Models -----")
     
+    if plan is None:
+        plan = {'tier': 'full', **EXECUTION_TIERS['full']}
+    
     # Separate features and target
     X = train_data.drop(['Artist', 'Track_Count'], axis=1)
     y = train_data['Track_Count']
     
     # Fill any remaining NaN values
     X = X.fillna(0)
+    feature_names = X.columns
+    X = to_model_input(X, dtype=feature_dtype)
     
     # Initialize models to try
-    models = {
-        'Ridge Regression': Ridge(alpha=1.0),
-        'Lasso Regression': Lasso(alpha=0.1),
-        'Random Forest': RandomForestRegressor(n_estimators=100, random_state=42),
-        'Gradient Boosting': GradientBoostingRegressor(n_estimators=100, random_state=42),
-        'SVR': SVR(kernel='rbf')
-    }
+    models = {name: MODEL_FACTORIES[name]() for name in plan['models']}
+    if sparse.issparse(X) and 'Ridge Regression' in models:
+        # Ridge's default sparse solver (sparse_cg) breaks with recent SciPy releases
+        models['Ridge Regression'].set_params(solver='lsqr')
+    cv_folds = min(plan['cv_folds'], X.shape[0])
     
     # Train and evaluate each model
     results = {}
+    fit_timings = []
     for name, model in models.items():
         print(f"Training {name}...")
         
         # Train with cross-validation
-        cv_scores = cross_val_score(model, X, y, cv=5, scoring='neg_mean_squared_error')
-        rmse_scores = np.sqrt(-cv_scores)
+        if cv_folds >= 2:
+            cv_scores = cross_val_score(model, X, y, cv=cv_folds, scoring='neg_mean_squared_error')
+            rmse_scores = np.sqrt(-cv_scores)
+        else:
+            rmse_scores = np.array([np.nan])
         
         # Train on full dataset for later prediction
+        start = time.perf_counter()
         model.fit(X, y)
+        fit_timings.append((name, X.shape[0], X.shape[1], time.perf_counter() - start))
         
         # Store results
         results[name] = {
             'model': model,
             'cv_rmse_mean': rmse_scores.mean(),
-            'cv_rmse_std': rmse_scores.std()
+            'cv_rmse_std': rmse_scores.std(),
+            'training_rows': X.shape[0],
+            'reduction_ratio': plan.get('reduction', {}).get('reduction_ratio', 1.0)
         }
         
-        print(f"  {name} - RMSE: {rmse_scores.mean():.4f} (±{rmse_scores.std():.4f})")
+        if cv_folds >= 2:
+            print(f"  {name} - RMSE: {rmse_scores.mean():.4f} (±{rmse_scores.std():.4f})")
+    
+    # Feed measured fit times back into the planner's cost model
+    record_fit_timings(fit_timings)
     
-    # Find best model
+    # Find best model (NaN RMSE only happens for the single training-free model)
     best_model_name = min(results, key=lambda k: results[k]['cv_rmse_mean'])
     print(f"\nBest performing model: {best_model_name} with RMSE: {results[best_model_name]['cv_rmse_mean']:.4f}")
     
@@ -55,7 +267,7 @@ def train_and_evaluate_models(train_data):
     if 'Random Forest' in results:
         rf_model = results['Random Forest']['model']
         feature_importance = pd.DataFrame({
-            'Feature': X.columns,
+            'Feature': feature_names,
             'Importance': rf_model.feature_importances_
         }).sort_values('Importance', ascending=False)
         
@@ -65,15 +277,15 @@ def train_and_evaluate_models(train_data):
     return results
 
 
-def predict_and_rank_artists(test_data, model_results):
-    """Predict scores for test artists and rank them"""
+def predict_and_rank_artists(test_data, model_results, feature_dtype=None):
+    """Predict scores for test artists and rank them (use the feature_dtype the models were trained with)"""
     print("\n----- Predicting and Ranking Artists -----")
     
     # Prepare test features
     X_test = test_data.drop(['Artist'], axis=1)
     
     # Fill any remaining NaN values
-    X_test = X_test.fillna(0)
+    X_test = to_model_input(X_test.fillna(0), dtype=feature_dtype)
     
     # Use the best model for prediction
     best_model_name = min(model_results, key=lambda k: model_results[k]['cv_rmse_mean'])
@@ -81,12 +293,10 @@ def predict_and_rank_artists(test_data, model_results):
     
     print(f"Using {best_model_name} for prediction...")
     
-    # Predict scores
-    test_data_copy = test_data.copy()
-    test_data_copy['Predicted_Score'] = best_model.predict(X_test)
-    
-    # Ensure no negative scores
-    test_data_copy['Predicted_Score'] = test_data_copy['Predicted_Score'].clip(lower=0)
+    # Predict scores, ensuring no negative scores. The shallow copy shares the
+    # feature columns with test_data, which is left unchanged.
+    test_data_copy = test_data.copy(deep=False)
+    test_data_copy['Predicted_Score'] = np.clip(best_model.predict(X_test), 0, None)
     
     # Rank artists by predicted score
     ranked_artists = test_data_copy[['Artist', 'Predicted_Score']].sort_values(
@@ -105,18 +315,93 @@ def predict_and_rank_artists(test_data, model_results):
     return ranked_artists, test_data_copy
 
 
-def analyze_artist_overlap(ranked_artists, my_playlist_df, primavera_playlist_df):
-    """Analyze overlap between personal playlist and Primavera artists"""
-    print("\n----- Analyzing Artist Overlap -----")
+def rank_adjusted_scores(predicted_scores, in_my_playlist, overlap_weight=0.3, top_k=None, exclude_known=False):
+    """
+    Blend model scores with playlist overlap and return the top-k order.
+    
+    Uses argpartition so only the top-k slice is sorted, which keeps re-ranking
+    cheap enough to run on every request.
+    
+    Args:
+        predicted_scores: Array of model scores, one per artist
+        in_my_playlist: 0/1 array marking artists already in the personal playlist
+        overlap_weight: Share of the score that comes from playlist overlap (0-1)
+        top_k: Number of artists to return (None = all)
+        exclude_known: Whether to drop artists already in the personal playlist
     
-    # Extract all artists from personal playlist
-    my_artists = set(my_playlist_df['Artist Name(s)'].str.split(', ').explode().unique())
+    Returns:
+        Tuple of (positions into the input arrays in ranked order, adjusted scores at those positions)
+    """
+    predicted_scores = np.asarray(predicted_scores, dtype=float)
+    in_my_playlist = np.asarray(in_my_playlist, dtype=float)
     
-    # Check which Primavera artists are in my playlist
-    ranked_artists['In_My_Playlist'] = ranked_artists['Artist'].apply(
-        lambda x: 1 if x in my_artists else 0
+    # Normalise the overlap bonus by the best model score, as in the full pipeline
+    max_score = predicted_scores.max() if len(predicted_scores) > 0 else 0.0
+    adjusted = (1 - overlap_weight) * predicted_scores + overlap_weight * max_score * in_my_playlist
+    
+    # Restrict candidates if known artists are filtered out
+    if exclude_known:
+        candidates = np.flatnonzero(in_my_playlist == 0)
+    else:
+        candidates = np.arange(len(adjusted))
+    
+    if top_k is None or top_k >= len(candidates):
+        top = candidates
+    elif top_k <= 0:
+        top = candidates[:0]
+    else:
+        top = candidates[np.argpartition(-adjusted[candidates], top_k - 1)[:top_k]]
+    
+    # Sort only the selected slice
+    order = top[np.argsort(-adjusted[top], kind='stable')]
+    
+    return order, adjusted[order]
+
+
+def rerank_artists(score_cache, overlap_weight=0.3, top_k=None, exclude_known=False):
+    """
+    Re-rank artists from cached score vectors without rerunning the pipeline.
+    
+    Args:
+        score_cache: Dict with 'Artist', 'Predicted_Score' and 'In_My_Playlist' arrays
+        overlap_weight: Share of the score that comes from playlist overlap (0-1)
+        top_k: Number of artists to return (None = all)
+        exclude_known: Whether to drop artists already in the personal playlist
+    """
+    order, adjusted = rank_adjusted_scores(
+        score_cache['Predicted_Score'],
+        score_cache['In_My_Playlist'],
+        overlap_weight=overlap_weight,
+        top_k=top_k,
+        exclude_known=exclude_known
     )
     
+    return pd.DataFrame({
+        'Adjusted_Rank': np.arange(1, len(order) + 1),
+        'Artist': score_cache['Artist'][order],
+        'Predicted_Score': score_cache['Predicted_Score'][order],
+        'In_My_Playlist': score_cache['In_My_Playlist'][order].astype(int),
+        'Adjusted_Score': adjusted
+    })
+
+
+def analyze_artist_overlap(ranked_artists, my_playlist_df, primavera_playlist_df, overlap_weight=0.3, vocabulary=None):
+    """Analyze overlap between personal playlist and Primavera artists (returns a new frame, the input is left unchanged)"""
+    print("\n----- Analyzing Artist Overlap -----")
+    
+    if vocabulary is None:
+        vocabulary = Vocabulary()
+    
+    # Mark the artist codes that appear in the personal playlist
+    _, my_artist_codes = vocabulary.artists.encode_lists(my_playlist_df['Artist Name(s)'])
+    in_my_playlist = np.zeros(len(vocabulary.artists) + 1, dtype=bool)
+    in_my_playlist[my_artist_codes] = True
+    
+    # Check which Primavera artists are in my playlist (unknown names map to the trailing False slot)
+    ranked_codes = vocabulary.artists.lookup(ranked_artists['Artist'])
+    ranked_artists = ranked_artists.copy(deep=False)
+    ranked_artists['In_My_Playlist'] = in_my_playlist[ranked_codes].astype(int)
+    
     # Count overlap
     overlap_count = ranked_artists['In_My_Playlist'].sum()
     print(f"Found {overlap_count} Primavera artists in your personal playlist")
@@ -129,27 +414,19 @@ def analyze_artist_overlap(ranked_artists, my_playlist_df, primavera_playlist_df
     
     # Adjust scores based on overlap
     if overlap_count > 0:
-        # Find maximum predicted score for normalization
-        max_score = ranked_artists['Predicted_Score'].max()
-        
-        # Apply weight to overlap (0.5 means 50% of the score comes from model, 50% from playlist overlap)
-        overlap_weight = 0.3  # You can adjust this
-        
+        # overlap_weight of 0.5 means 50% of the score comes from model, 50% from playlist overlap
         print(f"\nAdjusting scores with overlap weight of {overlap_weight:.1f}")
         
-        # Create adjusted score
-        ranked_artists['Adjusted_Score'] = (
-            (1 - overlap_weight) * ranked_artists['Predicted_Score'] + 
-            overlap_weight * max_score * ranked_artists['In_My_Playlist']
+        # Compute adjusted scores and the new order in one vectorized pass
+        order, adjusted = rank_adjusted_scores(
+            ranked_artists['Predicted_Score'].to_numpy(),
+            ranked_artists['In_My_Playlist'].to_numpy(),
+            overlap_weight=overlap_weight
         )
         
-        # Re-rank based on adjusted score
-        ranked_artists = ranked_artists.sort_values(
-            'Adjusted_Score', ascending=False
-        ).reset_index(drop=True)
-        
-        # Update rank
-        ranked_artists['Adjusted_Rank'] = ranked_artists.index + 1
+        ranked_artists = ranked_artists.iloc[order].reset_index(drop=True)
+        ranked_artists['Adjusted_Score'] = adjusted
+        ranked_artists['Adjusted_Rank'] = np.arange(1, len(ranked_artists) + 1)
         
         print("\nTop 20 artists after adjustment:")
         print(ranked_artists[['Adjusted_Rank', 'Artist', 'Predicted_Score', 
@@ -0,0 +1,222 @@
+import os
+import json
+import threading
+from contextlib import contextmanager
+import numpy as np
+
+from src.utils import open_atomic, USER_CACHE_DIR
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Recorded fit timings live in the user's cache folder, outside the source tree.
+# Set STAGE_TIMINGS_PATH to share one file between the workers of a deployment.
+DEFAULT_TIMINGS_PATH = os.environ.get('STAGE_TIMINGS_PATH') or os.path.join(USER_CACHE_DIR, 'stage_timings.json')
+
+# Models and cross-validation folds used by each execution tier
+EXECUTION_TIERS = {
+    'similarity': {
+        'models': ['Taste Similarity'],
+        'cv_folds': 0
+    },
+    'reduced': {
+        'models': ['Ridge Regression', 'Lasso Regression', 'Random Forest'],
+        'cv_folds': 3
+    },
+    'full': {
+        'models': ['Ridge Regression', 'Lasso Regression', 'Random Forest', 'Gradient Boosting', 'SVR'],
+        'cv_folds': 5
+    }
+}
+
+# Below this many artists there is too little data to train and cross-validate models
+MIN_TRAINING_ARTISTS = 10
+
+# Below this many artists 5-fold CV of five models is too noisy to be worth its cost
+MIN_FULL_SWEEP_ARTISTS = 50
+
+DEFAULT_TIME_BUDGET = 20.0  # seconds
+
+# Fit cost prior per model: seconds = overhead + coefficient * rows ** exponent * features
+# Calibrated from recorded timings once enough fits have been seen
+COST_PRIORS = {
+    'Taste Similarity': {'overhead': 0.0005, 'coefficient': 1e-8, 'exponent': 1.0},
+    'Ridge Regression': {'overhead': 0.002, 'coefficient': 2e-8, 'exponent': 1.0},
+    'Lasso Regression': {'overhead': 0.004, 'coefficient': 3e-7, 'exponent': 1.0},
+    'Random Forest': {'overhead': 0.08, 'coefficient': 2.5e-6, 'exponent': 1.2},
+    'Gradient Boosting': {'overhead': 0.05, 'coefficient': 5e-6, 'exponent': 1.0},
+    'SVR': {'overhead': 0.001, 'coefficient': 1.5e-10, 'exponent': 2.0}
+}
+
+MIN_CALIBRATION_RECORDS = 3
+MAX_RECORDS_PER_MODEL = 50
+
+_timings_lock = threading.Lock()
+# Timings per path, with the file mtime they were read at
+_timings_cache = {}
+
+
+def _read_timings(path):
+    timings = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                timings = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Ignoring unreadable timings file {path}: {e}")
+    return timings
+
+
+def _load_timings(path):
+    """Recorded timings, re-read when another process has updated the file"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    cached = _timings_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, _read_timings(path))
+        _timings_cache[path] = cached
+    return cached[1]
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock across processes on path + '.lock' (only within this process where fcntl is unavailable)"""
+    with open(path + '.lock', 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def record_fit_timings(fit_timings, timings_path=DEFAULT_TIMINGS_PATH):
+    """
+    Record measured model fit times to calibrate the cost model.
+    
+    The file is re-read and merged under a file lock, so processes sharing it
+    (e.g. gunicorn workers or parallel CLI runs) do not overwrite each other's timings.
+    
+    Args:
+        fit_timings: List of (model name, rows, features, seconds) tuples
+        timings_path: JSON file holding the recorded timings
+    """
+    with _timings_lock:
+        try:
+            os.makedirs(os.path.dirname(timings_path) or '.', exist_ok=True)
+            with _file_lock(timings_path):
+                timings = _read_timings(timings_path)
+                for name, rows, features, seconds in fit_timings:
+                    records = timings.setdefault(name, [])
+                    records.append([int(rows), int(features), float(seconds)])
+                    del records[:-MAX_RECORDS_PER_MODEL]
+                
+                with open_atomic(timings_path, 'w') as f:
+                    json.dump(timings, f)
+                _timings_cache[timings_path] = (os.path.getmtime(timings_path), timings)
+        except OSError as e:
+            print(f"Warning: Could not save timings to {timings_path}: {e}")
+
+
+def estimate_fit_seconds(model_name, rows, features, timings_path=DEFAULT_TIMINGS_PATH):
+    """Estimate the time to fit one model, using recorded timings when available"""
+    prior = COST_PRIORS[model_name]
+    work = max(rows, 1) ** prior['exponent'] * max(features, 1)
+    
+    with _timings_lock:
+        records = list(_load_timings(timings_path).get(model_name, []))
+    
+    coefficient = prior['coefficient']
+    if len(records) >= MIN_CALIBRATION_RECORDS:
+        # Median of observed coefficients is robust to the odd slow fit
+        observed = [
+            max(seconds - prior['overhead'], 0) / (max(r, 1) ** prior['exponent'] * max(f, 1))
+            for r, f, seconds in records
+        ]
+        coefficient = float(np.median(observed))
+    
+    return prior['overhead'] + coefficient * work
+
+
+def estimate_tier_seconds(tier, rows, features, timings_path=DEFAULT_TIMINGS_PATH):
+    """Estimate the cost of a tier: k cross-validation fits plus the final fit per model"""
+    folds = EXECUTION_TIERS[tier]['cv_folds']
+    total = 0.0
+    for model_name in EXECUTION_TIERS[tier]['models']:
+        total += estimate_fit_seconds(model_name, rows, features, timings_path)
+        if folds > 1:
+            cv_rows = rows * (folds - 1) // folds
+            total += folds * estimate_fit_seconds(model_name, cv_rows, features, timings_path)
+    return total
+
+
+def plan_execution(train_data, time_budget=DEFAULT_TIME_BUDGET, tier=None, reduction=None,
+                   timings_path=DEFAULT_TIMINGS_PATH):
+    """
+    Pick an execution tier for training from the size and shape of the training data.
+    
+    - similarity: too few artists (or no variation in the target) to train models,
+      so artists are scored by similarity to the listener's taste profile
+    - reduced: fewer models and folds for small inputs or when the full sweep would
+      exceed the time budget
+    - full: all five models with 5-fold CV
+    
+    Args:
+        train_data: Preprocessed training data with Artist and Track_Count columns
+        time_budget: Target training time in seconds
+        tier: Force a tier instead of choosing one (None = automatic)
+        reduction: Training set reduction info from reduce_training_data, kept with the plan
+        timings_path: JSON file with recorded timings for cost estimates
+    
+    Returns:
+        Dict with the chosen tier, its models and CV folds, the reason and estimated cost
+    """
+    print("\n----- Planning Model Training -----")
+    
+    rows = len(train_data)
+    features = train_data.shape[1] - 2
+    target = train_data['Track_Count'].to_numpy(dtype=float)
+    target_variance = float(target.var()) if rows > 0 else 0.0
+    
+    if tier is not None:
+        reason = "requested explicitly"
+    elif rows < MIN_TRAINING_ARTISTS:
+        tier = 'similarity'
+        reason = f"only {rows} artists (< {MIN_TRAINING_ARTISTS}) to train on"
+    elif target_variance == 0:
+        tier = 'similarity'
+        reason = "every artist has the same track count, so there is nothing to learn"
+    elif rows < MIN_FULL_SWEEP_ARTISTS:
+        tier = 'reduced'
+        reason = f"{rows} artists (< {MIN_FULL_SWEEP_ARTISTS}) are too few to separate five models"
+    else:
+        full_seconds = estimate_tier_seconds('full', rows, features, timings_path)
+        if full_seconds <= time_budget:
+            tier = 'full'
+            reason = f"full sweep estimated at {full_seconds:.1f}s fits the {time_budget:.0f}s budget"
+        else:
+            tier = 'reduced'
+            reason = f"full sweep estimated at {full_seconds:.1f}s exceeds the {time_budget:.0f}s budget"
+    
+    plan = {
+        'tier': tier,
+        'models': EXECUTION_TIERS[tier]['models'],
+        # Never use more folds than there are artists
+        'cv_folds': min(EXECUTION_TIERS[tier]['cv_folds'], rows),
+        'reason': reason,
+        'estimated_seconds': estimate_tier_seconds(tier, rows, features, timings_path),
+        'rows': rows,
+        'features': features,
+        'target_variance': target_variance,
+        'reduction': reduction or {'original_rows': rows, 'rows': rows, 'reduction_ratio': 1.0}
+    }
+    
+    print(f"Training data: {rows} artists x {features} features, target variance {target_variance:.3f}")
+    print(f"Selected '{tier}' tier ({reason}); estimated training time {plan['estimated_seconds']:.1f}s")
+    
+    return plan
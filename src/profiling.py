@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import marshal
+import cProfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from src.utils import open_atomic, write_file_atomic
+
+PROFILE_MODES = ('sampling', 'cprofile')
+PROFILE_EXTENSIONS = {'sampling': '.collapsed', 'cprofile': '.prof'}
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    Low-overhead statistical profiler for one thread.
+    
+    A background thread records the target thread's call stack every
+    `interval` seconds. Stacks are aggregated per function and written in
+    collapsed format ("outer;inner;leaf count"), as used by flame graph tools.
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self):
+        """Collapsed stacks, most frequent first"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+@contextmanager
+def profile_request(mode, output_dir, metadata=None):
+    """
+    Profile the enclosed block and save the profile with its metadata.
+    
+    Writes <timestamp>-<mode>.collapsed (sampling) or .prof (cProfile, readable
+    with pstats or snakeviz) plus a .json file with the metadata, duration and
+    sample count. The metadata dict may be filled in while the block runs,
+    e.g. with input sizes.
+    
+    Args:
+        mode: 'sampling', 'cprofile' or None (no profiling)
+        output_dir: Folder to save the profile to
+        metadata: Dict saved alongside the profile
+    """
+    if mode is None:
+        yield
+        return
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+    
+    metadata = metadata if metadata is not None else {}
+    started_at = time.time()
+    start = time.perf_counter()
+    
+    if mode == 'sampling':
+        profiler = SamplingProfiler().start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        duration = time.perf_counter() - start
+        if mode == 'sampling':
+            profiler.stop()
+        else:
+            profiler.disable()
+        
+        try:
+            _save_profile(profiler, mode, output_dir, started_at, {
+                **metadata,
+                'mode': mode,
+                'started_at': started_at,
+                'duration_seconds': round(duration, 4),
+                'failed': failed,
+                'samples': profiler.samples if mode == 'sampling' else None
+            })
+        except OSError as e:
+            print(f"Warning: Could not save profile to {output_dir}: {e}")
+
+
+def _save_profile(profiler, mode, output_dir, started_at, metadata):
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(started_at)) + f"-{int(started_at * 1e6) % 1000000:06d}"
+    base_path = os.path.join(output_dir, f"{stamp}-{mode}")
+    
+    if mode == 'sampling':
+        write_file_atomic(base_path + PROFILE_EXTENSIONS[mode], profiler.collapsed())
+    else:
+        # What Profile.dump_stats writes, but through a temporary file
+        profiler.create_stats()
+        with open_atomic(base_path + PROFILE_EXTENSIONS[mode], 'wb') as f:
+            marshal.dump(profiler.stats, f)
+    
+    # Metadata last, so a listed profile always has its data file
+    write_file_atomic(base_path + '.json', json.dumps(metadata, indent=2))
+    print(f"Saved {mode} profile to {base_path + PROFILE_EXTENSIONS[mode]}")
+
+
+def list_profiles(profile_dir):
+    """Metadata of the profiles in a folder, newest first"""
+    profiles = []
+    try:
+        entries = list(os.scandir(profile_dir))
+    except FileNotFoundError:
+        return profiles
+    
+    for entry in entries:
+        if not entry.name.endswith('.json'):
+            continue
+        try:
+            with open(entry.path, 'r') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            continue
+        
+        base = entry.name[:-len('.json')]
+        profile_file = base + PROFILE_EXTENSIONS.get(metadata.get('mode'), '')
+        if os.path.exists(os.path.join(profile_dir, profile_file)):
+            profiles.append({**metadata, 'file': profile_file})
+    
+    return sorted(profiles, key=lambda p: p.get('started_at', 0), reverse=True)
@@ -0,0 +1,245 @@
+import bisect
+import heapq
+import pandas as pd
+
+
+TIMETABLE_COLUMNS = ['Artist', 'Stage', 'Day', 'Start', 'End']
+
+
+def _parse_clock(value, day_start_hour):
+    """Convert an 'HH:MM' set time into minutes since the start of the festival day"""
+    hours, minutes = str(value).strip().split(':')[:2]
+    total = int(hours) * 60 + int(minutes)
+    
+    # Sets after midnight belong to the previous festival day
+    if total < day_start_hour * 60:
+        total += 24 * 60
+    return total
+
+
+def load_timetable(timetable, day_start_hour=6):
+    """
+    Load and normalise a festival timetable.
+    
+    Args:
+        timetable: Path to a timetable CSV or a DataFrame with Artist, Stage, Day, Start and End columns
+        day_start_hour: Hour at which a new festival day starts (earlier sets count as the previous night)
+    
+    Returns:
+        DataFrame with Start_Minute and End_Minute columns relative to the festival day
+    """
+    if isinstance(timetable, pd.DataFrame):
+        df = timetable.copy()
+    else:
+        df = pd.read_csv(timetable)
+    
+    # Accept any capitalisation of the column names
+    df = df.rename(columns={col: col.strip().title() for col in df.columns})
+    
+    missing_columns = [col for col in TIMETABLE_COLUMNS if col not in df.columns]
+    if missing_columns:
+        raise ValueError(f"Timetable is missing columns: {', '.join(missing_columns)}")
+    
+    df = df.dropna(subset=TIMETABLE_COLUMNS)
+    df['Artist'] = df['Artist'].astype(str).str.strip()
+    df['Stage'] = df['Stage'].astype(str).str.strip()
+    df['Day'] = df['Day'].astype(str).str.strip()
+    
+    df['Start_Minute'] = [_parse_clock(v, day_start_hour) for v in df['Start']]
+    df['End_Minute'] = [_parse_clock(v, day_start_hour) for v in df['End']]
+    
+    # Sets that run past midnight end on the next calendar day
+    overnight = df['End_Minute'] <= df['Start_Minute']
+    df.loc[overnight, 'End_Minute'] += 24 * 60
+    
+    return df.reset_index(drop=True)
+
+
+def load_walking_times(walking_times_path):
+    """
+    Load a stage-to-stage walking time matrix (minutes).
+    
+    The CSV has stage names in the first column and as the header row.
+    
+    Returns:
+        Dict mapping (from_stage, to_stage) to minutes
+    """
+    matrix = pd.read_csv(walking_times_path, index_col=0)
+    matrix.index = matrix.index.astype(str).str.strip()
+    matrix.columns = matrix.columns.astype(str).str.strip()
+    
+    return {
+        (from_stage, to_stage): float(minutes)
+        for from_stage, row in matrix.iterrows()
+        for to_stage, minutes in row.items()
+        if pd.notna(minutes)
+    }
+
+
+def _best_plans(starts, ends, stages, weights, walking_times, default_transfer, k):
+    """
+    Weighted interval scheduling with stage transfer times, keeping the k best maximal plans.
+    
+    A plan is maximal when no other set fits before, between or after its sets.
+    Without that, the runners-up would just be the best plan with sets left out.
+    
+    Sets are processed in order of end time. A set's predecessors on a stage are
+    the sets ending early enough to walk over in time (one binary search) but
+    late enough that no other set fits in between (a second binary search over
+    per-stage suffix minima of end times). With the usual one-set-at-a-time
+    stages only a few predecessors qualify, so this stays O(n log^2 n) for a
+    fixed number of stages and k.
+    
+    Returns:
+        List of (total_weight, [set positions]) sorted best first
+    """
+    stage_names = sorted(set(stages))
+    
+    def transfer(from_stage, to_stage):
+        if from_stage is None:
+            return 0
+        if from_stage == to_stage:
+            return walking_times.get((from_stage, to_stage), 0)
+        return walking_times.get((from_stage, to_stage), default_transfer)
+    
+    # Per stage: set start times in order, and the earliest end among the sets starting at or after each
+    stage_starts = {}
+    earliest_end_from = {}
+    for stage in stage_names:
+        by_start = sorted((starts[i], ends[i]) for i in range(len(starts)) if stages[i] == stage)
+        stage_starts[stage] = [start for start, _ in by_start]
+        suffix_min = [float('inf')] * (len(by_start) + 1)
+        for m in range(len(by_start) - 1, -1, -1):
+            suffix_min[m] = min(suffix_min[m + 1], by_start[m][1])
+        earliest_end_from[stage] = suffix_min
+    
+    def set_fits_between(prev_end, prev_stage, next_start, next_stage):
+        """Whether any set fits after a set ending at prev_end (or from the start of the day) and before next_start"""
+        for stage in stage_names:
+            m = bisect.bisect_left(stage_starts[stage], prev_end + transfer(prev_stage, stage))
+            if earliest_end_from[stage][m] + transfer(stage, next_stage) <= next_start:
+                return True
+        return False
+    
+    def set_fits_after(prev_end, prev_stage):
+        return any(
+            stage_starts[stage] and stage_starts[stage][-1] >= prev_end + transfer(prev_stage, stage)
+            for stage in stage_names
+        )
+    
+    order = sorted(range(len(starts)), key=lambda i: ends[i])
+    
+    # Sets seen so far on every stage, with their end times (both in end order)
+    stage_sets = {stage: [] for stage in stage_names}
+    stage_ends = {stage: [] for stage in stage_names}
+    # best[j] = top-k (value, predecessor set, predecessor alternative) for gap-free plans ending with set j
+    best = {}
+    
+    for j in order:
+        candidates = []
+        if not set_fits_between(float('-inf'), None, starts[j], stages[j]):
+            candidates.append((weights[j], None, None))
+        
+        for stage in stage_names:
+            # Last set on this stage that ends early enough to walk over in time
+            m = bisect.bisect_right(stage_ends[stage], starts[j] - transfer(stage, stages[j])) - 1
+            if m < 0:
+                continue
+            
+            # First of those with no other set fitting in between (later sets leave less room)
+            lo, hi = 0, m + 1
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if set_fits_between(stage_ends[stage][mid], stage, starts[j], stages[j]):
+                    lo = mid + 1
+                else:
+                    hi = mid
+            
+            for i in stage_sets[stage][lo:m + 1]:
+                for alt, (value, _, _) in enumerate(best[i]):
+                    candidates.append((value + weights[j], i, alt))
+        
+        best[j] = heapq.nlargest(k, candidates, key=lambda c: c[0])
+        stage_sets[stages[j]].append(j)
+        stage_ends[stages[j]].append(ends[j])
+    
+    # The best plans end with a set after which nothing else fits
+    final = heapq.nlargest(
+        k,
+        (
+            (value, j, alt)
+            for j in best if not set_fits_after(ends[j], stages[j])
+            for alt, (value, _, _) in enumerate(best[j])
+        ),
+        key=lambda c: c[0]
+    )
+    
+    plans = []
+    for value, j, alt in final:
+        chain = []
+        while j is not None:
+            chain.append(j)
+            _, j, alt = best[j][alt]
+        plans.append((value, chain[::-1]))
+    
+    return plans
+
+
+def optimize_festival_schedule(timetable, ranked_artists, walking_times=None, k=1, default_transfer=0):
+    """
+    Build the best clash-free plan for each festival day.
+    
+    Args:
+        timetable: DataFrame from load_timetable
+        ranked_artists: Ranked artists with Adjusted_Score or Predicted_Score
+        walking_times: Dict of (from_stage, to_stage) -> minutes (None = no transfer time)
+        k: Number of alternative plans to return per day
+        default_transfer: Minutes between different stages missing from walking_times
+    
+    Returns:
+        DataFrame with one row per set: Day, Plan, Total_Score, Start, End, Stage, Artist, Score
+    """
+    print("\n----- Optimizing Festival Schedule -----")
+    
+    walking_times = walking_times or {}
+    score_col = 'Adjusted_Score' if 'Adjusted_Score' in ranked_artists.columns else 'Predicted_Score'
+    scores = dict(zip(ranked_artists['Artist'], ranked_artists[score_col]))
+    
+    sets = timetable.copy()
+    sets['Score'] = sets['Artist'].map(scores).fillna(0.0)
+    
+    # Only recommended artists are worth a slot in the plan
+    sets = sets[sets['Score'] > 0]
+    print(f"Matched {sets['Artist'].nunique()} recommended artists to {len(sets)} timetable slots")
+    
+    rows = []
+    for day, day_sets in sets.groupby('Day', sort=False):
+        day_sets = day_sets.reset_index(drop=True)
+        plans = _best_plans(
+            day_sets['Start_Minute'].tolist(),
+            day_sets['End_Minute'].tolist(),
+            day_sets['Stage'].tolist(),
+            day_sets['Score'].tolist(),
+            walking_times,
+            default_transfer,
+            k
+        )
+        
+        for plan_number, (total_score, positions) in enumerate(plans, start=1):
+            for pos in positions:
+                set_row = day_sets.iloc[pos]
+                rows.append({
+                    'Day': day,
+                    'Plan': plan_number,
+                    'Total_Score': total_score,
+                    'Start': set_row['Start'],
+                    'End': set_row['End'],
+                    'Stage': set_row['Stage'],
+                    'Artist': set_row['Artist'],
+                    'Score': set_row['Score']
+                })
+        
+        if plans:
+            print(f"{day}: best plan covers {len(plans[0][1])} sets with total score {plans[0][0]:.2f}")
+    
+    return pd.DataFrame(rows, columns=['Day', 'Plan', 'Total_Score', 'Start', 'End', 'Stage', 'Artist', 'Score'])
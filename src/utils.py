@@ -1,40 +1,376 @@
+import io
 import os
+import sys
+import stat
 import json
+import hashlib
+import tempfile
+import heapq
+import threading
+from collections import OrderedDict
+from functools import partial
+from contextlib import contextmanager
+import numpy as np
 import pandas as pd
 
-def save_results(ranked_artists, output_dir="./results"):
-    """Save the ranked artists to CSV and JSON files"""
+def _read_umask():
+    # os.umask can only be read by setting it, so do it once at import rather than per write
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+_UMASK = _read_umask()
+
+# Per-user folder for data kept between runs (fit timings, Spotify lookups), outside the source tree
+USER_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'primavera-companion'
+)
+
+
+@contextmanager
+def open_atomic(path, mode='w'):
+    """
+    Open a temporary file in the same directory as path for writing, and move
+    it over path once the block succeeds, so readers never see a partial file.
+    
+    The file keeps the permissions of the file it replaces, or gets the usual
+    permissions of a new file (0666 minus the umask) rather than mkstemp's 0600.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, **({} if 'b' in mode else {'encoding': 'utf-8'})) as f:
+            yield f
+        try:
+            permissions = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            permissions = 0o666 & ~_UMASK
+        os.chmod(tmp_path, permissions)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def write_file_atomic(path, data):
+    """Write bytes or text via a temporary file in the same directory, so readers never see a partial file"""
+    with open_atomic(path, 'wb') as f:
+        f.write(data.encode('utf-8') if isinstance(data, str) else data)
+
+
+_thread_output = threading.local()
+_stdout_lock = threading.Lock()
+
+
+class _ThreadLocalStdout:
+    """Stand-in for sys.stdout that sends each thread's output to the stream set by thread_output"""
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+
+    def _stream(self):
+        stream = getattr(_thread_output, 'stream', None)
+        return self.stdout if stream is None else stream
+
+    def write(self, text):
+        return self._stream().write(text)
+
+    def flush(self):
+        self._stream().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stdout, name)
+
+
+@contextmanager
+def thread_output(stream=None):
+    """
+    Redirect print output of the current thread only.
+    
+    Unlike contextlib.redirect_stdout, which swaps sys.stdout for the whole
+    process, other threads keep printing where they did, so pipelines running
+    on parallel threads can each keep their own log.
+    
+    Args:
+        stream: Text stream to write to (None = discard the output)
+    """
+    with _stdout_lock:
+        if not isinstance(sys.stdout, _ThreadLocalStdout):
+            sys.stdout = _ThreadLocalStdout(sys.stdout)
+    
+    previous = getattr(_thread_output, 'stream', None)
+    _thread_output.stream = io.StringIO() if stream is None else stream
+    try:
+        yield _thread_output.stream
+    finally:
+        _thread_output.stream = previous
+
+
+# Rows serialized per chunk by the streaming result writers
+RESULT_CHUNK_ROWS = 10000
+
+
+def _record_chunks(ranked_artists):
+    """JSON records of the ranked artists in chunks, without the enclosing brackets"""
+    for start in range(0, len(ranked_artists), RESULT_CHUNK_ROWS):
+        chunk = ranked_artists.iloc[start:start + RESULT_CHUNK_ROWS]
+        yield chunk.to_json(orient='records', double_precision=15)[1:-1]
+
+
+def _write_json(ranked_artists, f, document, indent=None):
+    if indent is not None:
+        # Indented output keeps the layout earlier releases wrote
+        json.dump({'artists': ranked_artists.to_dict(orient="records"), **document}, f, indent=indent)
+        return
+    
+    f.write('{"artists":[')
+    for i, records in enumerate(_record_chunks(ranked_artists)):
+        f.write(',' + records if i else records)
+    f.write(']')
+    for key, value in document.items():
+        f.write(',' + json.dumps(key) + ':' + json.dumps(value, separators=(',', ':')))
+    f.write('}')
+
+
+def _write_ndjson(ranked_artists, f, document):
+    for start in range(0, len(ranked_artists), RESULT_CHUNK_ROWS):
+        chunk = ranked_artists.iloc[start:start + RESULT_CHUNK_ROWS]
+        f.write(chunk.to_json(orient='records', lines=True, double_precision=15).rstrip('\n') + '\n')
+
+
+def _write_parquet(ranked_artists, f, document):
+    ranked_artists.to_parquet(f, index=False)
+
+
+# Result formats: (file name, file mode, writer). Formats without the metadata in
+# the file itself get a ranked_artists.meta.json sidecar.
+RESULT_FORMATS = {
+    'json': ('ranked_artists.json', 'w', partial(_write_json, indent=2)),
+    'compact-json': ('ranked_artists.json', 'w', _write_json),
+    'ndjson': ('ranked_artists.ndjson', 'w', _write_ndjson),
+    'parquet': ('ranked_artists.parquet', 'wb', _write_parquet)
+}
+RESULT_METADATA_FILENAME = "ranked_artists.meta.json"
+
+
+def check_result_format(output_format):
+    """Raise if results cannot be written in a format (unknown, or Parquet without an engine)"""
+    if output_format not in RESULT_FORMATS:
+        raise ValueError(f"Unknown result format: {output_format}")
+    if output_format == 'parquet':
+        from pandas.io.parquet import get_engine
+        try:
+            get_engine('auto')
+        except ImportError:
+            raise ImportError("pyarrow or fastparquet is required for Parquet results. Install one with 'pip install pyarrow'.")
+
+
+def write_results(ranked_artists, output_dir, output_format='json', metadata=None):
+    """
+    Write the ranked artists in one of the RESULT_FORMATS, atomically.
+    
+    'json' is an indented document with the artists and metadata, 'compact-json'
+    the same document without whitespace, streamed in chunks of records (with
+    scores to 15 significant digits, the most pandas' JSON writer supports).
+    'ndjson' (one artist per line) and 'parquet' keep the metadata in a
+    ranked_artists.meta.json sidecar.
+    
+    Args:
+        ranked_artists: Ranked artists DataFrame
+        output_dir: Folder to write to
+        output_format: Key of RESULT_FORMATS
+        metadata: Extra run metadata (a 'timestamp' entry overrides the current time)
+    
+    Returns:
+        Path of the results file
+    """
+    check_result_format(output_format)
+    
+    filename, mode, writer = RESULT_FORMATS[output_format]
+    results_path = os.path.join(output_dir, filename)
+    document = {'timestamp': pd.Timestamp.now().isoformat(), **(metadata or {})}
+    
+    with open_atomic(results_path, mode) as f:
+        writer(ranked_artists, f, document)
+    
+    if output_format in ('ndjson', 'parquet'):
+        write_file_atomic(
+            os.path.join(output_dir, RESULT_METADATA_FILENAME),
+            json.dumps({'rows': len(ranked_artists), 'format': output_format, **document}, indent=2)
+        )
+    
+    return results_path
+
+
+def save_results(ranked_artists, output_dir="./results", metadata=None, output_format='json'):
+    """
+    Save the ranked artists to CSV and a results file, with optional run metadata.
+    
+    Args:
+        ranked_artists: Ranked artists DataFrame
+        output_dir: Folder to save to
+        metadata: Extra run metadata stored with the results
+        output_format: Format of the results file (see RESULT_FORMATS)
+    
+    Returns:
+        Tuple of (CSV path, results file path)
+    """
     # Create output directory if it doesn't exist
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
     
     # Save to CSV
     csv_path = os.path.join(output_dir, "ranked_artists.csv")
-    ranked_artists.to_csv(csv_path, index=False)
+    with open_atomic(csv_path, 'w') as f:
+        ranked_artists.to_csv(f, index=False)
+    
+    results_path = write_results(ranked_artists, output_dir, output_format=output_format, metadata=metadata)
+    
+    print(f"Results saved to {csv_path} and {results_path}")
+    
+    return csv_path, results_path
+
+
+SCORE_CACHE_FILENAME = "scores.npz"
+
+
+def save_score_cache(ranked_artists, output_dir="./results"):
+    """Cache the score vectors needed to re-rank results without rerunning the pipeline"""
+    os.makedirs(output_dir, exist_ok=True)
+    
+    cache_path = os.path.join(output_dir, SCORE_CACHE_FILENAME)
+    
+    if 'In_My_Playlist' in ranked_artists.columns:
+        in_my_playlist = ranked_artists['In_My_Playlist'].to_numpy(dtype=np.int8)
+    else:
+        in_my_playlist = np.zeros(len(ranked_artists), dtype=np.int8)
+    
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        Artist=ranked_artists['Artist'].to_numpy(dtype=str),
+        Predicted_Score=ranked_artists['Predicted_Score'].to_numpy(dtype=np.float64),
+        In_My_Playlist=in_my_playlist
+    )
+    write_file_atomic(cache_path, buffer.getvalue())
+    
+    return cache_path
+
+
+# Parsed score caches and result documents kept in memory per worker
+LOADED_FILE_CACHE_SIZE = 32
+
+
+class _LoadedFileCache:
+    """
+    Parsed files, least recently used dropped first.
+    
+    Entries are keyed on fstat of the opened file, so the key always describes
+    the contents that were parsed, even if the file is replaced concurrently.
+    """
+
+    def __init__(self, parse, maxsize=LOADED_FILE_CACHE_SIZE):
+        self.parse = parse
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            key = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    return self._entries[key]
+            value = self.parse(f)
+        
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+
+def _parse_score_cache(f):
+    with np.load(f) as data:
+        return {key: data[key] for key in data.files}
+
+
+_score_caches = _LoadedFileCache(_parse_score_cache)
+
+
+def load_score_cache(output_dir):
+    """Load cached score vectors for a results directory (None if not cached)"""
+    cache_path = os.path.join(output_dir, SCORE_CACHE_FILENAME)
+    if not os.path.exists(cache_path):
+        return None
     
-    # Save to JSON (more convenient for web display)
-    json_path = os.path.join(output_dir, "ranked_artists.json")
+    # The in-memory cache is keyed on the file version, so a rerun of the pipeline is picked up
+    return _score_caches.load(cache_path)
+
+
+def _parse_results(f):
+    raw = f.read()
+    return json.loads(raw), hashlib.sha256(raw).hexdigest()
+
+
+_result_documents = _LoadedFileCache(_parse_results)
+
+
+def load_results(json_path):
+    """
+    Load a saved ranked_artists.json together with a hash of its contents.
     
-    # Convert to a format suitable for web display
-    json_data = {
-        "artists": ranked_artists.to_dict(orient="records"),
-        "timestamp": pd.Timestamp.now().isoformat()
+    Parsed results are cached in memory per file version, so repeated polling
+    of the same session does not re-read the file from disk.
+    
+    Returns:
+        Tuple of (results dict, hex SHA-256 of the file contents)
+    """
+    return _result_documents.load(json_path)
+
+
+def get_training_summary(plan):
+    """Summary of how the models were trained, stored alongside the results"""
+    return {
+        'tier': plan['tier'],
+        'models': plan['models'],
+        'cv_folds': plan['cv_folds'],
+        'training_rows': plan['reduction']['rows'],
+        'original_rows': plan['reduction']['original_rows'],
+        'reduction_ratio': plan['reduction']['reduction_ratio']
     }
+
+
+def get_chart_data(artists, top_n=30):
+    """
+    Build the compact payload for the client-side top artists chart.
     
-    with open(json_path, 'w') as f:
-        json.dump(json_data, f, indent=2)
+    Args:
+        artists: List of artist records as stored in ranked_artists.json
+        top_n: Number of top artists to include
     
-    print(f"Results saved to {csv_path} and {json_path}")
+    Returns:
+        Dict of parallel 'artists', 'scores' and 'in_playlist' lists, best match first
+    """
+    # Use the adjusted ranking if available, otherwise the model ranking
+    top_artists = heapq.nsmallest(
+        top_n, artists, key=lambda a: a.get('Adjusted_Rank', a['Rank'])
+    )
     
-    return csv_path, json_path
+    return {
+        'artists': [a['Artist'] for a in top_artists],
+        'scores': [round(a.get('Adjusted_Score', a['Predicted_Score']), 4) for a in top_artists],
+        'in_playlist': [int(a.get('In_My_Playlist', 0)) for a in top_artists]
+    }
 
 
 def create_html_result(ranked_artists, output_path="./results/recommendations.html"):
     """Create a standalone HTML file with the recommendations"""
     # Create output directory if it doesn't exist
     output_dir = os.path.dirname(output_path)
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    os.makedirs(output_dir or '.', exist_ok=True)
     
     # Get top 50 artists
     top_artists = ranked_artists.head(50).copy()
@@ -154,8 +490,7 @@ def create_html_result(ranked_artists, output_path="./results/recommendations.ht
     """
     
     # Write to file
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    write_file_atomic(output_path, html_content)
     
     print(f"HTML result saved to {output_path}")
     
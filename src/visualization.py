@@ -1,12 +1,18 @@
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.patches import Rectangle
 import os
 from io import BytesIO
 import base64
 
-def plot_artist_distribution(ranked_artists, top_n=30, output_dir="./results"):
-    """Create a horizontal bar chart of the top artists and their scores"""
-    plt.figure(figsize=(10, 8))
+# Charts are drawn on explicit Figure objects rather than the global pyplot
+# state, so requests can render them from several threads at once.
+
+
+def _top_artists_figure(ranked_artists, top_n=30):
+    """Horizontal bar chart of the top artists and their scores"""
+    fig = Figure(figsize=(10, 8))
+    ax = fig.add_subplot()
     
     # Select the column to use (adjusted score if available, otherwise predicted score)
     score_col = 'Adjusted_Score' if 'Adjusted_Score' in ranked_artists.columns else 'Predicted_Score'
@@ -16,35 +22,40 @@ def plot_artist_distribution(ranked_artists, top_n=30, output_dir="./results"):
     top_artists = ranked_artists.sort_values(rank_col).head(top_n)
     
     # Create horizontal bar chart
-    bars = plt.barh(
-        top_artists['Artist'], 
+    ax.barh(
+        top_artists['Artist'],
         top_artists[score_col],
-        color=['#e63946' if in_playlist else '#457b9d' 
+        color=['#e63946' if in_playlist else '#457b9d'
                for in_playlist in top_artists.get('In_My_Playlist', [0] * len(top_artists))]
     )
     
     # Add labels and title
-    plt.xlabel('Match Score')
-    plt.title(f'Top {top_n} Recommended Artists for Primavera Sound')
-    plt.gca().invert_yaxis()  # To have rank 1 at the top
+    ax.set_xlabel('Match Score')
+    ax.set_title(f'Top {top_n} Recommended Artists for Primavera Sound')
+    ax.invert_yaxis()  # To have rank 1 at the top
     
     # Add a legend if we have the in-playlist information
     if 'In_My_Playlist' in top_artists.columns:
-        plt.legend(
-            [plt.Rectangle((0, 0), 1, 1, color='#e63946'), 
-             plt.Rectangle((0, 0), 1, 1, color='#457b9d')],
+        ax.legend(
+            [Rectangle((0, 0), 1, 1, color='#e63946'),
+             Rectangle((0, 0), 1, 1, color='#457b9d')],
             ['In Your Playlist', 'New Discovery']
         )
     
-    plt.tight_layout()
+    fig.tight_layout()
+    return fig
+
+
+def plot_artist_distribution(ranked_artists, top_n=30, output_dir="./results"):
+    """Create a horizontal bar chart of the top artists and their scores"""
+    fig = _top_artists_figure(ranked_artists, top_n)
     
     # Create output directory if it doesn't exist
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
     
     # Save figure
     output_path = os.path.join(output_dir, 'artist_recommendations.png')
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    fig.savefig(output_path, dpi=300, bbox_inches='tight')
     
     print(f"Chart saved to {output_path}")
     
@@ -53,46 +64,15 @@ def plot_artist_distribution(ranked_artists, top_n=30, output_dir="./results"):
 
 def get_graph_as_base64(ranked_artists, top_n=30):
     """Generate a base64 encoded image of the top artists graph for web embedding"""
-    plt.figure(figsize=(10, 8))
-    
-    # Select the column to use (adjusted score if available, otherwise predicted score)
-    score_col = 'Adjusted_Score' if 'Adjusted_Score' in ranked_artists.columns else 'Predicted_Score'
-    rank_col = 'Adjusted_Rank' if 'Adjusted_Rank' in ranked_artists.columns else 'Rank'
-    
-    # Get top N artists
-    top_artists = ranked_artists.sort_values(rank_col).head(top_n)
-    
-    # Create horizontal bar chart
-    bars = plt.barh(
-        top_artists['Artist'], 
-        top_artists[score_col],
-        color=['#e63946' if in_playlist else '#457b9d' 
-               for in_playlist in top_artists.get('In_My_Playlist', [0] * len(top_artists))]
-    )
-    
-    # Add labels and title
-    plt.xlabel('Match Score')
-    plt.title(f'Top {top_n} Recommended Artists for Primavera Sound')
-    plt.gca().invert_yaxis()  # To have rank 1 at the top
-    
-    # Add a legend if we have the in-playlist information
-    if 'In_My_Playlist' in top_artists.columns:
-        plt.legend(
-            [plt.Rectangle((0, 0), 1, 1, color='#e63946'), 
-             plt.Rectangle((0, 0), 1, 1, color='#457b9d')],
-            ['In Your Playlist', 'New Discovery']
-        )
-    
-    plt.tight_layout()
+    fig = _top_artists_figure(ranked_artists, top_n)
     
     # Save to a BytesIO object
     img_bytes = BytesIO()
-    plt.savefig(img_bytes, format='png', dpi=300, bbox_inches='tight')
+    fig.savefig(img_bytes, format='png', dpi=300, bbox_inches='tight')
     img_bytes.seek(0)
     
     # Convert to base64
     img_base64 = base64.b64encode(img_bytes.read()).decode('utf-8')
-    plt.close()
     
     return f"data:image/png;base64,{img_base64}"
 
@@ -114,21 +94,21 @@ def plot_feature_importance(model_results, feature_names, output_dir="./results"
     }).sort_values('Importance', ascending=False)
     
     # Plot top 15 features
-    plt.figure(figsize=(10, 8))
-    plt.barh(feature_importance.head(15)['Feature'], feature_importance.head(15)['Importance'])
-    plt.xlabel('Importance')
-    plt.title('Top 15 Most Important Features (Random Forest)')
-    plt.gca().invert_yaxis()  # To have most important at the top
-    plt.tight_layout()
+    fig = Figure(figsize=(10, 8))
+    ax = fig.add_subplot()
+    ax.barh(feature_importance.head(15)['Feature'], feature_importance.head(15)['Importance'])
+    ax.set_xlabel('Importance')
+    ax.set_title('Top 15 Most Important Features (Random Forest)')
+    ax.invert_yaxis()  # To have most important at the top
+    fig.tight_layout()
     
     # Create output directory if it doesn't exist
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
     
     # Save figure
     output_path = os.path.join(output_dir, 'feature_importance.png')
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    fig.savefig(output_path, dpi=300, bbox_inches='tight')
     
     print(f"Feature importance chart saved to {output_path}")
     
-    return output_path
\ No newline at end of file
+    return output_path
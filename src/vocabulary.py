@@ -0,0 +1,155 @@
+import os
+import json
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+from src.utils import open_atomic
+
+
+def split_name_lists(series):
+    """
+    Split comma separated artist or genre strings into one entry per name.
+    
+    Strings containing ', ' are split on ', ', all others on ','. Empty strings
+    and missing values produce no entries.
+    
+    Returns:
+        Tuple of (row positions, stripped names) as parallel arrays
+    """
+    strings = pd.Series(series.astype(str).to_numpy())
+    lists = strings.str.split(', ', regex=False).where(
+        strings.str.contains(', ', regex=False),
+        strings.str.split(',', regex=False)
+    )
+    
+    exploded = lists.explode().str.strip()
+    valid = exploded.notna() & (exploded != '')
+    
+    # Missing values come through astype(str) as 'nan'
+    missing_rows = (strings == '') | (strings.str.lower() == 'nan')
+    valid &= ~missing_rows.to_numpy()[exploded.index.to_numpy()]
+    
+    return exploded.index.to_numpy()[valid.to_numpy()], exploded[valid].to_numpy(dtype=object)
+
+
+class StringIndex:
+    """Append-only mapping between names and stable int32 codes"""
+
+    def __init__(self, names=()):
+        self.names = list(names)
+        self.codes = {name: code for code, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, values):
+        """Return codes for the given names, assigning new codes to unseen names"""
+        factor_codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        
+        # Only touch the dictionary once per distinct name
+        table = np.empty(len(uniques), dtype=np.int32)
+        for i, name in enumerate(uniques):
+            code = self.codes.get(name)
+            if code is None:
+                code = len(self.names)
+                self.codes[name] = code
+                self.names.append(name)
+            table[i] = code
+        
+        return table[factor_codes] if len(factor_codes) else np.empty(0, dtype=np.int32)
+
+    def lookup(self, values):
+        """Return codes for the given names, or -1 for names not in the index"""
+        factor_codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        table = np.fromiter((self.codes.get(name, -1) for name in uniques), dtype=np.int32, count=len(uniques))
+        return table[factor_codes] if len(factor_codes) else np.empty(0, dtype=np.int32)
+
+    def decode(self, codes):
+        """Materialise names for an array of codes"""
+        return np.asarray(self.names, dtype=object)[np.asarray(codes, dtype=np.int64)]
+
+    def encode_lists(self, series):
+        """
+        Split and intern a column of comma separated names.
+        
+        Returns:
+            Tuple of (row positions, int32 codes) with one entry per name occurrence
+        """
+        row_ids, names = split_name_lists(series)
+        return row_ids, self.intern(names)
+
+
+class Vocabulary:
+    """
+    Shared artist and genre vocabularies.
+    
+    Artist and genre names are interned into integer codes once, so the pipeline
+    can filter, group and compare code arrays instead of strings.
+    """
+
+    def __init__(self, artists=(), genres=()):
+        self.artists = StringIndex(artists)
+        self.genres = StringIndex(genres)
+
+    def copy(self):
+        """Independent copy, so per-request names do not leak into a shared vocabulary"""
+        return Vocabulary(self.artists.names, self.genres.names)
+
+    def add_playlist(self, playlist_df):
+        """Intern all artists and genres of an Exportify playlist"""
+        self.artists.encode_lists(playlist_df['Artist Name(s)'])
+        if 'Genres' in playlist_df.columns:
+            self.genres.encode_lists(playlist_df['Genres'])
+        return self
+
+    def save(self, path):
+        """Write the vocabulary as JSON via a temporary file so readers never see a partial file"""
+        with open_atomic(path, 'w') as f:
+            json.dump({'artists': self.artists.names, 'genres': self.genres.names}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get('artists', []), data.get('genres', []))
+
+
+def get_vocabulary_path(lineup_path):
+    """Vocabulary file stored alongside a lineup CSV"""
+    return os.path.splitext(lineup_path)[0] + '.vocab.json'
+
+
+@lru_cache(maxsize=16)
+def _load_vocabulary(vocab_path, mtime):
+    return Vocabulary.load(vocab_path)
+
+
+def load_lineup_vocabulary(lineup_path, lineup_df=None):
+    """
+    Load the persisted vocabulary for a lineup, building it if missing or stale.
+    
+    Args:
+        lineup_path: Path to the lineup CSV
+        lineup_df: Already loaded lineup data (avoids reading the CSV again when rebuilding)
+    
+    Returns:
+        A private copy of the lineup vocabulary that callers may extend
+    """
+    vocab_path = get_vocabulary_path(lineup_path)
+    
+    if os.path.exists(vocab_path) and os.path.getmtime(vocab_path) >= os.path.getmtime(lineup_path):
+        return _load_vocabulary(vocab_path, os.path.getmtime(vocab_path)).copy()
+    
+    if lineup_df is None:
+        lineup_df = pd.read_csv(lineup_path)
+    
+    vocabulary = Vocabulary().add_playlist(lineup_df)
+    
+    try:
+        vocabulary.save(vocab_path)
+        print(f"Saved lineup vocabulary to {vocab_path}")
+    except OSError as e:
+        print(f"Warning: Could not save lineup vocabulary to {vocab_path}: {e}")
+    
+    return vocabulary
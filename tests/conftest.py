@@ -0,0 +1,19 @@
+import os
+import sys
+import importlib
+import pytest
+
+# Make the src package importable when running plain `pytest` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The web app, with its upload and result folders in a temporary directory"""
+    # The folders are placed in the working directory when the app is imported
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    try:
+        return importlib.import_module('app')
+    finally:
+        os.chdir(cwd)
@@ -0,0 +1,41 @@
+import os
+import uuid
+import pandas as pd
+import pytest
+
+from src.utils import save_score_cache, write_results
+
+
+@pytest.fixture
+def session_id(app_module):
+    """A session with results and cached scores for three artists from test_lineup"""
+    session_id = str(uuid.uuid4())
+    ranked_artists = pd.DataFrame({
+        'Rank': [1, 2, 3],
+        'Artist': ['A', 'B', 'C'],
+        'Predicted_Score': [0.9, 0.5, 0.1],
+        'In_My_Playlist': [0, 1, 0]
+    })
+    result_folder = os.path.join(app_module.RESULT_FOLDER, session_id)
+    os.makedirs(result_folder)
+    write_results(
+        ranked_artists, result_folder, output_format=app_module.RESULT_FORMAT, metadata={'lineup': 'test_lineup'}
+    )
+    save_score_cache(ranked_artists, output_dir=result_folder)
+    return session_id
+
+
+@pytest.mark.parametrize('top_k, status', [(1, 200), (500, 200), (0, 400), (-3, 400), (501, 400), ('x', 400)])
+def test_rerank_top_k_range(app_module, session_id, top_k, status):
+    client = app_module.app.test_client()
+    response = client.get('/api/rerank', query_string={'session_id': session_id, 'top_k': top_k})
+    assert response.status_code == status
+    if status == 200:
+        assert len(response.get_json()['artists']) == min(top_k, 3)
+
+
+def test_chart_payload_names_the_lineup(app_module, session_id):
+    client = app_module.app.test_client()
+    data = client.get(f'/api/sessions/{session_id}/chart', query_string={'top_n': 2}).get_json()
+    assert data['lineup'] == 'test_lineup'
+    assert data['artists'] == ['A', 'B']
@@ -0,0 +1,79 @@
+import os
+import re
+import json
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import pytest
+
+from src import modeling
+from src.lineups import LineupRegistry
+from src.loadtest import synthetic_playlist
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'primavera_25.csv')
+
+N_PLAYLISTS = 3
+N_THREADS = 8
+
+
+@pytest.fixture(scope='module')
+def lineup_dir(tmp_path_factory):
+    """A small synthetic lineup, registered as test_lineup"""
+    data_dir = tmp_path_factory.mktemp('lineups')
+    template = pd.read_csv(TEMPLATE_PATH)
+    synthetic_playlist(template, 1500, n_artists=80, seed=100).to_csv(data_dir / 'test_lineup.csv', index=False)
+    return str(data_dir)
+
+
+@pytest.fixture(scope='module')
+def playlists(tmp_path_factory, lineup_dir):
+    """Small synthetic personal playlists sharing artists with the lineup"""
+    playlist_dir = tmp_path_factory.mktemp('playlists')
+    lineup = pd.read_csv(os.path.join(lineup_dir, 'test_lineup.csv'))
+    paths = []
+    for i in range(N_PLAYLISTS):
+        path = str(playlist_dir / f'playlist_{i}.csv')
+        synthetic_playlist(lineup, 600, n_artists=120, lineup_share=0.5, seed=i).to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def _run(app_module, playlist_path, result_folder):
+    json_path, _ = app_module.run_recommendation_pipeline(playlist_path, result_folder, lineup_id='test_lineup')
+    with open(json_path, 'r') as f:
+        artists = json.load(f)['artists']
+    with open(os.path.join(result_folder, app_module.PIPELINE_LOG_FILENAME), 'r') as f:
+        log = f.read()
+    return artists, log
+
+
+def test_parallel_pipelines_match_serial_runs(app_module, lineup_dir, playlists, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, 'lineup_registry', LineupRegistry(lineup_dir, default_id='test_lineup'))
+    # Keep the measured fits out of the planner's timings file, so every run plans the same tier
+    monkeypatch.setattr(modeling, 'record_fit_timings', lambda fit_timings: None)
+    
+    serial = [
+        _run(app_module, playlist_path, str(tmp_path / f'serial_{i}'))[0]
+        for i, playlist_path in enumerate(playlists)
+    ]
+    
+    # Every thread uploads its own copy, so its log can be told apart by the playlist path
+    jobs = []
+    for i in range(N_THREADS):
+        playlist_path = str(tmp_path / f'upload_{i}.csv')
+        shutil.copy(playlists[i % N_PLAYLISTS], playlist_path)
+        jobs.append((i % N_PLAYLISTS, playlist_path, str(tmp_path / f'parallel_{i}')))
+    
+    with ThreadPoolExecutor(max_workers=N_THREADS) as executor:
+        futures = [
+            executor.submit(_run, app_module, playlist_path, result_folder)
+            for _, playlist_path, result_folder in jobs
+        ]
+        results = [future.result() for future in futures]
+    
+    for (playlist_index, playlist_path, _), (artists, log) in zip(jobs, results):
+        assert artists == serial[playlist_index]
+        
+        # The log holds exactly one pipeline run: this thread's
+        assert re.findall(r'Loading personal playlist from: (.*)', log) == [playlist_path]
+        assert log.count('----- Predicting and Ranking Artists -----') == 1
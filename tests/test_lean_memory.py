@@ -0,0 +1,51 @@
+import os
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import modeling
+from src.data_processing import analyze_genres, preprocess_playlist_data
+from src.loadtest import synthetic_playlist
+
+LINEUP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'primavera_25.csv')
+
+# Peak traced memory allowed for preprocessing and training on the playlist below
+# in float32 (about 52 MB when the budget was set, against 64 MB in float64)
+LEAN_MEMORY_BUDGET_MB = 80
+
+# Linear models only, so the test stays fast while still covering the CV and
+# model-input conversion path
+TEST_PLAN = {'tier': 'reduced', 'models': ['Ridge Regression', 'Lasso Regression'], 'cv_folds': 3}
+
+
+@pytest.fixture(scope='module')
+def large_playlist():
+    lineup = pd.read_csv(LINEUP_PATH)
+    playlist = synthetic_playlist(lineup, 100000, n_artists=5000, seed=0)
+    return playlist, analyze_genres(playlist, lineup)
+
+
+def _peak_mb(playlist, shared_genres, feature_dtype):
+    """Peak traced memory in MB of preprocessing plus training"""
+    tracemalloc.start()
+    try:
+        train_data = preprocess_playlist_data(
+            playlist, is_training=True, shared_genres=shared_genres, feature_dtype=feature_dtype
+        )
+        modeling.train_and_evaluate_models(train_data, plan=TEST_PLAN, feature_dtype=feature_dtype)
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def test_lean_memory_stays_within_budget(large_playlist, monkeypatch):
+    # Keep the measured fits out of the planner's timings file
+    monkeypatch.setattr(modeling, 'record_fit_timings', lambda fit_timings: None)
+    playlist, shared_genres = large_playlist
+    
+    lean_peak = _peak_mb(playlist, shared_genres, np.float32)
+    default_peak = _peak_mb(playlist, shared_genres, None)
+    
+    assert lean_peak < LEAN_MEMORY_BUDGET_MB, f"float32 peak {lean_peak:.1f} MB exceeds {LEAN_MEMORY_BUDGET_MB} MB"
+    assert lean_peak < default_peak, f"float32 peak {lean_peak:.1f} MB is not below float64 {default_peak:.1f} MB"
@@ -0,0 +1,84 @@
+import os
+import shutil
+import pandas as pd
+import pytest
+
+from src.data_processing import analyze_genres, preprocess_playlist_data
+from src.genre_features import make_genre_featurizer
+from src.lineup_refresh import save_model_bundle, refresh_lineup
+from src.loadtest import synthetic_playlist
+from src.modeling import train_and_evaluate_models, predict_and_rank_artists, analyze_artist_overlap
+from src.utils import save_results, save_score_cache
+from src.vocabulary import Vocabulary
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'primavera_25.csv')
+
+MIN_ARTIST_FREQUENCY = 5
+TEST_PLAN = {'tier': 'reduced', 'models': ['Ridge Regression'], 'cv_folds': 3}
+
+
+def _lineup_artists(lineup):
+    """Artists a full rerun would rank for a lineup"""
+    features = preprocess_playlist_data(
+        lineup, is_training=False, min_artist_frequency=MIN_ARTIST_FREQUENCY, vocabulary=Vocabulary()
+    )
+    return set(features['Artist'])
+
+
+@pytest.fixture
+def cached_result(tmp_path):
+    """A lineup CSV and a result folder with a cached model for it"""
+    lineup_path = str(tmp_path / 'lineup.csv')
+    synthetic_playlist(pd.read_csv(TEMPLATE_PATH), 1500, n_artists=80, seed=100).to_csv(lineup_path, index=False)
+    # Read back, so the lineup signature matches the one refresh_lineup computes from the file
+    lineup = pd.read_csv(lineup_path)
+    my_playlist = synthetic_playlist(lineup, 600, n_artists=120, lineup_share=0.5, seed=0)
+    
+    vocabulary = Vocabulary()
+    genre_featurizer = make_genre_featurizer('top', shared_genres=analyze_genres(my_playlist, lineup, vocabulary=vocabulary))
+    train_data = preprocess_playlist_data(my_playlist, vocabulary=vocabulary, genre_featurizer=genre_featurizer)
+    test_data = preprocess_playlist_data(
+        lineup, is_training=False, min_artist_frequency=MIN_ARTIST_FREQUENCY,
+        vocabulary=vocabulary, genre_featurizer=genre_featurizer
+    )
+    model_results = train_and_evaluate_models(train_data, plan=TEST_PLAN)
+    ranked_artists, _ = predict_and_rank_artists(test_data, model_results)
+    ranked_artists = analyze_artist_overlap(ranked_artists, my_playlist, lineup, vocabulary=vocabulary)
+    
+    result_folder = str(tmp_path / 'results')
+    save_results(ranked_artists, output_dir=result_folder)
+    save_score_cache(ranked_artists, output_dir=result_folder)
+    save_model_bundle(
+        result_folder, model_results, train_data.drop(['Artist', 'Track_Count'], axis=1).columns,
+        genre_featurizer, my_playlist, lineup, min_artist_frequency=MIN_ARTIST_FREQUENCY
+    )
+    return lineup, lineup_path, result_folder
+
+
+def _added_tracks(lineup, artist, n_tracks, seed):
+    return lineup.sample(n_tracks, random_state=seed).assign(**{'Artist Name(s)': artist})
+
+
+@pytest.mark.parametrize('added', [
+    {'Brand New Act': 2},
+    {'Brand New Act': 2, 'New Headliner': MIN_ARTIST_FREQUENCY}
+])
+def test_refresh_drops_infrequent_new_artists(cached_result, tmp_path, added):
+    lineup, lineup_path, result_folder = cached_result
+    
+    # Append the new tracks to a copy of the CSV, so the other artists' rows stay byte-identical
+    new_lineup_path = str(tmp_path / 'new_lineup.csv')
+    shutil.copy(lineup_path, new_lineup_path)
+    for seed, (artist, n_tracks) in enumerate(added.items()):
+        _added_tracks(lineup, artist, n_tracks, seed).to_csv(new_lineup_path, mode='a', header=False, index=False)
+    new_lineup = pd.read_csv(new_lineup_path)
+    
+    report = refresh_lineup(lineup_path, new_lineup_path, results_root=result_folder, max_workers=1)
+    assert report['diff'] == {'added': sorted(added), 'removed': [], 'changed': []}
+    assert [status['status'] for status in report['results']] == ['refreshed']
+    
+    # The refreshed ranking holds exactly the artists a full rerun would rank
+    refreshed = pd.read_csv(os.path.join(result_folder, 'ranked_artists.csv'))
+    assert 'Brand New Act' not in set(refreshed['Artist'])
+    assert set(refreshed['Artist']) == _lineup_artists(new_lineup)
+    assert len(refreshed) == len(_lineup_artists(lineup)) + (len(added) - 1)
@@ -0,0 +1,90 @@
+import os
+import json
+import stat
+import pandas as pd
+import pytest
+
+from src.utils import RESULT_FORMATS, RESULT_METADATA_FILENAME, check_result_format, save_results, write_results
+
+
+def _parquet_engine_available():
+    try:
+        check_result_format('parquet')
+    except ImportError:
+        return False
+    return True
+
+
+FORMATS = [
+    pytest.param(
+        output_format,
+        marks=pytest.mark.skipif(
+            output_format == 'parquet' and not _parquet_engine_available(), reason='no Parquet engine installed'
+        )
+    )
+    for output_format in RESULT_FORMATS
+]
+
+
+@pytest.fixture
+def ranked_artists():
+    return pd.DataFrame({
+        'Rank': [1, 2, 3],
+        'Artist': ['Clairo', 'Beach House', 'Fontaines D.C.'],
+        'Predicted_Score': [11.5, 7.25, 0.1 + 0.2],
+        'In_My_Playlist': [1, 0, 0]
+    })
+
+
+@pytest.fixture
+def umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def _read_artists(path, output_format):
+    if output_format == 'ndjson':
+        with open(path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+    if output_format == 'parquet':
+        return pd.read_parquet(path).to_dict(orient='records')
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)['artists']
+
+
+@pytest.mark.parametrize('output_format', FORMATS)
+def test_results_round_trip_with_default_permissions(tmp_path, ranked_artists, umask, output_format):
+    path = write_results(ranked_artists, str(tmp_path), output_format=output_format, metadata={'lineup': 'test'})
+    
+    assert os.path.basename(path) == RESULT_FORMATS[output_format][0]
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o666 & ~umask
+    # The streamed JSON writers keep 15 significant digits
+    expected = ranked_artists.to_dict(orient='records')
+    for record in expected:
+        record['Predicted_Score'] = pytest.approx(record['Predicted_Score'], rel=1e-14)
+    assert _read_artists(path, output_format) == expected
+    
+    if output_format in ('ndjson', 'parquet'):
+        metadata_path = os.path.join(str(tmp_path), RESULT_METADATA_FILENAME)
+        assert stat.S_IMODE(os.stat(metadata_path).st_mode) == 0o666 & ~umask
+        with open(metadata_path, 'r', encoding='utf-8') as f:
+            assert json.load(f)['lineup'] == 'test'
+    
+    # No temporary files are left behind
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.tmp')]
+
+
+def test_rewrite_keeps_existing_permissions(tmp_path, ranked_artists):
+    csv_path, results_path = save_results(ranked_artists, str(tmp_path))
+    os.chmod(results_path, 0o640)
+    
+    save_results(ranked_artists, str(tmp_path))
+    
+    assert stat.S_IMODE(os.stat(results_path).st_mode) == 0o640
+
+
+def test_unknown_format_is_rejected(tmp_path, ranked_artists):
+    with pytest.raises(ValueError):
+        write_results(ranked_artists, str(tmp_path), output_format='xml')
+    assert os.listdir(str(tmp_path)) == []
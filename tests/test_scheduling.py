@@ -0,0 +1,102 @@
+import itertools
+import random
+import pandas as pd
+import pytest
+
+from src.scheduling import _best_plans, load_timetable, optimize_festival_schedule
+
+
+def _timetable(rows):
+    return load_timetable(pd.DataFrame(rows, columns=['Artist', 'Stage', 'Day', 'Start', 'End']))
+
+
+def _plans(timetable, scores, walking_times=None, k=1, default_transfer=0):
+    ranked_artists = pd.DataFrame({'Artist': list(scores), 'Predicted_Score': list(scores.values())})
+    schedule = optimize_festival_schedule(
+        timetable, ranked_artists, walking_times=walking_times, k=k, default_transfer=default_transfer
+    )
+    return [
+        (plan_sets['Total_Score'].iloc[0], plan_sets['Artist'].tolist())
+        for _, plan_sets in schedule.groupby('Plan')
+    ]
+
+
+def test_alternatives_are_maximal_plans():
+    timetable = _timetable([
+        ('A', 'S1', 'Fri', '12:00', '13:00'),
+        ('B', 'S1', 'Fri', '13:00', '14:00'),
+        ('C', 'S2', 'Fri', '12:30', '13:30')
+    ])
+    
+    # {A}, {B} and {} are the best plan with sets left out, not alternatives
+    assert _plans(timetable, {'A': 5, 'B': 4, 'C': 1}, k=3) == [(9, ['A', 'B']), (1, ['C'])]
+
+
+def test_walking_time_between_stages():
+    timetable = _timetable([
+        ('A', 'S1', 'Fri', '20:00', '21:00'),
+        ('B', 'S2', 'Fri', '21:10', '22:00'),
+        ('C', 'S1', 'Fri', '21:15', '22:00')
+    ])
+    scores = {'A': 3, 'B': 2, 'C': 1}
+    
+    assert _plans(timetable, scores, walking_times={('S1', 'S2'): 5}) == [(5, ['A', 'B'])]
+    # Too far to make B after A: the best plans now switch to C or skip A
+    assert _plans(timetable, scores, walking_times={('S1', 'S2'): 15}, k=3) == [(4, ['A', 'C']), (2, ['B'])]
+    # Stages missing from the walking times use default_transfer
+    assert _plans(timetable, scores, default_transfer=15) == [(4, ['A', 'C'])]
+
+
+def _compatible(starts, ends, stages, walking_times, default_transfer, i, j):
+    if stages[i] == stages[j]:
+        transfer = walking_times.get((stages[i], stages[j]), 0)
+    else:
+        transfer = walking_times.get((stages[i], stages[j]), default_transfer)
+    return ends[i] + transfer <= starts[j]
+
+
+def _brute_force_plans(starts, ends, stages, weights, walking_times, default_transfer):
+    """Scores of every maximal plan, found by trying all subsets of sets"""
+    def compatible(i, j):
+        return _compatible(starts, ends, stages, walking_times, default_transfer, i, j)
+    
+    n = len(starts)
+    by_end = sorted(range(n), key=lambda i: ends[i])
+    plans = []
+    for size in range(1, n + 1):
+        for chain in itertools.combinations(by_end, size):
+            if not all(compatible(a, b) for a, b in zip(chain, chain[1:])):
+                continue
+            
+            # Maximal: no other set can be inserted before, between or after the sets
+            bounds = [None, *chain, None]
+            insertable = any(
+                (prev is None or compatible(prev, x)) and (nxt is None or compatible(x, nxt))
+                for x in range(n) if x not in chain
+                for prev, nxt in zip(bounds, bounds[1:])
+            )
+            if not insertable:
+                plans.append((sum(weights[i] for i in chain), list(chain)))
+    return sorted(plans, key=lambda plan: -plan[0])
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_k_best_plans_match_brute_force(seed):
+    rng = random.Random(seed)
+    stage_names = ['S1', 'S2', 'S3']
+    n = 9
+    starts = [rng.randrange(0, 300, 5) for _ in range(n)]
+    ends = [start + rng.randrange(20, 90, 5) for start in starts]
+    stages = [rng.choice(stage_names) for _ in range(n)]
+    weights = [rng.random() for _ in range(n)]
+    walking_times = {
+        (a, b): rng.randrange(0, 20, 5) for a in stage_names for b in stage_names if a != b and rng.random() < 0.7
+    }
+    default_transfer = 10
+    k = 6
+    
+    expected = _brute_force_plans(starts, ends, stages, weights, walking_times, default_transfer)[:k]
+    plans = _best_plans(starts, ends, stages, weights, walking_times, default_transfer, k)
+    
+    assert [value for value, _ in plans] == pytest.approx([value for value, _ in expected])
+    assert [chain for _, chain in plans] == [chain for _, chain in expected]
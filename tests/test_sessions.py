@@ -0,0 +1,62 @@
+import os
+import time
+import uuid
+import pytest
+
+from src import janitor as janitor_module
+from src.janitor import Janitor
+
+
+def test_import_does_not_start_janitor(app_module):
+    assert not app_module.janitor.is_running
+
+
+@pytest.mark.parametrize('route, session_key, filename', [
+    ('/results', 'json_result_path', 'ranked_artists.json'),
+    ('/download', 'html_result_path', 'recommendations.html')
+])
+def test_expired_session_redirects_to_index(app_module, route, session_key, filename):
+    session_id = str(uuid.uuid4())
+    deleted_path = os.path.join(app_module.RESULT_FOLDER, session_id, filename)
+    
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['session_id'] = session_id
+        session[session_key] = deleted_path
+    
+    response = client.get(route)
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/')
+    with client.session_transaction() as session:
+        assert any('expired' in message for _, message in session['_flashes'])
+
+
+def _make_sessions(root, n_sessions, last_used):
+    for _ in range(n_sessions):
+        folder = root / str(uuid.uuid4())
+        folder.mkdir()
+        (folder / 'ranked_artists.json').write_bytes(b'x' * 1000)
+        os.utime(folder, (last_used, last_used))
+
+
+def test_ttl_only_janitor_measures_deleted_sessions_only(tmp_path, monkeypatch):
+    now = time.time()
+    _make_sessions(tmp_path, 2, now - 7200)
+    _make_sessions(tmp_path, 3, now - 1200)
+    
+    measured = []
+    directory_size = janitor_module.directory_size
+    monkeypatch.setattr(janitor_module, 'directory_size', lambda path: measured.append(path) or directory_size(path))
+    
+    report = Janitor([str(tmp_path)], ttl_seconds=3600).run_once(now=now)
+    assert report['sessions_deleted'] == 2
+    assert report['bytes_reclaimed'] == 2000
+    assert report['bytes_in_use'] is None
+    assert len(measured) == 2
+    
+    # With a quota every session is measured
+    measured.clear()
+    report = Janitor([str(tmp_path)], ttl_seconds=3600, max_bytes=2500).run_once(now=now)
+    assert len(measured) == 3
+    assert report['sessions_deleted'] == 1
+    assert report['bytes_in_use'] == 2000